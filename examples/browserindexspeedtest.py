@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from __future__ import division
+#
+# Copyright (c) 2000-2006 Baylor College of Medicine
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston MA  2111-1307 USA
+#
+#
+
+
+# browserindexspeedtest.py
+# Measures how long the file browser takes to fill in the details (type, dimensions, image count) for every file in a
+# directory, using the background indexer in embrowser.py. Each test runs in its own child process, so the in-memory
+# cache from one run doesn't affect the next. "cold" runs start without a .browsercache.sqlite, "warm" runs reuse it.
+
+from builtins import range
+from EMAN2 import *
+import sys
+import os
+import time
+import subprocess
+
+def main():
+
+	usage="""browserindexspeedtest.py [options]
+
+Writes a directory of small test image stacks (or uses an existing directory with --path), then indexes it headless with
+the file browser indexer, printing files/second for a cold and warm cache at each thread count."""
+	parser = EMArgumentParser(usage=usage,version=EMANVERSION)
+	parser.add_argument("--n", type=int,help="Number of test files to create, default=5000", default=5000)
+	parser.add_argument("--path", type=str,help="Directory to index. Test files are only created if it doesn't exist, default=browsertest", default="browsertest")
+	parser.add_argument("--threads", type=str,help="Comma separated list of thread counts to test, default=1,4,8", default="1,4,8")
+	parser.add_argument("--child", type=int,help=None, default=0)
+
+	(options, args) = parser.parse_args()
+
+	cachefile=os.path.join(options.path,".browsercache.sqlite")
+
+	# child mode, index the directory once and report the time
+	if options.child>0 :
+		from eman2_gui.embrowser import index_directory
+		t0=time.time()
+		entries,indexer=index_directory(options.path,options.child)
+		print(time.time()-t0,len(entries),indexer.ncached)
+		return
+
+	if not os.path.exists(options.path) :
+		print("Writing {} test stacks in {}".format(options.n,options.path))
+		os.mkdir(options.path)
+		a=test_image(1,size=(64,64))
+		for i in range(options.n):
+			for j in range(i%5+1) : a.write_image("{}/stack_{:05d}.hdf".format(options.path,i),j)
+
+	print("%8s %6s %10s %10s %12s"%("threads","cache","time (s)","files","files/s"))
+	for threads in options.threads.split(","):
+		for cache in ("cold","warm"):
+			if cache=="cold" and os.path.exists(cachefile) : os.unlink(cachefile)
+			out=subprocess.check_output([sys.executable,sys.argv[0],"--child",threads,"--path",options.path]).decode("utf-8")
+			t,n,ncached=out.split()[-3:]
+			t=float(t)
+			print("%8s %6s %10.2f %10s %12.1f"%(threads,cache,t,n,int(n)/t))
+			sys.stdout.flush()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from __future__ import division
+#
+# Copyright (c) 2000-2006 Baylor College of Medicine
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  2111-1307 USA
+#
+#
+
+# mpispeedtest.py
+# Measures the per-task dispatch overhead of the EMAN2 parallelism system using EMTestTask, which does
+# nothing but sleep. With perfect dispatch, N tasks of length t on R worker ranks take N*t/R seconds.
+# Anything beyond that is overhead, which is reported per task as a function of rank count.
+
+from builtins import range
+from EMAN2 import *
+from EMAN2PAR import EMTaskCustomer,EMTestTask
+import sys
+import time
+
+def main():
+
+	usage="""mpispeedtest.py [options]
+
+Runs a batch of short EMTestTasks through EMTaskCustomer for each requested number of MPI ranks (or any other
+--parallel specification) and prints the wall time and mean dispatch overhead per task. Rank 0 does no computation,
+so mpi:N has N-1 workers."""
+	parser = EMArgumentParser(usage=usage,version=EMANVERSION)
+	parser.add_argument("--ranks", type=str,help="Comma separated list of MPI rank counts to test, default=4,8,16,32", default="4,8,16,32")
+	parser.add_argument("--parallel", type=str,help="Comma separated list of parallelism specifications to test instead of --ranks, eg - thread:4,pool:4",default=None)
+	parser.add_argument("--ntasks", type=int,help="Number of tasks per worker, default=20", default=20)
+	parser.add_argument("--tasktime", type=float,help="Duration of each task in seconds, default=0.05", default=0.05)
+	parser.add_argument("--scratch", type=str,help="Scratch directory for the parallelism system, default=/tmp", default="/tmp")
+	parser.add_argument("--ppid", type=int, help="Set the PID of the parent process, used for cross platform PPID",default=-1)
+
+	(options, args) = parser.parse_args()
+
+	if options.parallel!=None : pars=options.parallel.split(",")
+	else : pars=["mpi:%d:%s"%(int(r),options.scratch) for r in options.ranks.split(",")]
+
+	print("%24s %8s %8s %10s %10s %14s"%("parallel","workers","tasks","ideal (s)","wall (s)","overhead/task"))
+	for par in pars:
+		etc=EMTaskCustomer(par)
+		nwork=etc.cpu_est()
+		ntasks=nwork*options.ntasks
+
+		t0=time.time()
+		tids=etc.send_tasks([EMTestTask(options={"sleep":options.tasktime}) for i in range(ntasks)])
+		while len(tids)>0 :
+			st=etc.check_task(tids)
+			for i in range(len(tids)-1,-1,-1):
+				if st[i]==100 :
+					etc.get_results(tids[i])
+					tids.pop(i)
+			time.sleep(0.01)
+		wall=time.time()-t0
+
+		ideal=options.ntasks*options.tasktime
+		print("%24s %8d %8d %10.2f %10.2f %12.1f ms"%(par,nwork,ntasks,ideal,wall,1000.0*(wall-ideal)/options.ntasks))
+		sys.stdout.flush()
+
+		del etc		# shuts down the parallelism system before the next test
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from __future__ import division
+#
+# Copyright (c) 2000-2006 Baylor College of Medicine
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston MA  2111-1307 USA
+#
+#
+
+# proc2dparspeedtest.py
+# Compares the streaming read/process/write pipeline in e2proc2dpar.py with the older scheme, where each thread
+# processed a chunk of up to 100 images, held them all in memory, and the main thread wrote them in completion order.
+# Each method runs in its own child process so the peak RSS of each can be measured independently.
+
+from builtins import range
+from EMAN2 import *
+import sys
+import os
+import time
+import threading
+import resource
+import subprocess
+
+def legacy(infile,outfile,threads,process):
+	"""The e2proc2dpar.py implementation prior to the streaming pipeline"""
+	import queue
+	import pyemtbx.options
+	from e2proc2dpar import procfn,writeimage
+
+	class Opt(object): pass
+	options=Opt()
+	options.process=[process]
+	options.verbose=0
+	options.outtype=None
+	options.outmode="float"
+	options.fixintscaling=None
+	optionlist=pyemtbx.options.get_optionlist(["--process",process])
+
+	def chunkfn(jsd,n0,n1):
+		imgs=procfn(options,optionlist,n0,[EMData(infile,n) for n in range(n0,n1)])
+		jsd.put(dict(zip(range(n0,n1),imgs)))
+
+	N=EMUtil.get_image_count(infile)
+	npt=max(min(100,N//threads+1),1)
+	jsd=queue.Queue(0)
+	thrds=[threading.Thread(target=chunkfn,args=(jsd,i*npt,min(i*npt+npt,N))) for i in range(N//npt+1)]
+	thrtolaunch=0
+	while thrtolaunch<len(thrds) or threading.active_count()>1:
+		if thrtolaunch<len(thrds):
+			while (threading.active_count()>=threads+1) : time.sleep(0.1)
+			thrds[thrtolaunch].start()
+			thrtolaunch+=1
+		else: time.sleep(0.1)
+
+		while not jsd.empty():
+			rd=jsd.get()
+			for k in list(rd.keys()): writeimage(rd[k],outfile,k,options)
+
+def main():
+
+	usage="""proc2dparspeedtest.py [options]
+
+Writes a test stack, then processes it with both the current e2proc2dpar.py pipeline and the older chunked
+implementation, printing images/second and peak resident memory for each."""
+	parser = EMArgumentParser(usage=usage,version=EMANVERSION)
+	parser.add_argument("--n", type=int,help="Number of images in the test stack, default=20000", default=20000)
+	parser.add_argument("--size", type=int,help="Image size, default=256", default=256)
+	parser.add_argument("--threads", type=str,help="Comma separated list of thread counts to test, default=1,4,8", default="1,4,8")
+	parser.add_argument("--process", type=str,help="Processor to apply, default=filter.lowpass.gauss:cutoff_abs=0.2", default="filter.lowpass.gauss:cutoff_abs=0.2")
+	parser.add_argument("--path", type=str,help="Directory for the test files, default=.", default=".")
+	parser.add_argument("--child", type=str,help=None, default=None)
+
+	(options, args) = parser.parse_args()
+
+	infile="{}/speedtest_in.hdf".format(options.path)
+	outfile="{}/speedtest_out.hdf".format(options.path)
+
+	# child mode, run one method and report the time and peak RSS
+	if options.child!=None :
+		method,threads=options.child.split(",")
+		t0=time.time()
+		if method=="legacy" : legacy(infile,outfile,int(threads),options.process)
+		else :
+			import e2proc2dpar
+			sys.argv=["e2proc2dpar.py",infile,outfile,"--process",options.process,"--threads",threads,"--verbose","0"]
+			e2proc2dpar.main()
+		print(time.time()-t0,resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+		return
+
+	if not os.path.exists(infile) or EMUtil.get_image_count(infile)!=options.n :
+		print("Writing {} {}x{} test images".format(options.n,options.size,options.size))
+		if os.path.exists(infile) : os.unlink(infile)
+		for i in range(options.n):
+			a=test_image(1,size=(options.size,options.size))
+			a.process_inplace("math.addnoise",{"noise":1.0})
+			a.write_image(infile,i)
+
+	print("%10s %8s %10s %12s %14s"%("method","threads","time (s)","images/s","peak RSS (MB)"))
+	for threads in options.threads.split(","):
+		for method in ("legacy","pipeline"):
+			if os.path.exists(outfile) : os.unlink(outfile)
+			out=subprocess.check_output([sys.executable,sys.argv[0],"--child={},{}".format(method,threads),"--path",options.path,"--process",options.process]).decode("utf-8")
+			t,rss=out.split()[-2:]
+			t=float(t)
+			print("%10s %8s %10.2f %12.1f %14.1f"%(method,threads,t,options.n/t,int(rss)/1024.0))
+			sys.stdout.flush()
+
+	os.unlink(outfile)
+
+if __name__ == "__main__":
+	main()
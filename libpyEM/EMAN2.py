@@ -46,6 +46,7 @@ import shelve
 import re
 import pickle
 import zlib
+import hashlib
 import socket
 import subprocess
 from EMAN2_cppwrap import *
@@ -91,7 +92,9 @@ os.environ["EMAN2DIR"] = os.path.abspath(os.path.join(this_file_dirname, eman2di
 #try:
 #import EMAN2db
 from EMAN2db import EMAN2DB,db_open_dict,db_close_dict,db_remove_dict,db_list_dicts,db_check_dict,db_parse_path,db_convert_path,db_get_image_info,e2gethome, e2getcwd
-from EMAN2jsondb import JSDict,js_open_dict,js_close_dict,js_remove_dict,js_list_dicts,js_check_dict,js_one_key
+from EMAN2jsondb import JSDict,js_open_dict,js_close_dict,js_remove_dict,js_list_dicts,js_check_dict,js_one_key,js_cache_budget,js_cache_stats
+from EMAN2ptcldb import PtclStore,PtclDictView,ptcl_open_dict,ptcl_open_store,ptcl_convert_json,ptcl_key
+from EMAN2jobs import EMExecutor
 #except:
 #	HOMEDB=None
 
@@ -1950,12 +1953,16 @@ The file begins with
 # Line length (including \n)
 number<\t>filename<\t>comment
 ...
+
+For bulk access, read_many(), write_many(), read_images() and as_array() operate on many records at once through
+a memory map of the file, rather than a seek and readline per record.
 """
 	def __init__(self,path,ifexists=False):
 		"""Initialize the object using the .lst file in 'path'. If 'ifexists' is set, an exception will be raised
 if the lst file does not exist."""
 
 		self.path=path
+		self.mm=None						# memory map of the file, created as needed by the bulk access methods
 
 		try: self.ptr=open(path,"rb+")		# file exists
 		except:
@@ -2028,6 +2035,7 @@ if the lst file does not exist."""
 	def close(self):
 		"""Once you call this, you should not try to access this object any more"""
 		if self.ptr!=None :
+			self.mm=None
 			self.normalize()
 			self.ptr=None
 
@@ -2049,10 +2057,37 @@ comment : optional comment string"""
 		if n<0 or n>=self.n :
 			self.ptr.seek(0,os.SEEK_END)		# append
 			self.n+=1
+			self.mm=None						# the file is longer than the map now
 		else : self.ptr.seek(self.seekbase+self.linelen*n)		# otherwise find the correct location
 
 		self.ptr.write(outln)
 
+	def write_many(self,records,n=-1):
+		"""Writes a sequence of (nextfile,extfile) or (nextfile,extfile,comment) records with a single write. If n is
+-1 or >= the current file length, the records are appended, otherwise they overwrite the records starting at n. The file
+is rewritten at most once, if any record is longer than the current line length."""
+
+		outlns=[]
+		for r in records:
+			if len(r)<3 or r[2]==None : outlns.append("{}\t{}".format(r[0],r[1]))
+			else : outlns.append("{}\t{}\t{}".format(r[0],r[1],r[2]))
+		if len(outlns)==0 : return
+
+		maxlen=max([len(l) for l in outlns])
+		if maxlen+1>self.linelen : self.rewrite(maxlen)
+
+		fmtstr="{{:<{}}}\n".format(self.linelen-1)	# string for formatting
+
+		if n<0 or n>=self.n :
+			self.ptr.seek(0,os.SEEK_END)		# append
+			self.n+=len(outlns)
+		else :
+			self.ptr.seek(self.seekbase+self.linelen*n)
+			self.n=max(self.n,n+len(outlns))
+		self.mm=None
+
+		self.ptr.write("".join([fmtstr.format(l) for l in outlns]))
+
 	def read(self,n):
 		"""Reads the nth record in the file. Note that this does not read the referenced image, which can be
 performed with read_image either here or in the EMData class. Returns a tuple (n extfile,extfile,comment)"""
@@ -2064,6 +2099,70 @@ performed with read_image either here or in the EMData class. Returns a tuple (n
 
 		return ln
 
+	def lines(self,indices=None):
+		"""Returns a NumPy array of fixed length byte strings, one per record, for the requested record numbers or all
+records. The array is a view on a memory map of the file when indices is None, so no data is copied."""
+		import mmap
+		import numpy as np
+
+		self.ptr.flush()
+		if self.mm==None or len(self.mm)<self.seekbase+self.linelen*self.n :
+			self.mm=mmap.mmap(self.ptr.fileno(),0,access=mmap.ACCESS_READ)
+
+		ret=np.frombuffer(self.mm,dtype="S{}".format(self.linelen),count=self.n,offset=self.seekbase)
+		if indices is None : return ret
+
+		indices=np.asarray(indices,dtype=np.int64)
+		if len(indices)>0 and (indices.max()>=self.n or indices.min()<0) :
+			raise Exception("Attempt to read records beyond the end of #LSX {} with {} records".format(self.path,self.n))
+		return ret[indices]
+
+	def as_array(self,indices=None):
+		"""Returns the requested records (default all) as a NumPy structured array with fields 'n' (the image number in
+the referenced file), 'file' and 'comment' (as byte strings). Parsing is vectorized over a memory map of the file."""
+		import numpy as np
+
+		lns=np.char.strip(self.lines(indices))
+		num=np.char.partition(lns,b"\t")
+		rest=np.char.partition(num[...,2],b"\t")
+
+		ret=np.empty(len(lns),dtype=[("n",np.int64),("file",rest.dtype),("comment",rest.dtype)])
+		if len(lns)==0 : return ret
+		ret["n"]=num[...,0].astype(np.int64)
+		ret["file"]=rest[...,0]
+		ret["comment"]=rest[...,2]
+		return ret
+
+	def read_many(self,indices):
+		"""Reads many records at once. Returns a list of [nextfile,extfile,comment] lists, as read() would for each index."""
+
+		ret=[]
+		for n,fsp,cmt in self.as_array(indices).tolist():
+			if not isinstance(fsp,str) : fsp=fsp.decode("utf-8")
+			if len(cmt)==0 : cmt=None
+			elif not isinstance(cmt,str) : cmt=cmt.decode("utf-8")
+			ret.append([n,fsp,cmt])
+
+		return ret
+
+	def read_images(self,indices,header_only=False):
+		"""Reads the images referenced by a list of records. Records are grouped by the referenced file, so each file is
+opened only once, but the images are returned in the order of indices."""
+
+		recs=self.read_many(indices)
+
+		byfile={}
+		for i,r in enumerate(recs): byfile.setdefault(r[1],[]).append(i)
+
+		ret=[None]*len(recs)
+		for fsp,idx in byfile.items():
+			imgs=EMData.read_images(fsp,[recs[i][0] for i in idx],header_only)
+			for i,im in zip(idx,imgs):
+				if recs[i][2]!=None and len(recs[i][2])>0 : im["lst_comment"]=recs[i][2]
+				ret[i]=im
+
+		return ret
+
 	def read_image(self,n):
 		"""This reads the image referenced by the nth record in the #LSX file. The same task can be accomplished with EMData.read_image,
 but this method prevents multiple open/close operations on the #LSX file."""
@@ -2079,7 +2178,23 @@ but this method prevents multiple open/close operations on the #LSX file."""
 
 	def normalize(self):
 		"""This will read the entire file and insure that the line-length parameter is valid. If it is not,
-it will rewrite the file with a valid line-length. """
+it will rewrite the file with a valid line-length. The scan is skipped if the file size is consistent with
+the line length and the first and last records are properly terminated."""
+
+		self.ptr.seek(0,os.SEEK_END)
+		size=self.ptr.tell()-self.seekbase
+		if size%self.linelen==0 :
+			n=size//self.linelen
+			if n==0 :
+				self.n=0
+				return
+			self.ptr.seek(self.seekbase+self.linelen-1)
+			first=self.ptr.read(1)
+			self.ptr.seek(self.seekbase+self.linelen*n-1)
+			last=self.ptr.read(1)
+			if first in ("\n",b"\n") and last in ("\n",b"\n") :
+				self.n=n
+				return
 
 		self.ptr.seek(self.seekbase)
 		self.n=0
@@ -2126,6 +2241,7 @@ line length. Used when a line must be added in the middle of the file."""
 		# close both files
 		tmpfile=None
 		self.ptr=None
+		self.mm=None
 		self.seekbase=newseekbase
 
 		# rename the temporary file over the original
@@ -2135,6 +2251,110 @@ line length. Used when a line must be added in the middle of the file."""
 
 #		print "rewrite ",self.linelen
 
+header_cache_max=int(float(os.getenv("EMAN2HDRCACHE","256"))*1048576)	# bytes the header cache may use on disk
+header_cache_maxfiles=1000			# and the number of files it may hold
+
+def header_cache_path(filename):
+	"""Returns the path of the persistent header cache for filename, or None if the file can't be cached"""
+	if filename[:4].lower()=="bdb:" : return None
+	try:
+		dir=e2gethome()+"/.eman2/hdrcache"
+		if not os.path.isdir(dir) : os.makedirs(dir)
+	except: return None
+	return "{}/{}.pkl".format(dir,hashlib.md5(os.path.abspath(filename).encode("utf-8")).hexdigest())
+
+def header_cache_prune(dir):
+	"""Removes the least recently used entries from the header cache in dir until it is within header_cache_max bytes
+and header_cache_maxfiles files. Entries are touched when used, so the modification time gives the LRU order."""
+	ents=[]
+	for f in os.listdir(dir):
+		if not f.endswith(".pkl") : continue
+		try:
+			st=os.stat(dir+"/"+f)
+			ents.append((st.st_mtime,st.st_size,f))
+		except: pass
+	ents.sort()
+	total=sum([e[1] for e in ents])
+	for n,(mt,size,f) in enumerate(ents):
+		if total<=header_cache_max and len(ents)-n<=header_cache_maxfiles : break
+		try: os.unlink(dir+"/"+f)
+		except: pass
+		total-=size
+
+def header_cache_deps(filename):
+	"""Returns {file:(mtime,size)} for filename and, for .lst files, every file it references. The cache for
+filename is only valid if none of these have changed."""
+	fsps=[filename]
+	if filename.endswith(".lst") :
+		fsps.extend([f if isinstance(f,str) else f.decode("utf-8") for f in set(LSXFile(filename,True).as_array()["file"].tolist())])
+	ret={}
+	for f in fsps:
+		st=os.stat(f)
+		ret[f]=(st.st_mtime,st.st_size)
+	return ret
+
+def emdata_read_headers(filename,indices=None,keys=None,cache=True):
+	"""Reads the headers of many images at once, and returns them in columns. Each underlying file is opened once, and
+.lst files are resolved in bulk, with the record comment in 'lst_comment'. indices is a list of image numbers (default
+all), keys a list of header keys to return (default all keys present in any image).
+
+Returns a dictionary keyed by header key. Numerical values are returned as NumPy arrays (float with NaN for images
+missing the key, unless every image has an integer value), anything else (Transform, Ctf, strings, lists) as a list
+with None for missing values. The 'n' column contains the image numbers.
+
+If cache is set, all headers read are stored in ~/.eman2/hdrcache, and reused on later calls as long as the file
+(and any files an .lst references) is unchanged, so repeated scans of the same stack are nearly free. The cache is
+limited to $EMAN2HDRCACHE MB (default 256) and header_cache_maxfiles files, least recently used entries are removed first."""
+	import numpy as np
+
+	if indices is None : indices=list(range(EMUtil.get_image_count(filename)))
+	indices=[int(i) for i in indices]
+
+	hdrs={}
+	deps=None
+	cpath=header_cache_path(filename) if cache else None
+	if cpath!=None :
+		try:
+			deps=header_cache_deps(filename)
+			cached=pickle.load(open(cpath,"rb"))
+			if cached["deps"]==deps :
+				hdrs=cached["hdrs"]
+				os.utime(cpath,None)		# most recently used
+
+		except: pass
+
+	missing=[i for i in indices if i not in hdrs]
+	if len(missing)>0 :
+		if filename.endswith(".lst") : imgs=LSXFile(filename,True).read_images(missing,True)
+		else : imgs=EMData.read_images(filename,missing,True)
+		for i,im in zip(missing,imgs): hdrs[i]=im.get_attr_dict()
+
+		if cpath!=None and deps!=None :
+			try:
+				with open(cpath+".tmp","wb") as f : pickle.dump({"deps":deps,"hdrs":hdrs},f,-1)
+				os.rename(cpath+".tmp",cpath)
+				header_cache_prune(os.path.dirname(cpath))
+			except: pass
+
+	rows=[hdrs[i] for i in indices]
+	if keys is None :
+		keys=set()
+		for r in rows: keys.update(list(r.keys()))
+		keys=sorted(keys)
+
+	ret={"n":np.array(indices,dtype=np.int64)}
+	for k in keys:
+		col=[r.get(k) for r in rows]
+		vals=[v for v in col if v is not None]
+		if len(vals)>0 and all([isinstance(v,(int,float)) for v in vals]) :
+			if len(vals)==len(col) and all([isinstance(v,int) for v in vals]) : ret[k]=np.array(col,dtype=np.int64)
+			else : ret[k]=np.array([np.nan if v is None else v for v in col],dtype=np.float64)
+		else : ret[k]=col
+
+	return ret
+
+EMData.read_headers=staticmethod(emdata_read_headers)
+
 def image_eosplit(filename):
 	"""This will take an input image stack in LSX or normal image format and produce output .lst (LSX)
 files corresponding to even and odd numbered particles. It will return a tuple with two filenames
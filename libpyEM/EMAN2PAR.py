@@ -52,6 +52,7 @@ import shutil
 import subprocess
 import _thread,threading
 import getpass
+import hashlib
 import select
 
 from EMAN2 import test_image,EMData,abs_path,local_datetime,EMUtil,Util,get_platform
@@ -83,6 +84,7 @@ from e2initialmodel import InitMdlTask
 import socketserver
 from pickle import dumps,loads,dump,load
 from struct import pack,unpack
+from mpi_eman import emdata_dumps,emdata_loads,emdata_write,emdata_read
 
 # If we can't import it then we probably won't be trying to use MPI
 try :
@@ -115,7 +117,8 @@ class EMTaskCustomer(object):
 	def __init__(self,target):
 		"""Specify the type and target host of the parallelism server to use.
 	dc[:hostname[:port]] - default hostname localhost, default port 9990
-	thread:nthreads[:scratch_dir]
+	thread:nthreads[:scratch_dir[:max_retries]]
+	pool:nprocesses[:scratch_dir[:max_retries]]
 	mpi:ncpu[:scratch_dir_on_nodes]
 	"""
 		origtarget=target
@@ -134,7 +137,17 @@ class EMTaskCustomer(object):
 			self.maxthreads=int(target.split(":")[1])
 			try: self.scratchdir=target.split(":")[2]
 			except: self.scratchdir="/tmp"
-			self.handler=EMLocalTaskHandler(self.maxthreads,self.scratchdir)
+			try: self.maxretry=int(target.split(":")[3])
+			except: self.maxretry=2
+			self.handler=EMLocalTaskHandler(self.maxthreads,self.scratchdir,self.maxretry)
+		elif self.servtype=="pool":
+			self.groupn=0
+			self.maxthreads=int(target.split(":")[1])
+			try: self.scratchdir=origtarget.split(":")[2]
+			except: self.scratchdir="/tmp"
+			try: self.maxretry=int(target.split(":")[3])
+			except: self.maxretry=2
+			self.handler=EMLocalPoolTaskHandler(self.maxthreads,self.scratchdir,self.maxretry)
 		elif self.servtype=="mpi":
 			self.maxthreads=int(target.split(":")[1])
 			try: self.scratchdir=origtarget.split(":")[2]
@@ -146,10 +159,10 @@ class EMTaskCustomer(object):
 				else: self.cache=False
 			except: self.cache=False
 			self.handler=EMMpiTaskHandler(self.maxthreads,self.scratchdir)
-		else : raise Exception("Only 'dc', 'thread' and 'mpi' servertypes currently supported")
+		else : raise Exception("Only 'dc', 'thread', 'pool' and 'mpi' servertypes currently supported")
 
 	def __del__(self):
-		if self.servtype=="thread" :
+		if self.servtype in ("thread","pool") :
 			print("Cleaning up thread server. Please wait.")
 			self.handler.stop()
 		elif self.servtype=="mpi" :
@@ -186,7 +199,7 @@ class EMTaskCustomer(object):
 		"""Returns an estimate of the number of available CPUs based on the number
 		of different nodes we have talked to. Doesn't handle multi-core machines as
 		separate entities yet. If wait is set, it will not return until ncpu > 1"""
-		if self.servtype =="thread" : return self.maxthreads
+		if self.servtype in ("thread","pool") : return self.maxthreads
 		if self.servtype =="mpi" : return self.maxthreads-1
 
 		if self.servtype=="dc" :
@@ -210,7 +223,7 @@ class EMTaskCustomer(object):
 	def new_group(self):
 		"""request a new group id from the server for use in grouping subtasks"""
 
-		if self.servtype in ("thread","mpi"):
+		if self.servtype in ("thread","pool","mpi"):
 			self.groupn+=1
 			return self.groupn
 
@@ -222,7 +235,7 @@ class EMTaskCustomer(object):
 
 	def rerun_task(self,tid):
 		"""Trigger an already submitted task to be re-executed"""
-		if self.servtype in ("thread","mpi") :
+		if self.servtype in ("thread","pool","mpi") :
 			self.handler.stop()
 			raise Exception("MPI/Threaded parallelism doesn't support respawning tasks")
 
@@ -247,7 +260,7 @@ class EMTaskCustomer(object):
 			try: task.user=getpass.getuser()
 			except: task.user="anyone"
 
-		if self.servtype in ("thread","mpi"):
+		if self.servtype in ("thread","pool","mpi"):
 			return [self.handler.add_task(t) for t in tasks]
 
 
@@ -282,7 +295,7 @@ class EMTaskCustomer(object):
 		try: task.user=getpass.getuser()
 		except: task.user="anyone"
 
-		if self.servtype in ("thread","mpi"):
+		if self.servtype in ("thread","pool","mpi"):
 			return self.handler.add_task(task)
 
 		if self.servtype=="dc" :
@@ -311,7 +324,7 @@ class EMTaskCustomer(object):
 	def check_task(self,taskid_list):
 		"""Check on the status of a list of tasks. Returns a list of ints, -1 to 100. -1 for a task
 		that hasn't been started. 0-99 for tasks that have begun, but not completed. 100 for completed tasks."""
-		if self.servtype in ("thread","mpi") :
+		if self.servtype in ("thread","pool","mpi") :
 			return self.handler.check_task(taskid_list)
 
 		if self.servtype=="dc":
@@ -331,7 +344,7 @@ class EMTaskCustomer(object):
 	def get_results(self,taskid,retry=True):
 		"""Get the results for a completed task. Returns a tuple (task object,dictionary}."""
 
-		if self.servtype in ("thread","mpi") :
+		if self.servtype in ("thread","pool","mpi") :
 			return self.handler.get_results(taskid)
 
 		if self.servtype=="dc":
@@ -399,25 +412,139 @@ def image_range(a,b=None):
 	else:
 		for i in a : yield i
 
+class EMImageCache(object):
+	"""Node-local cache of preprocessed images shared by all of the tasks running on one machine. Tasks which
+	read the same image from the same file and apply the same preprocessing (eg - the references in an e2simmx
+	tile) can get(), and only the first one on each node actually reads and processes the image. Entries are
+	stored as EMData frames (see mpi_eman.emdata_dumps) in /dev/shm when available, or in $EMAN2NODECACHE.
+	Entries for a file are invalidated automatically when the file is modified, since the file's modification
+	time is part of the key, and the entries for older versions are removed when a new version is cached. The cache
+	is bounded: entries not used for maxage seconds are removed, then the least recently used entries until the
+	total size is below maxbytes ($EMAN2NODECACHEMAX in MB, default 2000). Writes are also skipped if the cache
+	filesystem is getting full. Programs should remove() the entries for their input files when they finish.
+
+	stats contains the number of hits and misses and the number of bytes which were read from the cache rather
+	than being read and processed again."""
+
+	def __init__(self,cachedir=None,maxbytes=None,maxage=86400):
+		if cachedir==None : cachedir=os.getenv("EMAN2NODECACHE")
+		if cachedir==None :
+			if os.path.isdir("/dev/shm") and os.access("/dev/shm",os.W_OK) : cachedir="/dev/shm"
+			else : cachedir="/tmp"
+		self.cachedir="%s/e2imgcache-%s"%(cachedir,getpass.getuser())
+		try: os.makedirs(self.cachedir)
+		except: pass
+		if maxbytes==None : maxbytes=int(os.getenv("EMAN2NODECACHEMAX","2000"))*1000000
+		self.maxbytes=maxbytes
+		self.maxage=maxage
+		self.unpruned=maxbytes		# bytes written since the last prune(), so the first put() prunes
+		self.stats={"hits":0,"misses":0,"bytessaved":0,"byteswritten":0}
+
+	def filedir(self,fsp):
+		"""Returns the cache subdirectory for the current version of fsp"""
+		fsp=os.path.abspath(fsp)
+		try: size=os.path.getsize(fsp)
+		except: size=0
+		return "%s/%s_%d_%d"%(self.cachedir,hashlib.md5(fsp.encode("utf-8")).hexdigest()[:16],e2filemodtime(fsp),size)
+
+	def get(self,fsp,idx,tag,fn):
+		"""Returns the cached image for (fsp,idx,tag), calling fn() to produce it on a miss. tag identifies the
+		preprocessing, eg - "shrink2". Any failure of the cache itself falls back to calling fn()"""
+		path=None
+		try:
+			path="%s/%d_%s"%(self.filedir(fsp),idx,tag)
+			with open(path,"rb") as f : head,buffers=emdata_read(f)
+			ret=emdata_loads(head,buffers)
+			os.utime(path,None)			# the modification time is the LRU order
+			self.stats["hits"]+=1
+			self.stats["bytessaved"]+=sum([b.nbytes for b in buffers])
+			return ret
+		except: pass
+
+		ret=fn()
+		self.stats["misses"]+=1
+		if path!=None:
+			try: self.put(path,ret)
+			except: pass
+		return ret
+
+	def put(self,path,img):
+		head,buffers=emdata_dumps(img)
+		nbytes=sum([b.nbytes for b in buffers])
+		st=os.statvfs(self.cachedir)
+		if st.f_bavail*st.f_frsize<max(nbytes*4,st.f_blocks*st.f_frsize//4) : return		# leave at least 1/4 of the filesystem free
+
+		fdir=os.path.dirname(path)
+		if not os.path.isdir(fdir):
+			# a new version of the file, the entries for the old versions will never be used again
+			pfx=os.path.basename(fdir).split("_")[0]+"_"
+			for d in os.listdir(self.cachedir):
+				if d.startswith(pfx) : shutil.rmtree("%s/%s"%(self.cachedir,d),True)
+			try: os.makedirs(fdir)
+			except: pass
+		tmppath="%s.%d.tmp"%(path,os.getpid())
+		with open(tmppath,"wb") as f : emdata_write(f,head,buffers)
+		os.rename(tmppath,path)			# atomic, so other processes never see a partial entry
+		self.stats["byteswritten"]+=nbytes
+
+		# scanning the cache isn't free, so only prune after a reasonable amount has been written
+		self.unpruned+=nbytes
+		if self.unpruned>=self.maxbytes//16 : self.prune()
+
+	def prune(self):
+		"""Removes entries which haven't been used for maxage seconds, then the least recently used entries until
+		the cache is smaller than maxbytes. Safe to call while other processes are using the cache."""
+		self.unpruned=0
+		now=time.time()
+		entries=[]
+		for d in os.listdir(self.cachedir):
+			dpath="%s/%s"%(self.cachedir,d)
+			try:
+				for f in os.listdir(dpath):
+					fpath="%s/%s"%(dpath,f)
+					st=os.stat(fpath)
+					if now-st.st_mtime>self.maxage : os.unlink(fpath)
+					elif not f.endswith(".tmp") : entries.append((st.st_mtime,st.st_size,fpath))
+				if len(os.listdir(dpath))==0 : os.rmdir(dpath)
+			except: pass
+
+		total=sum([e[1] for e in entries])
+		for mtime,size,fpath in sorted(entries):
+			if total<=self.maxbytes : break
+			try: os.unlink(fpath)
+			except: pass
+			total-=size
+
+	def remove(self,fsp):
+		"""Removes all cached entries for fsp, including those for older versions of the file"""
+		fsp=os.path.abspath(fsp)
+		pfx=hashlib.md5(fsp.encode("utf-8")).hexdigest()[:16]+"_"
+		for d in os.listdir(self.cachedir):
+			if d.startswith(pfx) : shutil.rmtree("%s/%s"%(self.cachedir,d),True)
+
 class EMTestTask(JSTask):
-	"""This is a simple example of a EMTask subclass that actually does something"""
+	"""This is a simple example of a EMTask subclass that actually does something. If options contains
+	"sleep", the task does nothing but wait that many seconds, which is useful for measuring the overhead
+	of the parallelism system itself (see examples/mpispeedtest.py)"""
 
-	def __init__(self):
-		JSTask.__init__(self)
-		self.command="test_task"
+	def __init__(self,data=None,options=None):
+		JSTask.__init__(self,"test_task",data,options)
+
+	def execute(self,callback=None):
+		if self.options!=None and "sleep" in self.options :
+			time.sleep(self.options["sleep"])
+			return {"sleep":self.options["sleep"]}
 
-	def execute(self):
 		# test command. takes a set of images, inverts them and returns the results
 		# data should contain one element "input"
 		data=self.data["input"]
 		cname=data[1]
-		cache=db_open_dict(cname)
 
 		ret=[]
 		for i in image_range(*data[2:]):		# this allows us to iterate over the specified image numbers
-			ret.append(cache[i]*-1)
+			ret.append(EMData(cname,i)*-1)
 
-		return ret
+		return {"output":ret}
 
 
 #######################
@@ -499,14 +626,21 @@ accessible to the server."""
 # Here we define the classes for local threaded parallelism
 class EMLocalTaskHandler(object):
 	"""Local threaded Taskserver. This runs as a thread in the 'Customer' and executes tasks. Not a
-	subclass of EMTaskHandler for efficient local processing and to avoid data name translation."""
+	subclass of EMTaskHandler for efficient local processing and to avoid data name translation.
+	A task which exits with an error is relaunched up to maxretry times. After that it is considered
+	poisoned, and is copied to <scratchdir>/e2quarantine along with its traceback."""
 	lock=threading.Lock()
 	allrunning = {}	# Static dict of running local tasks. Used for killing thses task upon parent kill
-	def __init__(self,nthreads=2,scratchdir="/tmp"):
+	def __init__(self,nthreads=2,scratchdir="/tmp",maxretry=2):
 		self.maxthreads=nthreads
+		self.maxretry=maxretry
 		self.running=[]			# running subprocesses
 		self.completed=set()	# completed subprocesses
+		self.requeue=[]			# failed tasks waiting to be relaunched
+		self.retries={}			# key=taskid, value=number of failed attempts
+		self.quarantine={}		# key=taskid, value=traceback file for tasks which exceeded maxretry
 		self.scratchdir="%s/e2tmp.%d"%(scratchdir,random.randint(1,2000000000))
+		self.quarantinedir="%s/e2quarantine"%scratchdir
 		self.maxid=0
 		self.nextid=0
 		self.doexit=0
@@ -532,13 +666,16 @@ class EMLocalTaskHandler(object):
 		return ret
 
 	def check_task(self,id_list):
-		"""Checks a list of tasks for completion. Note that progress is not currently
-		handled, so results are always -1, 0 or 100 """
+		"""Checks a list of tasks for completion. Returns -1 for tasks which haven't started, 0-99 for
+		running tasks based on the progress reported by the task, and 100 for completed tasks. Quarantined
+		tasks also return 100, but get_results will raise an exception for them."""
 		ret=[]
 		for i in id_list:
 			if i>=self.nextid : ret.append(-1)
 			elif i in self.completed : ret.append(100)
-			else: ret.append(0)
+			else:
+				try: ret.append(max(0,min(99,int(open("%s/%07d.out.prog"%(self.scratchdir,i),"r").read()))))
+				except: ret.append(0)
 		return ret
 
 	def get_results(self,taskid):
@@ -546,15 +683,59 @@ class EMLocalTaskHandler(object):
 #		print "Retrieve ",taskid
 		if taskid not in self.completed : raise Exception("Task %d not complete !!!"%taskid)
 
+		if taskid in self.quarantine :
+			self.completed.remove(taskid)
+			os.unlink("%s/%07d"%(self.scratchdir,taskid))
+			raise Exception("Task %d failed %d times and was quarantined, see %s"%(taskid,self.retries[taskid],self.quarantine[taskid]))
+
 		task=load(open("%s/%07d"%(self.scratchdir,taskid),"rb"))
 		results=load(open("%s/%07d.out"%(self.scratchdir,taskid),"rb"))
 
 		os.unlink("%s/%07d.out"%(self.scratchdir,taskid))
 		os.unlink("%s/%07d"%(self.scratchdir,taskid))
+		try: os.unlink("%s/%07d.out.prog"%(self.scratchdir,taskid))
+		except: pass
 		self.completed.remove(taskid)
 
 		return (task,results)
 
+	def task_failed(self,taskid,returncode):
+		"""Called when a task exits with an error. Relaunches the task, or quarantines it if it has already
+		failed maxretry times"""
+		try:
+			err=open("%s/%07d.out.err"%(self.scratchdir,taskid),"r").read()
+			os.unlink("%s/%07d.out.err"%(self.scratchdir,taskid))
+		except: err="No traceback available, exit status %d\n"%returncode
+
+		self.retries[taskid]=self.retries.get(taskid,0)+1
+		if self.retries[taskid]<=self.maxretry :
+			print("Error running task %d, retrying (%d/%d)"%(taskid,self.retries[taskid],self.maxretry))
+			self.requeue.append(taskid)
+			return
+
+		try: os.makedirs(self.quarantinedir)
+		except: pass
+		qname="%s/%d_%07d"%(self.quarantinedir,os.getpid(),taskid)
+		shutil.copy("%s/%07d"%(self.scratchdir,taskid),qname+".task")
+		out=open(qname+".txt","w")
+		out.write(err)
+		out.close()
+		print("Error running task %d, failed %d times. Quarantined in %s"%(taskid,self.retries[taskid],qname+".task"))
+
+		self.quarantine[taskid]=qname+".txt"
+		self.completed.add(taskid)
+
+	def launch(self,taskid):
+		"""Starts a subprocess to execute a single task"""
+		#There is the issue that when shell=True, popen.pid return shell pid and not process, so we set shell=false (there will be issues on Windows, but we don't support paralellization on windows
+		#proc=subprocess.Popen("e2parallel.py" + " localclient" + " --taskin=%s/%07d"%(self.scratchdir,self.nextid) + " --taskout=%s/%07d.out"%(self.scratchdir,self.nextid), shell=True)
+		if get_platform() == 'Windows':
+			proc=subprocess.Popen(["python", "%s\\bin\\e2parallel.py"%os.getenv('EMAN2DIR'),"localclient","--taskin=%s/%07d"%(self.scratchdir,taskid),"--taskout=%s/%07d.out"%(self.scratchdir,taskid)])
+		else:
+			proc=subprocess.Popen(["e2parallel.py","localclient","--taskin=%s/%07d"%(self.scratchdir,taskid),"--taskout=%s/%07d.out"%(self.scratchdir,taskid)])
+		self.running.append((proc,taskid))
+		EMLocalTaskHandler.allrunning[taskid] = proc
+
 	def run(self):
 
 		while(1):
@@ -563,43 +744,229 @@ class EMLocalTaskHandler(object):
 #				shutil.rmtree(self.scratchdir)
 				break
 
-			for i,p in enumerate(self.running):
+			stillrunning=[]
+			for p in self.running:
 				# Check to see if the task is complete
-				if p[0].poll()!=None :
+				if p[0].poll()==None :
+					stillrunning.append(p)
+					continue
 
-					# This means that the task failed to execute properly
-					if p[0].returncode!=0 :
-						print("Error running task : ",p[1])
-						_thread.interrupt_main()
-						sys.stderr.flush()
-						sys.stdout.flush()
-						os._exit(1)
+				try:
+					del(EMLocalTaskHandler.allrunning[p[1]])
+				except:
+					print("Error: Very strange threading error when trying to delete ",p[1]," Continuing execution, but be wary of any strange results.")
 
-#					print "Task complete ",p[1]
-					# if we get here, the task completed
-					self.completed.add(p[1])
-					try:
-						del(EMLocalTaskHandler.allrunning[p[1]])
-					except:
-						print("Error: Very strange threading error when trying to delete ",p[1]," Continuing execution, but be wary of any strange results.")
+				# This means that the task failed to execute properly
+				if p[0].returncode!=0 : self.task_failed(p[1],p[0].returncode)
+				# if we get here, the task completed
+				else : self.completed.add(p[1])
 
-			self.running=[i for i in self.running if i[1] not in self.completed]	# remove completed tasks
+			self.running=stillrunning
 
-			while self.nextid<self.maxid and len(self.running)<self.maxthreads:
+			while (len(self.requeue)>0 or self.nextid<self.maxid) and len(self.running)<self.maxthreads:
 #				print "Launch task ",self.nextid
 				EMLocalTaskHandler.lock.acquire()
-				#There is the issue that when shell=True, popen.pid return shell pid and not process, so we set shell=false (there will be issues on Windows, but we don't support paralellization on windows
-				#proc=subprocess.Popen("e2parallel.py" + " localclient" + " --taskin=%s/%07d"%(self.scratchdir,self.nextid) + " --taskout=%s/%07d.out"%(self.scratchdir,self.nextid), shell=True)
-				if get_platform() == 'Windows':
-					proc=subprocess.Popen(["python", "%s\\bin\\e2parallel.py"%os.getenv('EMAN2DIR'),"localclient","--taskin=%s/%07d"%(self.scratchdir,self.nextid),"--taskout=%s/%07d.out"%(self.scratchdir,self.nextid)])
-				else:
-					proc=subprocess.Popen(["e2parallel.py","localclient","--taskin=%s/%07d"%(self.scratchdir,self.nextid),"--taskout=%s/%07d.out"%(self.scratchdir,self.nextid)])
-				self.running.append((proc,self.nextid))
-				EMLocalTaskHandler.allrunning[self.nextid] = proc
-				self.nextid+=1
+				if len(self.requeue)>0 : self.launch(self.requeue.pop(0))
+				else :
+					self.launch(self.nextid)
+					self.nextid+=1
 				EMLocalTaskHandler.lock.release()
 
 
+def EMPoolWorker(taskq,resultq):
+	"""Main loop of a worker process for EMLocalPoolTaskHandler. EMAN2 and all of the JSTask subclasses
+	are already imported when the worker starts, so each task costs only its own unpickling. Runs until
+	it receives None on taskq."""
+	signal.signal(signal.SIGINT,signal.SIG_IGN)		# the customer is responsible for shutting us down
+
+	while 1:
+		job=taskq.get()
+		if job==None : break
+		taskid,task=job
+
+		resultq.put(("STRT",taskid,os.getpid()))
+		lastupdate=[0]
+		def progress(prog):
+			if time.time()-lastupdate[0]>1 :
+				resultq.put(("PROG",taskid,prog))
+				lastupdate[0]=time.time()
+			return True
+
+		try: ret=task.execute(progress)
+		except:
+			resultq.put(("FAIL",taskid,traceback.format_exc()))
+			continue
+
+		resultq.put(("DONE",taskid,ret))
+
+class EMLocalPoolTaskHandler(object):
+	"""Local process-pool Taskserver. Unlike EMLocalTaskHandler, which launches a new e2parallel.py localclient
+	for every task, this starts a fixed number of worker processes once, then passes tasks to them over pipes.
+	Completion is reported back on a result queue, which a thread in the customer blocks on, so there is no
+	startup cost per task and no polling of the scratch directory. Failed tasks are retried and quarantined
+	as in EMLocalTaskHandler. A worker which dies (segfault, out of memory, ...) is replaced, and its task is
+	treated as failed."""
+	allworkers = {}	# Static dict of running pool workers. Used for killing these processes upon parent kill
+	def __init__(self,nthreads=2,scratchdir="/tmp",maxretry=2):
+		import multiprocessing
+
+		self.maxthreads=nthreads
+		self.maxretry=maxretry
+		self.scratchdir="%s/e2tmp.%d"%(scratchdir,random.randint(1,2000000000))
+		self.quarantinedir="%s/e2quarantine"%scratchdir
+		self.lock=threading.Lock()
+		self.maxid=0
+		self.tasks={}			# key=taskid, value=task as submitted, kept until results are retrieved
+		self.progress={}		# key=taskid, value=0-99 for tasks which have been picked up by a worker
+		self.results={}			# key=taskid, value=results for completed tasks
+		self.retries={}			# key=taskid, value=number of failed attempts
+		self.quarantine={}		# key=taskid, value=traceback file for tasks which exceeded maxretry
+		self.inflight={}		# key=worker pid, value=taskid the worker is running
+		self.doexit=0
+
+		os.makedirs(self.scratchdir)
+
+		# workers are forked before the collector thread exists, so they inherit the already imported EMAN2
+		self.taskq=multiprocessing.Queue()
+		self.resultq=multiprocessing.Queue()
+		self.workers=[self.start_worker() for i in range(self.maxthreads)]
+
+		self.thr=threading.Thread(target=self.run)
+		self.thr.daemon=True
+		self.thr.start()
+
+	def start_worker(self):
+		import multiprocessing
+
+		w=multiprocessing.Process(target=EMPoolWorker,args=(self.taskq,self.resultq))
+		w.daemon=True
+		w.start()
+		EMLocalPoolTaskHandler.allworkers[w.pid]=w
+		return w
+
+	def check_workers(self):
+		"""Collector thread only. Replaces any worker process which has died, and fails the task it was running,
+		so the task is retried or quarantined rather than left running forever"""
+		for i,w in enumerate(self.workers):
+			if w.is_alive() or self.doexit==1 : continue		# workers exit on their own when we stop
+			try: del EMLocalPoolTaskHandler.allworkers[w.pid]
+			except: pass
+			self.workers[i]=self.start_worker()
+			taskid=self.inflight.pop(w.pid,None)
+			print("Pool worker %d exited unexpectedly (exit code %s), restarted"%(w.pid,str(w.exitcode)))
+			if taskid!=None : self.task_failed(taskid,"Worker process %d exited with code %s while running task %d\n"%(w.pid,str(w.exitcode),taskid))
+
+	def stop(self):
+		"""Called externally (by the Customer) to nicely shut down the task handler"""
+		self.doexit=1
+		for w in self.workers: self.taskq.put(None)
+		self.resultq.put(("EXIT",-1,None))		# wakes up the collector thread
+		self.thr.join()
+		for w in self.workers:
+			w.join(5)
+			if w.is_alive() : w.terminate()
+			try: del EMLocalPoolTaskHandler.allworkers[w.pid]
+			except: pass
+		shutil.rmtree(self.scratchdir,True)
+
+	def add_task(self,task):
+		if not isinstance(task,JSTask) : raise Exception("Non-task object passed to EMLocalPoolTaskHandler for execution")
+		with self.lock:
+			ret=self.maxid
+			self.tasks[ret]=task
+			self.maxid+=1
+		self.taskq.put((ret,task))
+		return ret
+
+	def check_task(self,id_list):
+		"""Checks a list of tasks for completion. Returns -1 for tasks which haven't started, 0-99 for
+		running tasks and 100 for completed (or quarantined) tasks."""
+		ret=[]
+		with self.lock:
+			for i in id_list:
+				if i in self.results or i in self.quarantine : ret.append(100)
+				elif i in self.progress : ret.append(self.progress[i])
+				else : ret.append(-1)
+		return ret
+
+	def get_results(self,taskid):
+		"""This returns a (task,dictionary) tuple for a task"""
+		with self.lock:
+			if taskid in self.quarantine :
+				del self.tasks[taskid]
+				raise Exception("Task %d failed %d times and was quarantined, see %s"%(taskid,self.retries[taskid],self.quarantine.pop(taskid)))
+			if taskid not in self.results : raise Exception("Task %d not complete !!!"%taskid)
+			results=self.results.pop(taskid)
+			task=self.tasks.pop(taskid)
+			self.progress.pop(taskid,None)
+
+		return (task,results)
+
+	def task_failed(self,taskid,err):
+		"""Called when a task raises an exception. Resubmits the task, or quarantines it if it has already
+		failed maxretry times"""
+		self.retries[taskid]=self.retries.get(taskid,0)+1
+		if self.retries[taskid]<=self.maxretry :
+			print("Error running task %d, retrying (%d/%d)"%(taskid,self.retries[taskid],self.maxretry))
+			self.taskq.put((taskid,self.tasks[taskid]))
+			return
+
+		try: os.makedirs(self.quarantinedir)
+		except: pass
+		qname="%s/%d_%07d"%(self.quarantinedir,os.getpid(),taskid)
+		dump(self.tasks[taskid],open(qname+".task","wb"),-1)
+		out=open(qname+".txt","w")
+		out.write(err)
+		out.close()
+		print("Error running task %d, failed %d times. Quarantined in %s"%(taskid,self.retries[taskid],qname+".task"))
+
+		with self.lock:
+			self.progress.pop(taskid,None)
+			self.quarantine[taskid]=qname+".txt"
+
+	def run(self):
+		"""Collector thread. Blocks on the result queue and records task state as workers report it. Every few
+		seconds, once the queue has been emptied, it also checks that all of the workers are still alive."""
+		import queue
+
+		lastcheck=time.time()
+		while 1:
+			try: com,taskid,data=self.resultq.get(True,1.0)
+			except queue.Empty: com=None
+			if self.doexit==1 : break
+
+			if com!=None : self.handle(com,taskid,data)
+
+			# a dead worker can't report anything more, so once the queue is empty, everything it did report has been handled
+			if com==None or time.time()-lastcheck>5.0 :
+				while com!=None :
+					try: com,taskid,data=self.resultq.get_nowait()
+					except queue.Empty: break
+					if self.doexit==1 : return
+					self.handle(com,taskid,data)
+				self.check_workers()
+				lastcheck=time.time()
+
+	def handle(self,com,taskid,data):
+		"""Collector thread only. Records one message from a worker"""
+		if com=="STRT" :
+			self.inflight[data]=taskid
+			with self.lock: self.progress[taskid]=0
+			return
+
+		if com in ("DONE","FAIL") :
+			for pid,tid in list(self.inflight.items()):
+				if tid==taskid : del self.inflight[pid]
+
+		if com=="PROG" :
+			try: prog=max(0,min(99,int(data)))
+			except: return
+			with self.lock:
+				if taskid in self.progress : self.progress[taskid]=prog
+		elif com=="DONE" :
+			with self.lock: self.results[taskid]=data
+		elif com=="FAIL" : self.task_failed(taskid,data)
+
 #######################
 #  Here we define the classes for MPI parallelism
 
@@ -711,142 +1078,241 @@ class EMMpiClient(object):
 			self.mpifile.flush()
 			self.log("Said HELO back")
 
-			self.rankjobs=[-1 for i in range(self.nrank)]		# Each element is a rank, and indicates which job that rank is currently running (-1 if idle)
-			self.rankjobs[0]=-2					# this makes sure we don't try to send a job to ourself
+			self.rankjobs=[[] for i in range(self.nrank)]		# Each element is a rank, and lists the jobs sent to that rank, the running job first, then any prefetched jobs
+			self.rankjobs[0]=None					# this makes sure we don't try to send a job to ourself
+			self.rankstats=[[0,0.0,0.0,0.0] for i in range(self.nrank)]	# per rank: jobs completed, busy time, idle time, time the current state began
 			self.maxjob=-1						# current highest job number waiting for execution
 			self.nextjob=1						# next job waiting to run
 			self.status={}						# status of each job
-
+			self.results={}						# key=job, value=(head,buffers) results waiting to be retrieved by the customer
+			self.doexit=False
+
+			# Tasks are only sent unasked to idle ranks. A rank does not receive while computing, so a blocking send to a
+			# busy rank could stall us until its task finished. Instead, a rank which has just started a task asks for
+			# the next one (NEXT) and waits for it, so it can start it as soon as it finishes. Up to prefetch tasks
+			# beyond the running one are handed out this way.
+			self.prefetch=int(os.getenv("EMANMPIPREFETCH","1"))
+
+			# Customer communications are handled in a separate thread, which wakes us up when there is new work
+			self.lock=threading.Lock()
+			self.wake=threading.Event()
+			self.custthr=threading.Thread(target=self.customer_thread,args=(verbose,))
+			self.custthr.daemon=True
+			self.custthr.start()
+
+			now=time.time()
+			for r in range(1,self.nrank): self.rankstats[r][3]=now
+			lastlog=now
+			delay=0.001
 			while 1:
-				# Look for a command from our controlling process
-				if select.select([self.mpifile],[],[],0)[0]:
-					com,data=load(self.mpifile)
-					if com=="EXIT" :
-						dump("OK",self.mpifile,-1)
-						self.mpifile.flush()
-						self.log("Normal EXIT")
-						for i in range(1,self.nrank):
-							r=mpi_eman2_send("EXIT","",i)
-
-						self.mpifile.close()
-						self.mpisock.close()
-
-						break
-					elif com=="NEWJ" :
-						dump("OK",self.mpifile,-1)
-						self.mpifile.flush()
-						if verbose>1 : print("New job %d from customer"%data)
-						self.log("New job %d from customer"%data)
-						self.maxjob=data	# this is the highest number job currently assigned
-
-					elif com=="CHEK" :
-						for i in range(len(data)):
-							if data[i] not in self.status : data[i]=-1
-							else: data[i]=self.status[data[i]]
-
-						dump(data,self.mpifile,-1)
-						self.mpifile.flush()
-					elif com=="CACH" :
-						if verbose>1 : print("(ignored) Cache request from customer: ")
-						dump("OK",self.mpifile,-1)
-						self.mpifile.flush()
-
-					else : print("Unknown command from client '%s'"%com)
-					continue
-
+				self.wake.clear()
+				with self.lock :
+					doexit=self.doexit
+					maxjob=self.maxjob
+
+				if doexit :
+					self.log("Normal EXIT")
+					for i in range(1,self.nrank):
+						r=mpi_eman2_send("EXIT","",i)
+
+					self.log_throughput()
+					self.mpifile.close()
+					self.mpisock.close()
+					break
 
 				# Finally, see if we have any jobs that need to be executed
-				if self.nextjob<=self.maxjob :
-
-					if -1 in self.rankjobs :
-						rank=self.rankjobs.index(-1)
-						if verbose>1 : print("Sending job %d to rank %d (%d idle)"%(self.nextjob,rank,self.rankjobs.count(-1)))
-
-						task = open("%s/%07d"%(self.queuedir,self.nextjob),"rb").read()		# we don't unpickle
-						self.log("Sending task %d to rank %d (%s)"%(self.nextjob,rank,str(type(task))))
-						r=mpi_eman2_send("EXEC",task,rank)
-
-						# if we got here, the task should be running
-						self.rankjobs[rank]=self.nextjob
-						self.nextjob+=1
-						self.log("Sending task rank %d done"%(rank))
+				if self.nextjob<=maxjob :
+					rank=self.next_rank()
+					if rank!=None :
+						self.send_task(rank,verbose)
+						delay=0.001
 						continue
 
 				# Now look for any requests from existing running jobs
 				info=mpi_iprobe(MPI_ANY_SOURCE, MPI_ANY_TAG, MPI_COMM_WORLD)
 				if info:
-					com,data,src=mpi_eman2_recv(MPI_ANY_SOURCE)
+					com,data,src=mpi_eman2_recv(MPI_ANY_SOURCE,True)
 					if com=="DONE" :
-						taskid=self.rankjobs[src]
-						open("%s/%07d.out"%(self.queuedir,taskid),"wb").write(data)	# assume what we got back is already pickled
-						self.status[taskid]=100
-						self.rankjobs[src]=-1
+						taskid=self.rankjobs[src].pop(0)
+						with self.lock:
+							self.results[taskid]=data		# kept serialized until the customer asks for it
+							self.status[taskid]=100
+						self.rankstats[src][0]+=1
+						if len(self.rankjobs[src])==0 : self.rank_busy(src,False)
 						self.log('Task %s complete on rank %d'%(taskid,src))
+					elif com=="NEXT" :
+						# src is blocked waiting for the reply, so neither send can stall us
+						if self.nextjob<=maxjob and len(self.rankjobs[src])<=self.prefetch : self.send_task(src,verbose)
+						else : mpi_eman2_send("NONE","",src)
 					elif com=="PROG" :
+						data=emdata_loads(*data)
 						if data[1]<0 or data[1]>99 :
 							print("Warning: Invalid progress report :",data)
 						else :
-							try : self.status[data[0]]=data[1]
+							try :
+								with self.lock: self.status[data[0]]=data[1]
 							except: print("Warning: Invalid progress report :",data)
 					else : print("Warning: unknown task command ",com)
+					delay=0.001
 					continue
 
-				time.sleep(2)
+				if time.time()-lastlog>300 :
+					self.log_throughput()
+					lastlog=time.time()
+
+				# Nothing to do. The customer thread will wake us immediately if something comes in. MPI can only
+				# be polled, so the wait backs off from 1 ms, but never sleeps longer than 20 ms.
+				self.wake.wait(delay)
+				delay=min(delay*2,0.02)
 
 		# all other ranks handle executing jobs
 		else :
+			self.pending=[]			# tasks rank 0 has sent us ahead of time, executed in order
+			self.prefetch=int(os.getenv("EMANMPIPREFETCH","1"))
+			self.exitreq=False
 
 			while 1:
-				r=mpi_iprobe(0, MPI_ANY_TAG, MPI_COMM_WORLD)		# listen for a message from rank 0, this one doesn't block
-				#if self.logfile!=None : self.logfile.write( "Listen response (%s)\n"%str(r))
-				if r:
-					com,data,src=mpi_eman2_recv(0)
+				if len(self.pending)==0 :
+					com,data,src=mpi_eman2_recv(0)		# blocks until rank 0 has something for us
 
 					if com=="EXIT":
 						if verbose>1 : print("rank %d: I was just told to exit"%self.rank)
 						break
 
-					if com=="EXEC":
-						if self.logfile!=None : self.logfile.write( "EXEC\n")
-						task=loads(data)		# just for clarity
-						if not isinstance(task,JSTask) : raise Exception("Non-task object passed to MPI for execution ! (%s)"%str(type(task)))
-						if verbose>1 : print("rank %d: I just got a task to execute (%s):"%(self.rank,socket.gethostname()),task.command,str(task.options))
-
-						self.taskfile="%s/taskexe.%d"%(self.queuedir,os.getpid())
-						self.taskout="%s/taskout.%d"%(self.queuedir,os.getpid())
+					if com=="EXEC": self.pending.append(data)
+					continue
 
-						# Execute the task
-						self.task=task	# for the callback
-						try: ret=task.execute(self.progress_callback)
-						except:
-							print("ERROR in executing task")
-							traceback.print_exc()
-							break
+				if self.logfile!=None : self.logfile.write( "EXEC\n")
+				task=self.pending.pop(0)
+				if not isinstance(task,JSTask) : raise Exception("Non-task object passed to MPI for execution ! (%s)"%str(type(task)))
+				if verbose>1 : print("rank %d: I just got a task to execute (%s):"%(self.rank,socket.gethostname()),task.command,str(task.options))
 
-						# return results to rank 0
-						if verbose : print("rank %d: Process done :"%self.rank,self.task.taskid)
-						r=mpi_eman2_send("DONE",dumps(ret,-1),0)
+				# ask for our next task now, so it is here when this one finishes
+				if len(self.pending)<self.prefetch and not self.exitreq : self.request_next()
 
-						######## OpenMPI wasn't so hot on the idea of a process that fork()ed, even if it wasn't doing MPI directly
-						## Run the job
-						#try: os.makedirs("/".join(self.taskfile.split("/")[:-1]))       # this should not be required ?
-						#except: pass
-						#dump(task,file(self.taskfile,"w"),-1)		# write the task to disk
+				self.taskfile="%s/taskexe.%d"%(self.queuedir,os.getpid())
+				self.taskout="%s/taskout.%d"%(self.queuedir,os.getpid())
 
+				# Execute the task
+				self.task=task	# for the callback
+				try: ret=task.execute(self.progress_callback)
+				except:
+					print("ERROR in executing task")
+					traceback.print_exc()
+					break
 
-						#cmd="e2parallel.py localclient --taskin=%s --taskout=%s"%(self.taskfile,self.taskout)
+				# pick up anything rank 0 sent while we were busy before replying, so it is never left blocking on us
+				self.receive_pending()
 
-						#self.job=subprocess.Popen(cmd, stdin=None, stdout=None, stderr=None, shell=True)
-						#if verbose>2 : print "rank %d: started my job:"%self.rank,cmd
+				# return results to rank 0
+				if verbose : print("rank %d: Process done :"%self.rank,self.task.taskid)
+				r=mpi_eman2_send("DONE",ret,0)
 
-#						if verbose>2 : print "rank %d: running but not done"%self.rank
-				else:
-					time.sleep(0.1)
-#					if self.logfile!=None : self.logfile.write( "Sleep\n")
-#					if verbose>2 : print "rank %d: waiting"%self.rank
+				if self.exitreq :
+					if verbose>1 : print("rank %d: I was just told to exit"%self.rank)
+					break
 
 		mpi_finalize()
 
+	def customer_thread(self,verbose):
+		"""Rank 0 only. Handles all requests from the controlling process (EMMpiTaskHandler), blocking on the socket,
+		and wakes the main loop when there is new work or we are told to exit."""
+		while 1:
+			com,data=load(self.mpifile)
+			with self.lock:
+				if com=="EXIT" :
+					dump("OK",self.mpifile,-1)
+					self.mpifile.flush()
+					self.doexit=True
+					self.wake.set()
+					break
+				elif com=="NEWJ" :
+					dump("OK",self.mpifile,-1)
+					self.mpifile.flush()
+					if verbose>1 : print("New job %d from customer"%data)
+					self.log("New job %d from customer"%data)
+					self.maxjob=data	# this is the highest number job currently assigned
+					self.wake.set()
+
+				elif com=="CHEK" :
+					for i in range(len(data)):
+						if data[i] not in self.status : data[i]=-1
+						else: data[i]=self.status[data[i]]
+
+					dump(data,self.mpifile,-1)
+					self.mpifile.flush()
+				elif com=="CACH" :
+					if verbose>1 : print("(ignored) Cache request from customer: ")
+					dump("OK",self.mpifile,-1)
+					self.mpifile.flush()
+
+				elif com=="RSLT" :
+					# results are passed back still serialized, image data as raw binary
+					if data in self.results :
+						head,buffers=self.results.pop(data)
+						dump("OK",self.mpifile,-1)
+						emdata_write(self.mpifile,head,buffers)
+					else : dump("NONE",self.mpifile,-1)
+					self.mpifile.flush()
+
+				else : print("Unknown command from client '%s'"%com)
+
+	def next_rank(self):
+		"""Rank 0 only. Returns an idle rank to send the next task to, or None if all ranks are busy. Busy ranks
+		get prefetched tasks only when they ask for them (NEXT)."""
+		for r in range(1,self.nrank):
+			if len(self.rankjobs[r])==0 : return r
+		return None
+
+	def send_task(self,rank,verbose):
+		"""Rank 0 only. Sends the next waiting task to rank, which must be idle or waiting for it"""
+		if verbose>1 : print("Sending job %d to rank %d (%d queued)"%(self.nextjob,rank,len(self.rankjobs[rank])))
+
+		head,buffers=emdata_read(open("%s/%07d"%(self.queuedir,self.nextjob),"rb"))		# we don't unpickle
+		self.log("Sending task %d to rank %d (%d images)"%(self.nextjob,rank,len(buffers)))
+		r=mpi_eman2_send_frame("EXEC",head,buffers,rank)
+
+		# if we got here, the task should be running or queued on the rank
+		if len(self.rankjobs[rank])==0 : self.rank_busy(rank,True)
+		self.rankjobs[rank].append(self.nextjob)
+		self.nextjob+=1
+		self.log("Sending task rank %d done"%(rank))
+
+	def rank_busy(self,rank,busy):
+		"""Rank 0 only. Accumulates busy/idle time for the throughput log when a rank changes state"""
+		now=time.time()
+		st=self.rankstats[rank]
+		if busy : st[2]+=now-st[3]
+		else : st[1]+=now-st[3]
+		st[3]=now
+
+	def log_throughput(self):
+		"""Rank 0 only. Writes the number of tasks, tasks/hour and fraction of time spent idle for each rank to the log"""
+		now=time.time()
+		for r in range(1,self.nrank):
+			n,busy,idle,since=self.rankstats[r]
+			if len(self.rankjobs[r])>0 : busy+=now-since
+			else : idle+=now-since
+			self.log("Rank %d (%s): %d tasks, %1.1f tasks/hr, %1.1f%% idle"%(r,self.rankmap.get(r,"?"),n,n*3600.0/max(busy,1.0e-6),100.0*idle/max(busy+idle,1.0e-6)))
+
+	def request_next(self):
+		"""Worker ranks only. Asks rank 0 for another task to queue behind the current one, and waits for the reply,
+		which is EXEC with the task, NONE if rank 0 has nothing to send, or EXIT"""
+		mpi_eman2_send("NEXT","",0)
+		com,data,src=mpi_eman2_recv(0)
+		if com=="EXEC" : self.pending.append(data)
+		elif com=="EXIT" : self.exitreq=True
+		elif com!="NONE" : print("ERROR: Got mysterious command in reply to NEXT: ",com,data)
+
+	def receive_pending(self):
+		"""Worker ranks only. Receives any messages rank 0 sent while we were busy. EXEC tasks are queued, EXIT is
+		remembered, so we can finish reporting the current task"""
+		while mpi_iprobe(0, MPI_ANY_TAG, MPI_COMM_WORLD) :
+			com,data,src=mpi_eman2_recv(0)
+			if com=="EXEC" : self.pending.append(data)
+			elif com=="EXIT" : self.exitreq=True
+			else : print("ERROR: Got mysterious command during processing: ",com,data)
+
 	def progress_callback(self,prog):
 		""" This gets progress callbacks from the task. We need to make sure we haven't been asked
 		to exit if we get this, and we want to update the progress on rank 0 """
@@ -861,6 +1327,8 @@ class EMMpiClient(object):
 				mpi_eman2_send("OK",0,2)
 				mpi_finalize()
 				sys.exit(0)
+			elif com=="EXEC":
+				self.pending.append(data)		# a prefetched task, we will run it when this one is done
 			else:
 				print("ERROR: Got mysterious command during processing: ",com,data)
 				mpi_finalize()
@@ -1004,7 +1472,10 @@ class EMMpiTaskHandler(object):
 
 		task.taskid=self.maxid
 
-		dump(task,open("%s/%07d"%(self.queuedir,self.maxid),"wb"),-1)
+		# any images in the task are stored as raw binary, and sent to the nodes the same way
+		out=open("%s/%07d"%(self.queuedir,self.maxid),"wb")
+		emdata_write(out,*emdata_dumps(task))
+		out.close()
 		ret=self.maxid
 		self.sendcom("NEWJ",self.maxid)
 		if DBUG : self.mpiout.write("{} customer NEWJ complete {}\n".format(local_datetime(),self.maxid))
@@ -1029,9 +1500,10 @@ class EMMpiTaskHandler(object):
 		if DBUG : self.mpiout.write("{} customer results {}\n".format(local_datetime(),taskid))
 
 		try :
-			task=load(open("%s/%07d"%(self.queuedir,taskid),"rb"))
-			results=load(open("%s/%07d.out"%(self.queuedir,taskid),"rb"))
-			os.unlink("%s/%07d.out"%(self.queuedir,taskid))
+			task=emdata_loads(*emdata_read(open("%s/%07d"%(self.queuedir,taskid),"rb")))
+			# results come directly from rank 0 over the socket rather than through the filesystem
+			if self.sendcom("RSLT",taskid)!="OK" : raise Exception("No results for task %d"%taskid)
+			results=emdata_loads(*emdata_read(self.mpifile))
 			os.unlink("%s/%07d"%(self.queuedir,taskid))
 			del self.completed[taskid]
 		except :
@@ -127,8 +127,8 @@ def parallel_process_exit():
 	# Compete HACK to prevent EMAN2DB creation if one deosn't already exisit. Need to do this b/c when anything in EMAN2PAR gets improted, and EMAN2DB is created!!!
 	if os.access('EMAN2DB',os.R_OK):
 		# Kill any running process from e2paralle.py running on localhost. If none are running nothing happens
-		from EMAN2PAR import EMLocalTaskHandler
-		for proc in list(EMLocalTaskHandler.allrunning.values()):
+		from EMAN2PAR import EMLocalTaskHandler,EMLocalPoolTaskHandler
+		for proc in list(EMLocalTaskHandler.allrunning.values())+list(EMLocalPoolTaskHandler.allworkers.values()):
 			proc.terminate()
 			os.kill(proc.pid,signal.SIGKILL)
 
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from __future__ import division
+#
+# Copyright (c) 2000- Baylor College of Medicine
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston MA 02111-1307 USA
+#
+#
+
+from builtins import range
+from builtins import object
+import threading
+import traceback
+import time
+from collections import deque
+
+######
+# This module implements a fixed size pool of worker threads for programs which run many small jobs on a
+# single machine. Historically each program created one threading.Thread per job up front, then started
+# them one at a time while polling threading.active_count(). That breaks whenever any other thread exists
+# (Qt, the parallelism system, ...), and wastes part of a sleep interval on every job.
+#
+# Typical use:
+#
+#	ex=EMExecutor(options.threads,maxpending=2*options.threads,ordered=True)
+#	for img in ex.map(process_one,range(n)) : img.write_image(out,-1)
+#
+# or, when the caller does not need results streamed back:
+#
+#	ex=EMExecutor(options.threads)
+#	for job in jobs : ex.submit(fn,*job)
+#	ex.join()
+######
+
+class EMExecutor(object):
+	"""A fixed pool of nthreads worker threads running jobs from a queue.
+
+	maxpending limits the number of jobs which have been submitted but whose results have not yet been
+	consumed, so a producer submitting jobs which return (or hold) large EMData objects can't get arbitrarily
+	far ahead of the consumer. submit() blocks when the limit is reached. 0 means no limit. When using a limit,
+	jobs must be submitted from a different thread than the one consuming results, which map() does for you.
+
+	If ordered is set, results() yields results in submission order, otherwise in completion order.
+
+	Exceptions raised by a job, including SystemExit and KeyboardInterrupt, are re-raised in the consumer when its
+	result is reached. cancel() drops all jobs which have not yet started. times[jobid] is [submitted,started,finished]
+	for every job, and stats() summarizes them. Jobs queued with post() rather than submit() keep no result or times,
+	for callers which never consume results."""
+
+	def __init__(self,nthreads,maxpending=0,ordered=False):
+		self.nthreads=max(1,nthreads)
+		self.maxpending=maxpending
+		self.ordered=ordered
+
+		self.cond=threading.Condition()
+		self.jobs=deque()			# (jobid,fn,args,kwargs) not yet started
+		self.done={}				# jobid:(ok,result) finished but not yet consumed
+		self.doneorder=deque()		# completion order, for unordered results
+		self.skipped=set()			# jobids dropped by cancel()
+		self.errors={}				# jobid:traceback string for failed jobs
+		self.times={}
+		self.nextid=0
+		self.nextout=0
+		self.pending=0
+		self.closed=False
+		self.cancelled=False
+		self.starttime=time.time()
+
+		self.workers=[threading.Thread(target=self.worker) for i in range(self.nthreads)]
+		for w in self.workers:
+			w.daemon=True
+			w.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self,typ,value,tb):
+		if typ!=None : self.cancel()
+		self.join()
+		return False
+
+	def submit(self,fn,*args,**kwargs):
+		"""Queues fn(*args,**kwargs) and returns its jobid. Blocks if maxpending jobs are outstanding."""
+		with self.cond:
+			while self.maxpending>0 and self.pending>=self.maxpending and not self.cancelled : self.cond.wait()
+			if self.cancelled or self.closed : raise Exception("EMExecutor: submit() after close() or cancel()")
+			jobid=self.nextid
+			self.nextid+=1
+			self.pending+=1
+			self.jobs.append((jobid,fn,args,kwargs))
+			self.times[jobid]=[time.time(),0,0]
+			self.cond.notify_all()
+		return jobid
+
+	def post(self,fn,*args,**kwargs):
+		"""Queues fn(*args,**kwargs) without keeping its result, so nothing accumulates if results() is never used.
+		Posted jobs don't count towards maxpending, and exceptions are printed rather than re-raised. join() still
+		waits for them."""
+		with self.cond:
+			if self.cancelled or self.closed : raise Exception("EMExecutor: post() after close() or cancel()")
+			self.jobs.append((None,fn,args,kwargs))
+			self.cond.notify_all()
+
+	def worker(self):
+		while True:
+			with self.cond:
+				while len(self.jobs)==0 and not self.closed : self.cond.wait()
+				if len(self.jobs)==0 : return
+				jobid,fn,args,kwargs=self.jobs.popleft()
+				if jobid!=None : self.times[jobid][1]=time.time()
+
+			# posted job, nothing to record
+			if jobid==None :
+				try: fn(*args,**kwargs)
+				except: traceback.print_exc()
+				continue
+
+			# BaseException, since a job calling sys.exit() must not kill the worker without a result, leaving results() waiting forever
+			try: ret=(True,fn(*args,**kwargs))
+			except BaseException as e:
+				self.errors[jobid]=traceback.format_exc()
+				ret=(False,e)
+
+			with self.cond:
+				self.times[jobid][2]=time.time()
+				self.done[jobid]=ret
+				self.doneorder.append(jobid)
+				self.cond.notify_all()
+
+	def close(self):
+		"""No more jobs will be submitted. Workers exit once the queue is empty."""
+		with self.cond:
+			self.closed=True
+			self.cond.notify_all()
+
+	def cancel(self):
+		"""Drops all jobs which haven't started yet and closes the executor. Running jobs are allowed to finish."""
+		with self.cond:
+			for j in self.jobs :
+				if j[0]==None : continue		# posted
+				self.skipped.add(j[0])
+				self.pending-=1
+			self.jobs.clear()
+			self.cancelled=True
+			self.closed=True
+			self.cond.notify_all()
+
+	def results(self,poll=None,interval=0.05):
+		"""Generator yielding (jobid,result) for each job as it becomes available, until the executor has been
+		closed and every result consumed. If poll is specified, it is called every interval seconds while
+		waiting (eg - to keep a GUI responsive), and the executor is cancelled if it returns False."""
+		while True:
+			jobid=None
+			with self.cond:
+				if self.ordered :
+					while self.nextout in self.skipped : self.nextout+=1
+					if self.nextout in self.done :
+						jobid=self.nextout
+						self.nextout+=1
+				else:
+					while len(self.doneorder)>0 and self.doneorder[0] not in self.done : self.doneorder.popleft()
+					if len(self.doneorder)>0 : jobid=self.doneorder.popleft()
+
+				if jobid==None :
+					if self.closed and self.pending==0 : return
+					self.cond.wait(None if poll==None else interval)
+				else:
+					ok,ret=self.done.pop(jobid)
+					self.pending-=1
+					self.cond.notify_all()
+
+			if jobid==None :
+				if poll!=None and not self.cancelled and not poll() : self.cancel()
+				continue
+
+			if not ok :
+				print(self.errors[jobid])
+				raise ret
+			yield jobid,ret
+
+	def map(self,fn,iterable,poll=None):
+		"""Runs fn(x) for each x in iterable, and yields the results (in order if ordered is set). Jobs are
+		submitted from a separate thread, so maxpending provides back-pressure on a lazy iterable. poll is as
+		for results()."""
+		def feed():
+			try:
+				for x in iterable:
+					if self.cancelled : break
+					self.submit(fn,x)
+			except:
+				if not self.cancelled : traceback.print_exc()
+			self.close()
+
+		feeder=threading.Thread(target=feed)
+		feeder.daemon=True
+		feeder.start()
+		for jobid,ret in self.results(poll) : yield ret
+
+	def starmap(self,fn,iterable,poll=None):
+		"""Like map(), but each element of iterable is a tuple of arguments for fn"""
+		return self.map(lambda x:fn(*x),iterable,poll)
+
+	def join(self):
+		"""Closes the executor, waits for all jobs to finish and discards their results. Re-raises the first
+		exception from a job, if any."""
+		self.close()
+		for r in self.results() : pass
+		for w in self.workers : w.join()
+
+	def stats(self):
+		"""Returns a dictionary summarizing the job timing: number of finished jobs, mean queue wait, mean run time,
+		wall time since creation and the fraction of the available thread time spent running jobs"""
+		with self.cond:
+			t=[v for v in list(self.times.values()) if v[2]>0]
+		wall=time.time()-self.starttime
+		if len(t)==0 : return {"jobs":0,"wait":0.0,"run":0.0,"wall":wall,"efficiency":0.0}
+		run=sum([v[2]-v[1] for v in t])
+		return {"jobs":len(t),"wait":sum([v[1]-v[0] for v in t])/len(t),"run":run/len(t),"wall":wall,"efficiency":run/(wall*self.nthreads)}
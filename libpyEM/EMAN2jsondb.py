@@ -50,6 +50,7 @@ import random
 import threading
 import traceback
 import re
+from collections import OrderedDict
 
 from libpyEMData2 import EMData
 from libpyUtils2 import EMUtil
@@ -64,18 +65,21 @@ def js_one_key(url,key):
 
 	return JSDict.one_key(url,key)
 
-def js_open_dict(url):
+def js_open_dict(url,journal=False):
 	"""Opens a JSON file as a dict-like database object. The interface is almost identical to the BDB db_* functions.
 If opened. Writes to JDB dictionaries may be somewhat inefficient due to the lack of a good model (as BDB has) for
 multithreaded access. Default behavior is to write the entire dictionary to disk when any element is changed. File
 locking is attempted to avoid conflicts, but may not work in all situations. read-only access is a meaningless concept
 because file pointers are not held open beyond discrete transations. While it is possible to store images in JSON files
-it is not recommended due to inefficiency, and making files which are difficult to read."""
+it is not recommended due to inefficiency, and making files which are difficult to read.
+
+If journal is set, changes are instead appended to a <url>.journal file, which is periodically folded back into
+the JSON file in the background. This is much faster for large dictionaries which are updated one key at a time."""
 
 	if url[-5:]!=".json" :
 		raise Exception("JSON databases must have .json extension")
 
-	return JSDict.open_db(url)
+	return JSDict.open_db(url,journal)
 
 def js_close_dict(url):
 	"""This will free some resources associated with the database. Not associated with closing a file pointer at present."""
@@ -97,6 +101,8 @@ def js_remove_dict(url):
 	js_close_dict(url)
 	try : os.unlink(url)
 	except OSError: pass
+	try : os.unlink(url+".journal")
+	except OSError: pass
 
 	return
 
@@ -113,6 +119,29 @@ It does not check the contents of the file, just for its exsistence and permissi
 
 	return False
 
+def js_cache_budget(nbytes=None):
+	"""Sets the approximate number of bytes of JSON data which may be held in RAM by open JSON dictionaries, if nbytes is
+specified. Least recently used dictionaries beyond this are closed, and transparently reread if accessed again. The size
+of each dictionary is estimated from the size of its file. The default is 256 MB, or the EMAN2JSONCACHE environment
+variable in MB. Returns the current budget."""
+
+	if nbytes!=None :
+		JSDict.cachebudget=int(nbytes)
+		JSDict.evict()
+
+	return JSDict.cachebudget
+
+def js_cache_stats():
+	"""Returns a dictionary with hits, misses and evictions of the JSON dictionary cache, as well as the number of
+dictionaries held in RAM and their estimated total size in bytes"""
+
+	with JSDict.lrulock:
+		ret=dict(JSDict.cachestats)
+		ret["open"]=len(JSDict.lru)
+		ret["bytes"]=JSDict.cachetotal
+
+	return ret
+
 def js_list_dicts(url):
 	"""Gives a list of readable json files at a given path."""
 
@@ -541,15 +570,23 @@ class JSDict(object):
 	"""This class provides dict-like access to a JSON file on disk. It goes to some lengths to insure thread/process-safety, even if
 performance must be sacrificed. The only case where it may not work is when a remote filesystem which doesn't obey file-locking is used.
 Note that when opened, the entire JSON file is read into memory. For this reason (and others) it is not a good idea to store (many) images
-in JSON files. JSDict objects are cached in RAM, and will not be removed from the cache unless the close() method is called, or too many
-JSDicts are open at one time."""
+in JSON files. JSDict objects are cached in RAM, and will not be removed from the cache unless the close() method is called, or the
+JSDicts which are open exceed cachebudget bytes (see js_cache_budget), in which case the least recently used are closed."""
 
 	opendicts={}
 	lock=threading.Lock()		# to make this section threadsafe
 
+	lru=OrderedDict()			# key=normpath, value=JSDict for dicts with data in RAM, least recently used first
+	lrulock=threading.Lock()
+	cachetotal=0				# estimated total size of the dicts in lru, in bytes
+	cachebudget=int(float(os.getenv("EMAN2JSONCACHE","256"))*1048576)
+	cachestats={"hits":0,"misses":0,"evictions":0}
+	journalmin=1048576			# journals are not compacted until they are at least this large (bytes), or as large as the JSON file
+
 	@classmethod
-	def open_db(cls,path=None):
-		"""This should be used to create a JSDict instance. It caches already open dictionaries to avoid redundancy and conflicts."""
+	def open_db(cls,path=None,journal=False):
+		"""This should be used to create a JSDict instance. It caches already open dictionaries to avoid redundancy and conflicts.
+		If journal is set, changes are appended to a journal file rather than rewriting the whole JSON file (see js_open_dict)."""
 
 		cls.lock.acquire()
 
@@ -566,10 +603,11 @@ JSDicts are open at one time."""
 			raise Exception("Cannot find path for {}".format(path))
 
 		if normpath in cls.opendicts :
+			if journal : cls.opendicts[normpath].journal=True
 			cls.lock.release()
 			return cls.opendicts[normpath]
 
-		try : ret=JSDict(path)
+		try : ret=JSDict(path,journal)
 		except:
 			cls.lock.release()
 			traceback.print_exc()
@@ -617,7 +655,7 @@ JSDicts are open at one time."""
 
 		return ret
 
-	def __init__(self,path=None):
+	def __init__(self,path=None,journal=False):
 		"""This is a dict-like representation of a JSON file on disk. Warning, the entire file contents are parsed and held
 in memory for efficient access. File change monitoring and file locking is used to insure self-consistency across processes.
 Due to JSON module, there may be some data types which aren't permitted as values. While this module may be used like a traditional
@@ -625,7 +663,11 @@ dictionary for the most part, for efficiency, you may consider using the setval(
 synchronization with the disk file.
 
 There is no name/path separation as existed with BDB objects. 'path' is a full path to the .json file. A normalized version
-of the path is stored as self.normpath"""
+of the path is stored as self.normpath
+
+If journal is set, changes are appended to <path>.journal rather than rewriting the whole file. Readers always apply any
+journal entries, regardless of their own mode. Once the journal grows beyond journalmin bytes and the size of the JSON file,
+it is merged back into the JSON file in a background thread, so the JSON file remains readable by other tools."""
 
 		from EMAN2 import e2getcwd
 
@@ -639,6 +681,14 @@ of the path is stored as self.normpath"""
 		self.delkeys=set()				# a set of keys to delete on next update
 		self.lasttime=0					# last time the database was accessed
 
+		self.journal=journal			# if set, changes are appended to the journal rather than rewriting the file
+		self.journalpath=self.normpath+".journal"
+		self.journalpos=0				# how far into the journal we have already applied to self.data
+		self.journallock=threading.Lock()	# file locks don't exclude threads in the same process, so the journal needs this too
+		self.compactor=None				# background compaction thread, if running
+
+		self.cachedsize=0				# size counted in JSDict.cachetotal while we are in JSDict.lru
+
 		self.busy=False					# used for some degree of threadsafety to supplement file locking
 		self.sync()
 		JSDict.opendicts[self.normpath]=self	# add ourselves to the cache
@@ -652,16 +702,60 @@ of the path is stored as self.normpath"""
 		"""This will free effectively all of the memory associated with the object. It doesn't actually eliminate
 		the object entirely since there may be multiple copies around. If the dictionary is accessed again, it will
 		be automatically reopened."""
-		if len(self.changes)>0 or len(self.delkeys): self.sync()
+		if len(self.changes)>0 or len(self.delkeys): self.sync(cache=False)	# we're about to leave the LRU, don't rejoin it
 		self.lasttime=0
 		self.data={}
 #		del JSDict.opendicts[self.normpath]
 
-	def sync(self):
-		"""This is where all of the JSON file access occurs. This one routine handles both reading and writing, with file locking"""
+		with JSDict.lrulock:
+			if JSDict.lru.pop(self.normpath,None)!=None : JSDict.cachetotal-=self.cachedsize
+			self.cachedsize=0
+
+	def touch(self,loaded):
+		"""Marks this dict as the most recently used. loaded indicates whether the data had to be read from disk
+		because it wasn't in RAM. Then closes least recently used dicts as needed to stay within the budget."""
+
+		with JSDict.lrulock:
+			JSDict.cachestats["misses" if loaded else "hits"]+=1
+			if JSDict.lru.pop(self.normpath,None)!=None : JSDict.cachetotal-=self.cachedsize
+			self.cachedsize=self.filesize+self.journalpos
+			JSDict.lru[self.normpath]=self
+			JSDict.cachetotal+=self.cachedsize
+
+		if JSDict.cachetotal>JSDict.cachebudget : JSDict.evict()
+
+	@classmethod
+	def evict(cls):
+		"""Closes the least recently used dicts until the total is within cachebudget. The most recently used dict is
+		always kept, and dicts another thread is in the middle of using are skipped. Closed dicts are reread automatically
+		if used again."""
+
+		victims=[]
+		with cls.lrulock:
+			total=cls.cachetotal
+			last=next(reversed(cls.lru),None)
+			for normpath,d in list(cls.lru.items()):
+				if total<=cls.cachebudget : break
+				if normpath==last or d.busy : continue
+				# removing the victims here keeps a concurrent evict() from picking them too
+				del cls.lru[normpath]
+				cls.cachetotal-=d.cachedsize
+				total-=d.cachedsize
+				victims.append(d)
+
+		# close() may need to write pending changes, so we can't hold the lock
+		for d in victims:
+			if d.busy : continue		# picked up by another thread since; its sync() will put it back in the LRU
+			d.close()
+			with cls.lrulock: cls.cachestats["evictions"]+=1
+
+	def sync(self,cache=True):
+		"""This is where all of the JSON file access occurs. This one routine handles both reading and writing, with file locking.
+		cache=False skips marking the dict as recently used, for close(), which is about to remove it from the LRU."""
 
 		while self.busy: time.sleep(.1)		# this is for some degree of threadsafety beyond file locking
 		self.busy=True
+		loaded=(self.lasttime==0)			# if we were closed or just opened, this is a cache miss
 
 		# We check for the _tmp file first
 		try:
@@ -698,9 +792,15 @@ of the path is stored as self.normpath"""
 					mt=time.time()
 
 
+		# If the journal has shrunk, it was compacted into the file, even if the file mtime didn't visibly change
+		try:
+			if os.stat(self.journalpath).st_size<self.journalpos : self.lasttime=0
+		except: pass
+
 		### Read entire dict from file
 		# If we have unprocessed changes, or if the file has changed since last access
-		if len(self.changes)>0 or mt>self.lasttime :
+		# In journal mode, changes are merged through the journal, so we don't need to reread to write
+		if (len(self.changes)>0 and not self.journal) or mt>self.lasttime :
 			jfile=open(self.normpath,"r")		# open the file
 			file_lock(jfile,readonly=True)		# lock it for reading
 
@@ -718,13 +818,32 @@ of the path is stored as self.normpath"""
 			self.filesize=jfile.tell()			# our location after reading the data from the file
 			file_unlock(jfile)					# unlock the file
 			jfile=None							# implicit close
+			self.journalpos=0					# the journal is relative to the file we just read
+
+		### Apply anything other processes have appended to the journal since we last looked
+		self.read_journal()
+
+		### Append our changes to the journal
+		if self.journal and (len(self.changes)>0 or len(self.delkeys)>0):
+			self.write_journal()
 
 		### Write entire dict to file
 		# If we have unprocessed changes, we need to apply them and write back to disk
-		if len(self.changes)>0 or len(self.delkeys)>0:
+		elif len(self.changes)>0 or len(self.delkeys)>0:
+			# If there is a journal, we hold it locked through the write, since the new file will include its contents
+			jrnl=None
+			if os.path.exists(self.journalpath) :
+				self.journallock.acquire()
+				jrnl=open(self.journalpath,"r+b")
+				file_lock(jrnl,readonly=False)
+				self.journalpos=self.apply_journal(jrnl,pos=self.journalpos)
+
 			try:
 				os.rename(self.normpath,self.normpath[:-5]+"_tmp.json")		# we back up the original file, just in case
 			except:
+				if jrnl!=None :
+					file_unlock(jrnl)
+					self.journallock.release()
 				raise Exception("WARNING: file '{}' cannot be created, conflict in writing JSON files. You may consider reporting this if you don't know why this happened.".format(self.normpath[:-3]+"_tmp.json"))
 
 			### We do the updates and prepare the string in-ram. If someone else tries a write while we're doing this, it should raise the above exception
@@ -736,6 +855,7 @@ of the path is stored as self.normpath"""
 			self.delkeys=set()
 			jss=json.dumps(self.data,indent=0,sort_keys=True,default=obj_to_json,encoding="ascii")			# write the whole dictionary back to disk
 			jss=re.sub(listrex,denl,jss)
+			self.filesize=len(jss)
 
 			### We do the actual write as a rapid sequence to avoid conflicts
 			jfile=open(self.normpath,"w")
@@ -745,11 +865,112 @@ of the path is stored as self.normpath"""
 			jfile=None
 			os.unlink(self.normpath[:-5]+"_tmp.json")
 
+			# The file now contains everything that was in the journal
+			if jrnl!=None :
+				jrnl.truncate(0)
+				file_unlock(jrnl)
+				jrnl=None
+				self.journallock.release()
+				self.journalpos=0
+
 		self.lasttime=os.stat(self.normpath).st_mtime	# make sure we include our recent change, if made
 		self.busy=False
+		if cache : self.touch(loaded)
+
+	def apply_journal(self,jfile,data=None,pos=0):
+		"""Applies the journal entries in the open (and locked) jfile starting at byte pos to data (self.data by default).
+		Returns the position after the last complete entry."""
+		if data==None : data=self.data
+		jfile.seek(pos)
+		for l in jfile.read().split(b"\n"):
+			if len(l)==0 : continue		# only the last (empty) line should be incomplete, since writes are locked
+			ent=json.loads(l.decode("utf-8"),object_hook=json_to_obj)
+			if "d" in ent :
+				try: del data[ent["d"]]
+				except: pass
+			else : data[ent["k"]]=ent["v"]
+		return jfile.tell()
+
+	def read_journal(self):
+		"""Applies any journal entries added since we last read the journal"""
+		try: jsize=os.stat(self.journalpath).st_size
+		except: return
+		if jsize==self.journalpos : return
+
+		with self.journallock:
+			jfile=open(self.journalpath,"rb")
+			file_lock(jfile,readonly=True)
+			self.journalpos=self.apply_journal(jfile,pos=self.journalpos)
+			file_unlock(jfile)
+
+	def write_journal(self):
+		"""Appends pending changes to the journal, each as a single line of JSON. Any entries added by other processes since
+		we last looked are applied first, so our changes take precedence."""
+		with self.journallock:
+			jfile=open(self.journalpath,"a+b")
+			file_lock(jfile,readonly=False)
+			self.journalpos=self.apply_journal(jfile,pos=self.journalpos)
+
+			ents=[json.dumps({"k":k,"v":v},default=obj_to_json) for k,v in self.changes.items()]
+			ents.extend([json.dumps({"d":k}) for k in self.delkeys])
+			self.data.update(self.changes)
+			for k in self.delkeys:
+				try: del self.data[k]
+				except: pass
+			self.changes={}
+			self.delkeys=set()
+
+			jfile.seek(0,2)
+			jfile.write(("\n".join(ents)+"\n").encode("utf-8"))
+			jfile.flush()
+			self.journalpos=jfile.tell()
+			file_unlock(jfile)
+			jfile=None
+
+		if self.journalpos>max(JSDict.journalmin,self.filesize) and (self.compactor==None or not self.compactor.is_alive()):
+			self.compactor=threading.Thread(target=self.compact)
+			self.compactor.daemon=True
+			self.compactor.start()
+
+	def compact(self):
+		"""Merges the journal into the JSON file and empties the journal. This works entirely from the files on disk rather than
+		self.data, so it is safe to run in a background thread."""
+		try:
+			with self.journallock:
+				jfile=open(self.journalpath,"r+b")
+				file_lock(jfile,readonly=False)		# this keeps other processes from appending until we are done
+
+				mfile=open(self.normpath,"r")
+				file_lock(mfile,readonly=True)
+				try: data=json.load(mfile,object_hook=json_to_obj)
+				except: data={}			# empty file
+				file_unlock(mfile)
+				mfile=None
+
+				self.apply_journal(jfile,data)
+
+				jss=json.dumps(data,indent=0,sort_keys=True,default=obj_to_json)
+				jss=re.sub(listrex,denl,jss)
+
+				# same backup sequence as sync()
+				os.rename(self.normpath,self.normpath[:-5]+"_tmp.json")
+				mfile=open(self.normpath,"w")
+				file_lock(mfile,readonly=False)
+				mfile.write(jss)
+				file_unlock(mfile)
+				mfile=None
+				os.unlink(self.normpath[:-5]+"_tmp.json")
+
+				jfile.truncate(0)
+				file_unlock(jfile)
+				jfile=None
+		except:
+			print("Warning: unable to compact journal {}, will try again later".format(self.journalpath))
+			traceback.print_exc()
 
 	def __len__(self):
 		"""Ignores any pending updates for speed"""
+		if self.lasttime==0 : self.sync()		# if DB is closed, sync anyway
 		return len(self.data)
 
 
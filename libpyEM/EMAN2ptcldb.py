@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from __future__ import division
+#
+# Copyright (c) 2000- Baylor College of Medicine
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston MA 02111-1307 USA
+#
+#
+
+from builtins import range
+from builtins import object
+import os
+import os.path
+from ast import literal_eval
+import numpy as np
+from libpyTransform2 import Transform
+from EMAN2jsondb import js_open_dict
+
+######
+# This module implements a columnar store for per-particle alignment results, as an alternative to the
+# particle_parms_XX.json files written by e2spt_align, e2a2d_align, etc. Each of those files holds one
+# JSON dictionary per particle keyed by "('file', n)", which is fine for a few thousand particles, but
+# becomes very slow to load and filter with hundreds of thousands. Here, the same information is kept as
+# a set of parallel numpy arrays in a single uncompressed .npz file next to the .json file:
+#
+# fidx   - int32 index into the 'files' array of particle stack filenames
+# ptcl   - int32 particle number within the stack
+# xform  - float64 Nx12, Transform.get_matrix() for each particle
+# score  - float32 alignment score
+# cls    - int32 class number, -1 if unassigned
+# extra  - object, a dictionary of any other keys in the JSON entry, or None
+#
+# The store is read and written all at once, and filtering is done on the arrays with numpy. PtclDictView
+# provides a read/write dict-like view of a store with the same keys and values as the JSON file, so
+# existing programs can switch with a one line change (ptcl_open_dict instead of js_open_dict). Changes
+# made through the view are written to the JSON file as well as the store, so programs reading the JSON
+# file directly still see them. The store records the modification time and size of the JSON file and its
+# journal when it was made, and is rebuilt from the JSON file if either has changed since.
+######
+
+def ptcl_store_path(path):
+	"""Returns the filename of the columnar store corresponding to a particle_parms .json file"""
+	if path[-5:]==".json" : path=path[:-5]
+	if path[-4:]!=".npz" : path+=".npz"
+	return path
+
+def ptcl_key(fsp,n):
+	"""Returns the string key used for particle n in file fsp in the JSON files"""
+	return str((fsp,int(n)))
+
+def ptcl_json_signature(path):
+	"""Returns [mtime,size] of a .json file followed by [mtime,size] of its JSDict journal, -1 for missing files"""
+	ret=[]
+	for fsp in (path,path+".journal"):
+		try:
+			st=os.stat(fsp)
+			ret.extend((st.st_mtime,st.st_size))
+		except OSError: ret.extend((-1,-1))
+	return ret
+
+def _ptcl_column(name):
+	"""Property exposing the first len() rows of the underlying (possibly larger) array of a PtclStore column"""
+	def get(self): return getattr(self,"_"+name)[:self.n]
+	def put(self,val): setattr(self,"_"+name,val)
+	return property(get,put)
+
+class PtclStore(object):
+	"""A columnar store of per-particle alignment parameters. All columns are numpy arrays of the same length,
+	and may be modified directly, but call reindex() after changing 'files','fidx' or 'ptcl' in place.
+	xfkey is the name of the Transform attribute this represents (xform.align3d, xform.align2d, ...).
+	source is the ptcl_json_signature() of the JSON file the store was made from, if any."""
+
+	columns=("fidx","ptcl","xform","score","cls","extra")
+	fidx=_ptcl_column("fidx")
+	ptcl=_ptcl_column("ptcl")
+	xform=_ptcl_column("xform")
+	score=_ptcl_column("score")
+	cls=_ptcl_column("cls")
+	extra=_ptcl_column("extra")
+
+	def __init__(self,files=None,fidx=None,ptcl=None,xform=None,score=None,cls=None,xfkey="xform.align3d",extra=None,source=None):
+		n=0 if ptcl is None else len(ptcl)
+		self.n=n
+		self.files=np.array([] if files is None else files,dtype=str)
+		self.fidx=np.zeros(n,dtype=np.int32) if fidx is None else np.asarray(fidx,dtype=np.int32)
+		self.ptcl=np.zeros(n,dtype=np.int32) if ptcl is None else np.asarray(ptcl,dtype=np.int32)
+		self.xform=np.zeros((n,12)) if xform is None else np.asarray(xform,dtype=np.float64).reshape((n,12))
+		self.score=np.zeros(n,dtype=np.float32) if score is None else np.asarray(score,dtype=np.float32)
+		self.cls=np.full(n,-1,dtype=np.int32) if cls is None else np.asarray(cls,dtype=np.int32)
+		self.extra=np.full(n,None,dtype=object) if extra is None else np.asarray(extra,dtype=object)
+		self.xfkey=xfkey
+		self.source=source
+		self.reindex()
+
+	def __len__(self):
+		return self.n
+
+	@classmethod
+	def read(cls,path):
+		"""Reads a store written by write(). path may be the .npz file or the corresponding .json file"""
+		with np.load(ptcl_store_path(path),allow_pickle=True) as f:
+			extra=f["extra"] if "extra" in f.files else None
+			source=list(f["source"]) if "source" in f.files else None
+			return cls(f["files"],f["fidx"],f["ptcl"],f["xform"],f["score"],f["cls"],str(f["xfkey"]),extra,source)
+
+	def write(self,path):
+		"""Writes the store to path (.npz, or the corresponding .json name). The file is replaced atomically,
+		so readers never see a partial store."""
+		path=ptcl_store_path(path)
+		tmppath=path[:-4]+"_tmp.npz"
+		cols=dict(files=self.files,fidx=self.fidx,ptcl=self.ptcl,xform=self.xform,score=self.score,cls=self.cls,extra=self.extra,xfkey=np.array(self.xfkey))
+		if self.source is not None : cols["source"]=np.array(self.source,dtype=np.float64)
+		with open(tmppath,"wb") as f:
+			np.savez(f,**cols)
+		os.rename(tmppath,path)
+
+	def reindex(self):
+		"""Rebuilds the key->row lookup. Called automatically when rows are removed, rows added by set() and
+		append() are indexed as they are added"""
+		self.rows=dict(((str(self.files[f]),int(p)),i) for i,(f,p) in enumerate(zip(self.fidx,self.ptcl)))
+
+	def _grow(self,n):
+		"""Makes room for n more rows. The underlying arrays grow geometrically, so adding particles one at a
+		time with set() is amortized O(1)"""
+		need=self.n+n
+		cap=len(self._ptcl)
+		if need<=cap : return
+		cap=max(need,2*cap,16)
+		for c in self.columns:
+			old=getattr(self,"_"+c)
+			new=np.zeros((cap,)+old.shape[1:],dtype=old.dtype)
+			new[:self.n]=old[:self.n]
+			setattr(self,"_"+c,new)
+
+	def file_index(self,fsp):
+		"""Returns the index of fsp in 'files', adding it if necessary"""
+		w=np.nonzero(self.files==fsp)[0]
+		if len(w)>0 : return int(w[0])
+		self.files=np.append(self.files,fsp)
+		return len(self.files)-1
+
+	def row(self,fsp,n):
+		"""Returns the row number for particle n in file fsp, or None"""
+		return self.rows.get((fsp,int(n)))
+
+	def keys(self):
+		"""Returns (filename,particle number) tuples for every row, in row order"""
+		return [(str(self.files[f]),int(p)) for f,p in zip(self.fidx,self.ptcl)]
+
+	def transform(self,i):
+		"""Returns the Transform for row i"""
+		ret=Transform()
+		ret.set_matrix([float(v) for v in self.xform[i]])
+		return ret
+
+	def transforms(self,rows=None):
+		"""Returns a list of Transforms for the specified rows (all by default)"""
+		if rows is None : rows=range(len(self))
+		return [self.transform(i) for i in rows]
+
+	def set(self,fsp,n,xform=None,score=None,cls=None,extra=None):
+		"""Sets the values for one particle, adding a row if it isn't present. xform may be a Transform or 12 floats.
+		extra, if specified, replaces the dictionary of other keys for the particle"""
+		i=self.row(fsp,n)
+		if i is None :
+			i=self.n
+			self._grow(1)
+			self._fidx[i]=self.file_index(fsp)
+			self._ptcl[i]=n
+			self._xform[i]=0
+			self._score[i]=0
+			self._cls[i]=-1
+			self._extra[i]=None
+			self.n+=1
+			self.rows[(fsp,int(n))]=i
+		if xform is not None :
+			if isinstance(xform,Transform) : xform=xform.get_matrix()
+			self.xform[i]=xform
+		if score is not None : self.score[i]=score
+		if cls is not None : self.cls[i]=cls
+		if extra is not None : self.extra[i]=extra if len(extra)>0 else None
+
+	def append(self,fsps,ptcls,xforms,scores,clss=None,extras=None):
+		"""Appends many rows at once. fsps may be a single filename or one per row. xforms is Nx12 or a list of Transforms.
+		extras is an optional list of dictionaries of other keys, one per row"""
+		n=len(ptcls)
+		if n==0 : return
+		if isinstance(fsps,str) : fsps=[fsps]*n
+		xforms=[x.get_matrix() if isinstance(x,Transform) else x for x in xforms]
+		fidx=dict((fsp,self.file_index(fsp)) for fsp in set(fsps))
+		i0=self.n
+		self._grow(n)
+		self._fidx[i0:i0+n]=[fidx[f] for f in fsps]
+		self._ptcl[i0:i0+n]=ptcls
+		self._xform[i0:i0+n]=np.asarray(xforms,dtype=np.float64).reshape((n,12))
+		self._score[i0:i0+n]=scores
+		self._cls[i0:i0+n]=-1 if clss is None else clss
+		self._extra[i0:i0+n]=None
+		if extras is not None :
+			for i,e in enumerate(extras):
+				if e : self._extra[i0+i]=e
+		self.n+=n
+		for i,(fsp,p) in enumerate(zip(fsps,ptcls)) : self.rows[(fsp,int(p))]=i0+i
+
+	def select(self,mask):
+		"""Returns a new PtclStore containing only the rows selected by mask (a boolean array or list of row numbers)"""
+		return PtclStore(self.files,self.fidx[mask],self.ptcl[mask],self.xform[mask],self.score[mask],self.cls[mask],self.xfkey,self.extra[mask])
+
+	def filenames(self):
+		"""Returns the particle stack filename for every row as an array"""
+		return self.files[self.fidx]
+
+	def alt(self):
+		"""Returns the EMAN altitude (degrees) of every transform, computed from the matrices without making Transform objects"""
+		return np.degrees(np.arccos(np.clip(self.xform[:,10]/np.linalg.norm(self.xform[:,8:11],axis=1),-1.0,1.0)))
+
+	def to_dict(self,i):
+		"""Returns row i in the same form as the corresponding JSON entry"""
+		ret={} if self.extra[i] is None else dict(self.extra[i])
+		ret[self.xfkey]=self.transform(i)
+		ret["score"]=float(self.score[i])
+		if self.cls[i]>=0 : ret["class"]=int(self.cls[i])
+		return ret
+
+	@classmethod
+	def from_dict(cls,dct,xfkey=None):
+		"""Builds a store from a JSDict or dictionary of particle_parms style entries. If xfkey is not specified, the first
+		key starting with 'xform.' in the first entry is used. Entries without a transform are skipped. Keys other than
+		the transform, "score" and "class" are kept in the 'extra' column."""
+		keys=list(dct.keys())
+		vals=[dct[k] for k in keys]
+		if xfkey is None :
+			xfkey="xform.align3d"
+			for v in vals:
+				xks=[k for k in v if k.startswith("xform.")]
+				if len(xks)>0 :
+					xfkey=xks[0]
+					break
+
+		fsps,ptcls,xforms,scores,clss,extras=[],[],[],[],[],[]
+		for k,v in zip(keys,vals):
+			if xfkey not in v : continue
+			fsp,n=literal_eval(k) if isinstance(k,str) else k
+			fsps.append(fsp)
+			ptcls.append(n)
+			xforms.append(v[xfkey].get_matrix())
+			scores.append(v.get("score",0))
+			clss.append(v.get("class",-1))
+			extras.append(dict((ek,ev) for ek,ev in v.items() if ek not in (xfkey,"score","class")))
+
+		ret=cls(xfkey=xfkey)
+		ret.append(fsps,ptcls,xforms,scores,clss,extras)
+		return ret
+
+def ptcl_convert_json(path,xfkey=None,outpath=None):
+	"""Converts a particle_parms style .json file into a columnar store (by default next to the .json file)
+	and returns the PtclStore"""
+	if path[-4:]==".npz" : path=path[:-4]+".json"
+	store=PtclStore.from_dict(js_open_dict(path),xfkey)
+	store.source=ptcl_json_signature(path)
+	if outpath is None : outpath=path
+	store.write(outpath)
+	return store
+
+def ptcl_open_store(path,xfkey=None):
+	"""Returns a PtclStore for a particle_parms .json file. The .npz store is used if it exists and neither the .json
+	file nor its journal has changed since it was made, otherwise the .json file is converted first."""
+	npz=ptcl_store_path(path)
+	json=npz[:-4]+".json"
+	if os.path.exists(npz) :
+		if not os.path.exists(json) : return PtclStore.read(npz)
+		store=PtclStore.read(npz)
+		if store.source is not None :
+			if list(store.source)==ptcl_json_signature(json) : return store
+		# stores from before the signature was recorded
+		elif os.path.getmtime(npz)>=max([os.path.getmtime(f) for f in (json,json+".journal") if os.path.exists(f)]) :
+			return store
+	return ptcl_convert_json(json,xfkey)
+
+class PtclDictView(object):
+	"""A dictionary-like view of a PtclStore which behaves like the JSDict of the corresponding particle_parms
+	.json file. Keys are "('file', n)" strings (tuples are also accepted) and values are dictionaries containing
+	the transform, "score", if assigned, "class", and any other keys of the JSON entry. Assignments update the store
+	in memory, and are written to both the .json file and the store by sync() or close()."""
+
+	def __init__(self,store,path=None):
+		self.store=store
+		self.path=path
+		self.changed=set()			# keys assigned since the last sync()
+
+	def __len__(self):
+		return len(self.store)
+
+	def __contains__(self,key):
+		return self.store.row(*self.parsekey(key)) is not None
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __getitem__(self,key):
+		i=self.store.row(*self.parsekey(key))
+		if i is None : raise KeyError(key)
+		return self.store.to_dict(i)
+
+	def __setitem__(self,key,val):
+		fsp,n=self.parsekey(key)
+		extra=dict((k,v) for k,v in val.items() if k not in (self.store.xfkey,"score","class"))
+		self.store.set(fsp,n,val.get(self.store.xfkey),val.get("score"),val.get("class"),extra)
+		self.changed.add((fsp,int(n)))
+
+	def parsekey(self,key):
+		if isinstance(key,str) : return literal_eval(key)
+		return key
+
+	def keys(self):
+		return [ptcl_key(fsp,n) for fsp,n in self.store.keys()]
+
+	def values(self):
+		return [self.store.to_dict(i) for i in range(len(self.store))]
+
+	def items(self):
+		return list(zip(self.keys(),self.values()))
+
+	def get(self,key,dfl=None):
+		try: return self[key]
+		except KeyError: return dfl
+
+	def setval(self,key,val,deferupdate=False):
+		self[key]=val
+
+	def update(self,newdict):
+		for k in newdict : self[k]=newdict[k]
+
+	def sync(self):
+		if len(self.changed)>0 and self.path is not None :
+			# the .json file is still what most programs read, so it gets the changes too
+			json=ptcl_store_path(self.path)[:-4]+".json"
+			jsd=js_open_dict(json)
+			jsd.update(dict((ptcl_key(fsp,n),self.store.to_dict(self.store.row(fsp,n))) for fsp,n in self.changed))
+			jsd.close()
+			self.store.source=ptcl_json_signature(json)
+			self.store.write(self.path)
+			self.changed=set()
+
+	def close(self):
+		self.sync()
+
+def ptcl_open_dict(path,xfkey=None):
+	"""Drop-in replacement for js_open_dict() on particle_parms .json files. Returns a PtclDictView on the
+	columnar store, converting the .json file on first use."""
+	return PtclDictView(ptcl_open_store(path,xfkey),ptcl_store_path(path))
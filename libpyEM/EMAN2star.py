@@ -33,10 +33,12 @@ from __future__ import division
 #
 
 from builtins import range
+from builtins import object
 import os
 import os.path
 import re
 import traceback
+import numpy as np
 
 #from libpyEMData2 import EMData
 #from libpyUtils2 import EMUtil
@@ -51,7 +53,8 @@ import traceback
 # The STAR file is represented as a dictionary-like abstraction of the physical file on disk. 
 # Changes to the abstract object will be syncronized with the file when only explicitly requested.
 # The entire file is kept in RAM, and the file is only re-read from disk if 'readfile()' is
-# explicitly called (which will overwrite any changes in memory). 
+# explicitly called (which will overwrite any changes in memory). For files too large to fit
+# in RAM, StarFile.iterloop() will return loop data a chunk of rows at a time.
 #
 # There is no support for schema, or constrained datatypes for values. Values may be int, float or string.
 #
@@ -60,11 +63,18 @@ import traceback
 #
 # keys have the leading "_" stripped off
 #
-# loop values are represented as a python list. keys from the same loop should have an identical number
-# of elements. loops are identified internally as a list of lists (self.loop) independent of the
-# actual data storage.
+# loop values are represented as a NumPy array for each key, int64 if every value in the column is an integer,
+# float64 if every value is a number, and a string array otherwise. keys from the same loop should have an
+# identical number of elements. loops are identified internally as a list of lists (self.loops) independent
+# of the actual data storage.
+#
+# Each data_ block is stored as a StarBlock in self.blocks. The StarFile dictionary itself contains the
+# first block (eg - in a Relion 3.1 file, data_optics is in blocks[0] and data_particles in blocks[1])
 ######
 
+# a quoted value must begin after whitespace and end before whitespace, so O5' is a single unquoted value
+matcher=re.compile(r"""(?<!\S)"(.*?)"(?!\S)|(?<!\S)'(.*?)'(?!\S)|(\S+)""")
+
 def goodval(vals): 
 	val=max(vals)
 	try: val=int(val)
@@ -73,118 +83,244 @@ def goodval(vals):
 		except: pass
 	return val
 
+def star_value(s):
+	"""Converts a single (non-loop) value string to int, float or string"""
+	if s[0] in ("'",'"') : return s[1:-1]		# we assume the last non-whitespace character is the ending delimeter
+	try: return int(s)
+	except:
+		try: return float(s)
+		except: return s			# if not an int or a float, must be a simple value string
+
+def star_tokens(lines):
+	"""Splits a list of loop data lines into a list of value strings, removing quotes"""
+	s=" ".join(lines)
+	if not ("'" in s or '"' in s) : return s.split()
+	return [m.group(3) if m.group(3)!=None else m.group(1) if m.group(1)!=None else m.group(2) for m in matcher.finditer(s)]
+
+def star_column(vals):
+	"""Converts a list of value strings from a single loop column to a NumPy array. Type inference is done
+	once for the whole column."""
+	for t in (np.int64,np.float64):
+		try:
+			if len(vals)>0 : t(vals[0])			# cheap test before converting the whole column
+			return np.array(vals,dtype=t)
+		except ValueError: pass
+	return np.array(vals)
+
+def star_concatenate(arrays):
+	"""Concatenates column chunks, which may have been assigned different types"""
+	if len(arrays)==1 : return arrays[0]
+	if any([a.dtype.kind in "SU" for a in arrays]) : arrays=[a.astype(str) for a in arrays]
+	return np.concatenate(arrays)
+
+def star_textfield(first,lines):
+	"""Reads a ;-delimited multi-line text value. first is the line beginning with ';'"""
+	val=[first[1:]]
+	while 1:
+		try: line=next(lines)
+		except StopIteration: raise Exception("StarFile: Error found parsing multi-line string value")
+		if line[0]==';' : break
+		val.append(line)
+	val[-1]=val[-1].rstrip()		# remove trailing whitespace on the last line
+	return "".join(val)
+
+def star_parse(fin,chunksize=100000):
+	"""Generator parsing an open STAR file. Yields ("data",name), ("value",key,value), ("loop",[keys]) and
+	("rows",[column arrays]) tuples in file order. The rows of each loop are yielded in chunks of up to chunksize lines."""
+	lines=iter(fin)
+	loop=None			# keys of the loop currently being read
+	inheader=False		# still reading the keys for loop
+	pending=[]			# loop data lines not yet split into values
+	toks=[]				# loop values not yet forming complete rows
+
+	def rows():
+		nk=len(loop)
+		n=len(toks)//nk
+		if n==0 : return None
+		a=toks[:n*nk]
+		del toks[:n*nk]
+		return ("rows",[star_column(a[i::nk]) for i in range(nk)])
+
+	for line in lines:
+		s=line.strip()
+		if len(s)==0 : continue
+		c=s[0]
+		if c=="#" : continue
+
+		if loop!=None :
+			# fast path for ordinary loop data
+			if not inheader and c not in "_;lLdD" :
+				pending.append(s)
+				if len(pending)>=chunksize :
+					toks.extend(star_tokens(pending))
+					pending=[]
+					r=rows()
+					if r!=None : yield r
+				continue
+			if inheader and c=="_" :
+				loop.append(s.split()[0][1:])
+				continue
+			if inheader :
+				yield ("loop",loop)
+				inheader=False
+			if c!="_" and s[:5].lower() not in ("loop_","data_") :
+				if c==";" :
+					toks.extend(star_tokens(pending))
+					pending=[]
+					toks.append(star_textfield(line,lines))
+				else :
+					pending.append(s)
+					if len(pending)>=chunksize :
+						toks.extend(star_tokens(pending))
+						pending=[]
+						r=rows()
+						if r!=None : yield r
+				continue
+
+			# end of the loop
+			toks.extend(star_tokens(pending))
+			pending=[]
+			r=rows()
+			if r!=None : yield r
+			if len(toks)>0 : raise Exception("StarFile: number of values in loop ({}) is not a multiple of the number of keys".format(",".join(loop)))
+			loop=None
+
+		if s[0]=="_" :				# A single key/value pair
+			spl=s.split(None,1)		# split on whitespace
+			key=spl[0][1:]
+			if len(spl)==2 : yield ("value",key,star_value(spl[1]))
+			else:						# value starts on next line
+				line2=next(lines)
+				while len(line2.strip())==0 : line2=next(lines)
+				if line2[0]==";" : yield ("value",key,star_textfield(line2,lines))
+				else: yield ("value",key,star_value(line2.strip()))
+		elif s[:5].lower()=="data_" : yield ("data",s[5:])
+		elif s[:5].lower()=="loop_" :
+			loop=[]
+			inheader=True
+		else:
+			print("StarFile: Unknown content on line :",s)
+			break
+
+	if loop!=None :
+		if inheader : yield ("loop",loop)
+		toks.extend(star_tokens(pending))
+		r=rows()
+		if r!=None : yield r
+		if len(toks)>0 : raise Exception("StarFile: number of values in loop ({}) is not a multiple of the number of keys".format(",".join(loop)))
+
+def star_strings(col):
+	"""Converts a loop column to a list of strings for writing, quoting strings where necessary"""
+	a=np.asarray(col)
+	if a.dtype.kind=="f" : return list(map(repr,a.tolist()))		# shortest string which reproduces the value exactly
+	if a.dtype.kind in "iub" : return list(map(str,a.tolist()))
+	if a.dtype.kind!="U" : a=a.astype(str)
+	if len(a)==0 : return []
+	need=(np.char.str_len(a)==0)|(np.char.find(a," ")>=0)|(np.char.find(a,"\t")>=0)|np.char.startswith(a,"_")|np.char.startswith(a,"'")|np.char.startswith(a,'"')|np.char.startswith(a,";")
+	text=np.char.find(a,"\n")>=0
+	if not (need.any() or text.any()) : return a.tolist()
+	a=np.where(need,np.char.add(np.char.add('"',a),'"'),a)
+	return np.where(text,np.char.add(np.char.add("\n;",a),"\n;\n"),a).tolist()		# multi-line values as text fields
+
+def star_format(val):
+	"""Formats a single (non-loop) value for writing"""
+	if isinstance(val,float) : return repr(val)
+	val=str(val)
+	if "\n" in val : return "\n;{}\n;".format(val)
+	if len(val)==0 or val[0] in "_'\";" or " " in val or "\t" in val : return '"{}"'.format(val)
+	return val
+
+class StarBlock(dict):
+	"""A single data_ block from a STAR file. loops is a list of lists of the keys in each loop"""
+
+	def __init__(self,dataname=""):
+		dict.__init__(self)
+		self.dataname=dataname
+		self.loops=[]
+
 class StarFile(dict):
 	
 	def __init__(self,filename):
 		dict.__init__(self)
 		self.filename=filename
 		self.loops=[]
+		self.blocks=[]
+		self.dataname=""
 		
 		if os.path.isfile(filename) :
 			self.readfile()
-	def _nextline(self):
-		"""Used internally when parsing a star file to emulate readline"""
-		self.lineptr+=1
-		return self.lines[self.lineptr-1]
 	
 	def readfile(self):
-		"""This parses the STAR file, replacing any previous contents in the dictionary"""
+		"""This parses the STAR file, replacing any previous contents in the dictionary. Loop values are
+		returned as NumPy arrays. All data_ blocks are stored in self.blocks, the first is also
+		available directly in this dictionary."""
 		
 		self.loops=[]
+		self.blocks=[]
 		self.clear()
-		
-		matcher=re.compile("""("[^"]+")|('[^']+')|([^\s]+)""")
-		
-		# read the entire file into a buffer, this dramatically simplifies the logic, even if it eats a chunk of RAM
-		self.lines=[i for i in open(self.filename,"r") if len(i.strip())!=0 and i[0]!="#"]
-		self.lineptr=0
-		
-		while 1:
-			try: line=self._nextline().strip()
-			except: break
-		
-			if line[0]=="_" :				# A single key/value pair
-				spl=line.split(None,1)		# split on whitespace
-				key=spl[0][1:]
-				
-				if len(spl)==2:				# value on the same line
-					if spl[1][0] in ("'",'"') : self[key]=spl[1:-1]		# we assume the last non-whitespace character is the ending delimeter
-					else:
-						try: val=int(spl[1])
-						except: 
-							try: val=float(spl[1])
-							except: val=spl[1]			# if not an int or a float, must be a simple value string
-					
-						self[key]=val
-				else:						# value starts on next line
-					line2=self._nextline()
-					if line2[0] in ("'",'"') :
-						self[key]=line2.strip()[1:-1]
-					elif line2[0]==";" :
-						val=[line2[1:]]
-						while 1:
-							try: line2=self._nextline()
-							except: raise Exception("StarFile: Error found parsing multi-line string value for %s"%key)
-							if line2[0]==';' : break
-							val.append(line2)
-						val[-1]=val[-1].rstrip()		# remove trailing whitespace on the last line
-						val="".join(val)
-						self[key]=val
-					else: raise Exception("StarFile: Key-value pair error. Matching value for %s not found."%key)
-			elif line[:5].lower()=="data_":
-				if len(self)>0 :
-					print("WARNING: second data_ block encountered in ",self.filename,". Cannot deal with this at present. Second block ignored")
-					return
-				self.dataname=line[5:]
-			elif line[:5].lower()=="loop_":
-				loop=[]
-				self.loops.append(loop)				# add it to the list of loops immediately then update it as we go
-				# First we read the parameter names for the loop
-				while 1:
-					line2=self._nextline().strip()
-					if line2[0]=="_":
-						loop.append(line2.split()[0][1:])
-						self[loop[-1]]=[]			# this will hold the data values when we read them
-					else: break
-				self.lineptr-=1
-				
-				# Now we read the actual loop data elements
-				vals=[]
-				while 1:
-					try: line2=self._nextline().strip()
-					except: break
-				
-					if line2[0]=="_" or line2.lower()[:5]=="loop_" : break
-					elif line2[0]==";" :
-						val=line2[0][1:]
-						while 1:
-							line2=self._nextline()
-							if line2[0]==";":
-								break
-							val+=line2
-						vals.append(val)
-					else:
-						vals.extend([goodval(i) for i in matcher.findall(line2)])
-						if len(vals)<len(loop) :			# we may need to read multiple lines to get enough values
-							continue
-						if len(vals)>len(loop) : 
-							print("mismatch")
-							print(line2)
-							print(len(loop),loop)
-							print(len(vals),vals)
-							break
-						for i in range(len(vals)): self[loop[i]].append(vals[i])
-						vals=[]
-				self.lineptr-=1
-			else:
-				print("StarFile: Unknown content on line :",line)
-				break
-
-				
+
+		block=None
+		chunks={}			# (block,key):list of column arrays
+		with open(self.filename,"r") as fin:
+			for ev in star_parse(fin):
+				if ev[0]=="data" :
+					block=StarBlock(ev[1])
+					self.blocks.append(block)
+					continue
+				if block==None :			# values before any data_, not strictly legal
+					block=StarBlock()
+					self.blocks.append(block)
+				if ev[0]=="value" : block[ev[1]]=ev[2]
+				elif ev[0]=="loop" :
+					loop=ev[1]
+					block.loops.append(loop)
+					for k in loop:
+						chunks[(len(self.blocks)-1,k)]=[]
+						block[k]=np.array([])
+				elif ev[0]=="rows" :
+					for k,c in zip(loop,ev[1]): chunks[(len(self.blocks)-1,k)].append(c)
+
+		for (b,k),c in list(chunks.items()):
+			if len(c)>0 : self.blocks[b][k]=star_concatenate(c)
+
+		if len(self.blocks)>0 :
+			self.update(self.blocks[0])
+			self.loops=self.blocks[0].loops
+			self.dataname=self.blocks[0].dataname
+
+	@staticmethod
+	def iterloop(filename,keys=None,chunksize=100000):
+		"""Generator for STAR files too large to read into memory. Yields (dataname,{key:array}) for each chunk of up
+		to chunksize rows of each loop in the file. If keys is specified, only those keys are included, and loops
+		containing none of them are skipped."""
+		dataname=""
+		with open(filename,"r") as fin:
+			for ev in star_parse(fin,chunksize):
+				if ev[0]=="data" : dataname=ev[1]
+				elif ev[0]=="loop" : loop=ev[1]
+				elif ev[0]=="rows" :
+					ret={k:c for k,c in zip(loop,ev[1]) if keys==None or k in keys}
+					if len(ret)>0 : yield dataname,ret
+
 	def writefile(self,filename=None):
-		"""Writes the contents of the current dictionary back to disk using either the existing filename, or an alternative name passed in"""
+		"""Writes the contents of the current dictionary back to disk using either the existing filename, or an alternative name passed in.
+		The first data_ block is taken from this dictionary, any others from self.blocks"""
 		
-		print("Sorry, writing not implemented yet")
-					
-			
-			
+		if filename==None : filename=self.filename
+		blocks=[(self.dataname,self,self.loops)]+[(b.dataname,b,b.loops) for b in self.blocks[1:]]
+
+		with open(filename,"w") as out:
+			for name,d,loops in blocks:
+				out.write("\ndata_{}\n\n".format(name))
+				inloop=set([k for l in loops for k in l])
+				for k in d:
+					if k not in inloop : out.write("_{} {}\n".format(k,star_format(d[k])))
+
+				for loop in loops:
+					out.write("\nloop_\n")
+					for i,k in enumerate(loop): out.write("_{} #{}\n".format(k,i+1))
+					cols=[star_strings(d[k]) for k in loop]
+					if len(set([len(c) for c in cols]))>1 : raise Exception("StarFile: keys in loop ({}) have different numbers of values".format(",".join(loop)))
+					for i in range(0,len(cols[0]),100000):
+						out.write("\n".join([" ".join(r) for r in zip(*[c[i:i+100000] for c in cols])]))
+						out.write("\n")
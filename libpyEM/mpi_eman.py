@@ -33,9 +33,82 @@ from __future__ import division
 from future import standard_library
 standard_library.install_aliases()
 import sys
-from pickle import dumps,loads
+from io import BytesIO
+from pickle import dumps,loads,Pickler,Unpickler
 from zlib import compress,decompress
-from struct import pack,unpack
+from struct import pack,unpack,calcsize
+
+class EMDataPickler(Pickler):
+	"""Pickler which leaves the pixel data of EMData objects out of the pickle. Each image is replaced by a
+	small (index,shape,header) reference, and a float32 numpy view of its data is appended to self.buffers
+	so it can be transmitted as raw binary."""
+	def __init__(self,f):
+		from EMAN2 import EMData,EMNumPy
+		Pickler.__init__(self,f,-1)
+		self.buffers=[]
+		self.emdata=EMData
+		self.em2numpy=EMNumPy.em2numpy
+
+	def persistent_id(self,obj):
+		if not isinstance(obj,self.emdata) : return None
+
+		hdr=obj.get_attr_dict()
+		for k in ("nx","ny","nz") :
+			try: del hdr[k]
+			except: pass
+		self.buffers.append(self.em2numpy(obj).reshape(-1))
+		return ("EMData",len(self.buffers)-1,obj.get_xsize(),obj.get_ysize(),obj.get_zsize(),hdr)
+
+class EMDataUnpickler(Unpickler):
+	"""Inverse of EMDataPickler. buffers is the list of float32 arrays in the same order they were produced"""
+	def __init__(self,f,buffers):
+		Unpickler.__init__(self,f)
+		self.buffers=buffers
+
+	def persistent_load(self,pid):
+		from EMAN2 import EMNumPy
+		typ,i,nx,ny,nz,hdr=pid
+		if typ!="EMData" : raise Exception("Unknown persistent object in EMData frame (%s)"%str(typ))
+
+		if nz!=1 : img=EMNumPy.numpy2em(self.buffers[i].reshape((nz,ny,nx)))
+		elif ny!=1 : img=EMNumPy.numpy2em(self.buffers[i].reshape((ny,nx)))
+		else : img=EMNumPy.numpy2em(self.buffers[i])
+		img.set_attr_dict(hdr)
+		return img
+
+def emdata_dumps(obj):
+	"""Serializes obj, which may contain EMData objects at any depth, into a (head,buffers) pair. head is a
+	short string with the pickled object skeleton and the buffer lengths, buffers is a list of float32 numpy
+	arrays sharing memory with the images, so no image data is copied or compressed."""
+	f=BytesIO()
+	p=EMDataPickler(f)
+	p.dump(obj)
+	skel=f.getvalue()
+	head=pack("<II",len(skel),len(p.buffers))+pack("<%dQ"%len(p.buffers),*[b.size for b in p.buffers])+skel
+	return (head,p.buffers)
+
+def emdata_buflens(head):
+	"""Returns the list of buffer lengths (in floats) described by a head produced by emdata_dumps"""
+	ls,nb=unpack("<II",head[:8])
+	return unpack("<%dQ"%nb,head[8:8+nb*8])
+
+def emdata_loads(head,buffers):
+	"""Inverse of emdata_dumps"""
+	ls,nb=unpack("<II",head[:8])
+	return EMDataUnpickler(BytesIO(head[8+nb*8:8+nb*8+ls]),buffers).load()
+
+def emdata_write(f,head,buffers):
+	"""Writes a (head,buffers) pair from emdata_dumps to a binary file or socket file"""
+	f.write(pack("<I",len(head)))
+	f.write(head)
+	for b in buffers: f.write(b.data)
+
+def emdata_read(f):
+	"""Reads a (head,buffers) pair written by emdata_write"""
+	from numpy import frombuffer,float32
+	lh=unpack("<I",f.read(4))[0]
+	head=f.read(lh)
+	return (head,[frombuffer(f.read(n*4),dtype=float32) for n in emdata_buflens(head)])
 
 # no longer used
 def mpi_dout(data):
@@ -65,12 +138,13 @@ def mpi_din(msg):
 
 def mpi_eman2_send(com,data,dest):
 	"""Synchronously send 'data' to 'dest' with 4 char string command flag com. data may be any pickleable type.
-	Compression and pickling will be performed on the fly when deemed useful. Note that data duplication
-	in memory may occur."""
-	from mpi import mpi_send, MPI_CHAR, MPI_COMM_WORLD,mpi_comm_rank
-	rank = mpi_comm_rank(MPI_COMM_WORLD)	
+	Any EMData objects in data are sent as raw float32 buffers in separate messages, without pickling or
+	compression. Only the (small) remainder of the object is pickled."""
 
 	if isinstance(data,str) :
+		from mpi import mpi_send, MPI_CHAR, MPI_COMM_WORLD,mpi_comm_rank
+		rank = mpi_comm_rank(MPI_COMM_WORLD)
+
 		# tag 1 used for message "header" containing length of subsequent message with different tag
 		l=pack("4sIII",com,len(data),rank,3)
 		mpi_send(l,16,MPI_CHAR,dest,1,MPI_COMM_WORLD)		# Blocking issues with probe/get_count, so sending length packet, stupid, but apparently necessary
@@ -79,17 +153,31 @@ def mpi_eman2_send(com,data,dest):
 		mpi_send(data, len(data), MPI_CHAR, dest, 3, MPI_COMM_WORLD)		# removed use of mpi_dout/din for speed
 		
 	else:
-		# tag 1 used for message "header" containing length of subsequent message with different tag
-		data = dumps(data,-1)
-		l=pack("4sIII",com,len(data),rank,2)
-		mpi_send(l,16,MPI_CHAR,dest,1,MPI_COMM_WORLD)		# Blocking issues with probe/get_count, so sending length packet, stupid, but apparently necessary
+		head,buffers=emdata_dumps(data)
+		mpi_eman2_send_frame(com,head,buffers,dest)
+
+def mpi_eman2_send_frame(com,head,buffers,dest):
+	"""Synchronously send an already serialized (head,buffers) pair from emdata_dumps/emdata_read to 'dest'.
+	This permits forwarding a message without deserializing it."""
+	from mpi import mpi_send, MPI_CHAR, MPI_FLOAT, MPI_COMM_WORLD,mpi_comm_rank
+	rank = mpi_comm_rank(MPI_COMM_WORLD)
+
+	# tag 1 used for message "header" containing length of subsequent message with different tag
+	l=pack("4sIII",com,len(head),rank,4)
+	mpi_send(l,16,MPI_CHAR,dest,1,MPI_COMM_WORLD)
+
+	# tag 4 used for the pickled object skeleton, which also contains the lengths of the buffers
+	mpi_send(head, len(head), MPI_CHAR, dest, 4, MPI_COMM_WORLD)
 
-		# tag 2 used for a single pickled data block
-		mpi_send(data, len(data), MPI_CHAR, dest, 2, MPI_COMM_WORLD)		# removed use of mpi_dout/din for speed
+	# tag 5 used for raw float32 image data, one message per image
+	for b in buffers :
+		mpi_send(b, b.size, MPI_FLOAT, dest, 5, MPI_COMM_WORLD)
 
-def mpi_eman2_recv(src):
-	"""Synchronously receive a message from 'src' with 'tag'."""
-	from mpi import mpi_probe, mpi_get_count, mpi_recv, MPI_CHAR, MPI_COMM_WORLD
+def mpi_eman2_recv(src,raw=False):
+	"""Synchronously receive a message from 'src' with 'tag'. If raw is set, objects sent by mpi_eman2_send
+	are returned as a (head,buffers) pair rather than being reconstructed, for use with mpi_eman2_send_frame
+	or emdata_write."""
+	from mpi import mpi_probe, mpi_get_count, mpi_recv, MPI_CHAR, MPI_FLOAT, MPI_COMM_WORLD
 	
 	lmsg=mpi_recv(16,MPI_CHAR, src,1,MPI_COMM_WORLD)		# first get the message length
 	com,l,srank,tag=unpack("4sIII",lmsg)
@@ -98,6 +186,11 @@ def mpi_eman2_recv(src):
 	
 	if tag==2 : return (com,loads(str(msg.data)),srank)
 	elif tag==3 : return (com,str(msg.data),srank)
+	elif tag==4 :
+		head=msg.tobytes()
+		buffers=[mpi_recv(n,MPI_FLOAT,srank,5,MPI_COMM_WORLD) for n in emdata_buflens(head)]
+		if raw : return (com,(head,buffers),srank)
+		return (com,emdata_loads(head,buffers),srank)
 	
 def mpi_bcast_send(data):
 	"""Unlike the C routine, in this python module, mpi_bcast is split into a send and a receive method. Send must be 
@@ -58,6 +58,9 @@ import threading
 import time
 import traceback
 import weakref
+import json
+import sqlite3
+import atexit
 
 
 
@@ -1349,6 +1352,124 @@ EMFileType.alltocheck = (EMPlotFileType, EMPDBFileType, EMTextFileType)
 
 #---------------------------------------------------------------------------
 
+class EMBrowserCache(object) :
+	"""Metadata cache for the files in a single directory, stored in <dir>/.browsercache.sqlite. This replaces
+	.browsercache.json, which was rewritten in its entirety every time an entry was added. The whole cache is read
+	with a single query when it is opened, and new entries are written in batches. It supports the subset of the
+	JSDict interface used by the browser, so EMDirEntry subclasses can use it the same way. Use browser_cache()
+	rather than creating instances directly, so all threads share one instance per directory."""
+
+	flushcount = 500		# pending entries are written once this many have accumulated
+	flushtime = 5.0			# or when this many seconds have passed since the last write
+
+	def __init__(self, root) :
+		self.root = root
+		self.path = os.path.join(root, ".browsercache.sqlite")
+		self.lock = threading.Lock()
+		self.data = {}
+		self.pending = {}
+		self.lastflush = time.time()
+		self.load()
+
+	def connect(self) :
+		db = sqlite3.connect(self.path, timeout = 10.0)
+		db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID")
+		return db
+
+	def load(self) :
+		"""Reads the cache from disk. The first time a directory is seen, entries are imported from the old JSON cache"""
+
+		new = not os.path.exists(self.path)
+
+		try :
+			db = self.connect()
+			for k, v in db.execute("SELECT key, value FROM cache") : self.data[k] = json.loads(v)
+			db.close()
+		except :
+			self.path = None		# eg - a read-only directory. We still cache in memory
+
+		if not new : return
+
+		try : old = json.load(open(os.path.join(self.root, ".browsercache.json"), "r"))
+		except : return
+
+		for k in old :
+			self.data[k] = old[k]
+			self.pending[k] = old[k]
+
+		self.sync()
+
+	def __getitem__(self, key) :
+		with self.lock : return self.data[key]
+
+	def __contains__(self, key) :
+		with self.lock : return key in self.data
+
+	def __setitem__(self, key, val) :
+		self.setval(key, val)
+
+	def get(self, key, dfl = None) :
+		with self.lock : return self.data.get(key, dfl)
+
+	def keys(self) :
+		with self.lock : return list(self.data.keys())
+
+	def setval(self, key, val, deferupdate = False) :
+		"""Sets a value. If deferupdate is set, the write to disk is batched with other changes"""
+
+		with self.lock :
+			self.data[key] = val
+			self.pending[key] = val
+			if not deferupdate or len(self.pending) >= self.flushcount or time.time()-self.lastflush > self.flushtime : self.flush()
+
+	def sync(self) :
+		"""Writes any pending changes to disk"""
+
+		with self.lock : self.flush()
+
+	def flush(self) :
+		# must be called with self.lock held
+		if len(self.pending) == 0 : return
+
+		if self.path != None :
+			rows = []
+			for k, v in self.pending.items() :
+				try : rows.append((k, json.dumps(v)))
+				except : pass		# not serializable, only cached in memory
+
+			try :
+				db = self.connect()
+				with db : db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?)", rows)
+				db.close()
+			except :
+				print("Warning: unable to write browser cache ", self.path)
+				self.path = None
+
+		self.pending = {}
+		self.lastflush = time.time()
+
+browser_caches = {}
+browser_caches_lock = threading.Lock()
+
+def browser_cache(root) :
+	"""Returns the shared EMBrowserCache for the directory root"""
+
+	root = os.path.abspath(root)
+
+	with browser_caches_lock :
+		if root not in browser_caches : browser_caches[root] = EMBrowserCache(root)
+		return browser_caches[root]
+
+def browser_cache_sync() :
+	"""Writes pending changes in all open browser caches to disk"""
+
+	with browser_caches_lock : caches = list(browser_caches.values())
+	for c in caches : c.sync()
+
+atexit.register(browser_cache_sync)
+
+#---------------------------------------------------------------------------
+
 class EMDirEntry(object) :
 	"""Represents a directory entry in the filesystem"""
 
@@ -1613,7 +1734,7 @@ class EMDirEntry(object) :
 		cachename = self.name+"!main"
 
 		try :
-			cache = js_open_dict(self.root+"/.browsercache.json")
+			cache = browser_cache(self.root)
 			self.updtime, self.dim, self.filetype, self.nimg, self.size = cache[cachename]		# try to read the cache for the current file
 
 			if self.cache_old(False) == 0 : return 2 		# current cache, no further update necessary
@@ -1719,6 +1840,102 @@ class EMDirEntry(object) :
 
 #---------------------------------------------------------------------------
 
+class EMBrowserIndexer(object) :
+	"""Fills in the (expensive) details of EMDirEntry objects on a pool of worker threads, in the order they are
+	queued. Entries which changed are collected until the GUI thread takes them with updated(), since the display
+	can't be updated from the workers. Nothing here depends on the GUI, so it can also be used headless, see
+	index_directory()."""
+
+	def __init__(self, nthreads = 4) :
+		self.nthreads = nthreads
+		self.lock = threading.Lock()
+		self.executor = None
+		self.generation = 0		# incremented by clear(), so results from dropped jobs are ignored
+		self.changed = []
+		self.nqueued = 0
+		self.ndone = 0
+		self.ncached = 0
+
+	def queue(self, entries) :
+		"""Adds a list of EMDirEntry objects to be filled in"""
+
+		if self.executor == None : self.executor = EMExecutor(self.nthreads)
+
+		with self.lock :
+			self.nqueued += len(entries)
+			generation = self.generation
+
+		# fill() reports through self.changed, so the executor doesn't need to keep any results
+		for e in entries : self.executor.post(self.fill, e, generation)
+
+	def fill(self, entry, generation) :
+		try : r = entry.fillDetails()
+		except :
+			traceback.print_exc()
+			r = 0
+
+		with self.lock :
+			if generation != self.generation : return
+			self.ndone += 1
+			if r == 2 : self.ncached += 1
+			if r : self.changed.append(entry)
+
+	def updated(self) :
+		"""Returns a list of the entries whose details have changed since the last call"""
+
+		with self.lock :
+			ret = self.changed
+			self.changed = []
+
+		return ret
+
+	def idle(self) :
+		"""True if every queued entry has been processed"""
+
+		with self.lock : return self.ndone >= self.nqueued
+
+	def clear(self) :
+		"""Drops all entries which haven't been processed yet, eg - when the browser changes directories"""
+
+		with self.lock :
+			self.generation += 1
+			self.changed = []
+			self.nqueued = self.ndone = self.ncached = 0
+
+		if self.executor != None :
+			self.executor.cancel()
+			self.executor = None
+
+	def wait(self) :
+		"""Blocks until all queued entries have been processed, then writes the caches to disk"""
+
+		if self.executor != None :
+			self.executor.join()
+			self.executor = None
+
+		browser_cache_sync()
+
+def index_directory(path, nthreads = 4, recurse = False, direntryclass = EMDirEntry) :
+	"""Fills in the details of every entry in path (and its subdirectories if recurse is set) without a GUI. Returns
+	(entries, indexer). Useful for benchmarking, or to build the cache for a very large directory in advance."""
+
+	indexer = EMBrowserIndexer(nthreads)
+	todo = [direntryclass(path, "", 0)]
+	entries = []
+
+	while len(todo) > 0 :
+		d = todo.pop()
+		children = [d.child(i) for i in range(d.nChildren())]
+		indexer.queue(children)
+		entries.extend(children)
+		if recurse : todo.extend([c for c in children if c.filetype == "Folder"])
+
+	indexer.wait()
+
+	return entries, indexer
+
+#---------------------------------------------------------------------------
+
 def nonone(val) :
 	"""Returns '-' for None, otherwise the string representation of the passed value"""
 
@@ -1921,6 +2138,25 @@ class EMFileItemModel(QtCore.QAbstractItemModel) :
 		if index.internalPointer().fillDetails() :
 			self.dataChanged.emit(index, self.createIndex(index.row(), 5, index.internalPointer()))
 
+	def detailsChanged(self, entries) :
+		"""Updates the display for a list of EMDirEntry objects whose details have been filled in. Runs of adjacent
+		rows with the same parent are combined into a single dataChanged signal."""
+
+		byparent = {}
+		for e in entries : byparent.setdefault(id(e.parent()), []).append(e)
+
+		lastcol = self.columnCount(None)-1
+		for rows in byparent.values() :
+			rows.sort(key = lambda x:int(x.index))
+			first = last = rows[0]
+			for e in rows[1:]+[None] :
+				if e != None and int(e.index) == int(last.index)+1 :
+					last = e
+					continue
+
+				self.dataChanged.emit(self.createIndex(int(first.index), 0, first), self.createIndex(int(last.index), lastcol, last))
+				first = last = e
+
 #---------------------------------------------------------------------------
 
 class myQItemSelection(QtGui.QItemSelectionModel) :
@@ -3027,6 +3263,8 @@ class EMBrowserWidget(QtGui.QWidget) :
 	cancel = QtCore.pyqtSignal()
 	module_closed = QtCore.pyqtSignal()
 
+	indexthreads = 4		# number of threads used to fill in file details in the background
+
 	def __init__(self, parent = None, withmodal = False, multiselect = False, startpath = ".", setsmode = None, dirregex="") :
 		"""withmodal - if specified will have ok/cancel buttons, and provide a mechanism for a return value (not truly modal)
 		multiselect - if True, multiple files can be simultaneously selected
@@ -3250,15 +3488,11 @@ class EMBrowserWidget(QtGui.QWidget) :
 
 		self.updtimer = QTimer()		# This causes the actual display updates, which can't be done from a python thread
 		self.updtimer.timeout.connect(self.updateDetailsDisplay)
-		self.updthreadexit = False		# when set, this triggers the update thread to exit
-		self.updthread = threading.Thread(target = self.updateDetails)	# The actual thread
-		self.updlist = []				# List of QModelIndex items in need of updating
-		self.redrawlist = []			# List of QModelIndex items in need of redisplay
+		self.indexer = EMBrowserIndexer(self.__class__.indexthreads)	# fills in file details on a pool of background threads
 		self.needresize = 0			# Used to resize column widths occaisonally
 		self.expanded = set()			# We get multiple expand events for each path element, so we need to keep track of which ones we've updated
 
 		self.setPath(startpath)	# start in the local directory
-		self.updthread.start()
 		self.updtimer.start(200)
 
 		self.result = None			# used in modal mode. Holds final selection
@@ -3275,47 +3509,22 @@ class EMBrowserWidget(QtGui.QWidget) :
 
 		QtGui.qApp.setOverrideCursor(Qt.ArrowCursor)
 
-	def updateDetails(self) :
-		"""This is spawned as a thread to gradually fill in file details in the background"""
-
-		while 1 :
-			if self.updthreadexit : break
-
-			if len(self.updlist) == 0 :
-				time.sleep(1.0)				# If there is nothing to update at the moment, we don't need to spin our wheels as much
-			else :
-				de = self.updlist.pop()
-
-# 				print de.internalPointer().truepath()
-
-				r = de.internalPointer().fillDetails()
-				if r == 1 :
-					self.redrawlist.append(de)		# if the update changed anything, we trigger a redisplay of this entry
-					time.sleep(0.01)			# prevents updates from happening too fast and slowing the machine down
-				if r == 2 :						# This means we're reading from a cache, and we should probably update as fast as possible
-					self.redrawlist.append(de)
-# 				print "### ", de.internalPointer().path()
-
 	def updateDetailsDisplay(self) :
-		"""Since we can't do GUI updates from a thread, this is a timer event to update the display after the beckground thread
-		gets the details for each item"""
+		"""Since we can't do GUI updates from a thread, this is a timer event to update the display after the background threads
+		get the details for each item"""
 
 		if self.needresize > 0 :
 			self.needresize -= 1
 			self.wtree.resizeColumnToContents(3)
 			self.wtree.resizeColumnToContents(4)
 
-		if len(self.redrawlist) == 0 :
-			return
+		changed = self.indexer.updated()
 
-		# we emit a datachanged event
-		rdr = []
-		while len(self.redrawlist) > 0 :
-			i = self.redrawlist.pop()
-			rdr.append((i.row(), i.internalPointer()))		# due to threads, we do it this way to make sure we don't miss any
+		if len(changed) == 0 :
+			if self.indexer.idle() : browser_cache_sync()
+			return
 
-		# We emit only a single event here for efficiency
-		self.curmodel.dataChanged.emit(self.curmodel.createIndex(min(rdr)[0], 0, min(rdr)[1]), self.curmodel.createIndex(max(rdr)[0], 5, max(rdr)[1]))
+		self.curmodel.detailsChanged(changed)
 
 		self.needresize = 2
 
@@ -3437,8 +3646,7 @@ class EMBrowserWidget(QtGui.QWidget) :
 
 		# we add the child items to the list needing updates
 
-		for i in range(self.curmodel.rowCount(qmi)-1, -1, -1) :
-			self.updlist.append(self.curmodel.index(i, 0, qmi))
+		self.indexer.queue([self.curmodel.index(i, 0, qmi).internalPointer() for i in range(self.curmodel.rowCount(qmi))])
 
 	def buttonMisc(self, num) :
 		"""One of the programmable action buttons was pressed"""
@@ -3582,8 +3790,7 @@ class EMBrowserWidget(QtGui.QWidget) :
 		path = path.replace("\\", "/")
 		if path[:2] == "./" : path = path[2:]
 
-		self.updlist = []
-		self.redrawlist = []
+		self.indexer.clear()
 
 		filt = str(self.wfilter.currentText()).strip()
 
@@ -3658,8 +3865,7 @@ class EMBrowserWidget(QtGui.QWidget) :
 
 		# we add the child items to the list needing updates
 
-		for i in range(self.curmodel.rowCount(None)-1, -1, -1) :
-			self.updlist.append(self.curmodel.index(i, 0, None))
+		self.indexer.queue([self.curmodel.index(i, 0, None).internalPointer() for i in range(self.curmodel.rowCount(None))])
 
 		if not silent :
 			try : self.pathstack.remove(self.curpath)
@@ -3681,7 +3887,8 @@ class EMBrowserWidget(QtGui.QWidget) :
 
 	def closeEvent(self, event) :
 		E2saveappwin("e2display", "main", self)
-		self.updthreadexit = True
+		self.indexer.clear()
+		browser_cache_sync()
 
 		for w in self.view2d+self.view2ds+self.view3d+self.viewplot2d+self.viewplot3d+self.viewhist :
 			w.close()
@@ -41,7 +41,7 @@ import os
 import re
 from PyQt4 import QtCore, QtGui
 from PyQt4.QtCore import Qt
-from .embrowser import EMBrowserWidget, EMFileItemModel, EMDirEntry, nonone, safe_int,safe_float
+from .embrowser import EMBrowserWidget, EMFileItemModel, EMDirEntry, nonone, safe_int,safe_float,browser_cache
 
 
 class EMRefine2dTable(EMBrowserWidget):
@@ -156,7 +156,7 @@ class EMModelsEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!models"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.dims,self.filetype,self.nimg,self.quality=cache[cachename]		# try to read the cache for the current file
 			if self.updtime>=os.stat(self.truepath()).st_mtime : return 2 		# current cache, no further update necessary
 		except:
@@ -253,7 +253,7 @@ class EMSetsEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!sets"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.dims,self.filetype,self.nimg=cache[cachename]		# try to read the cache for the current file
 			if self.updtime>=os.stat(self.truepath()).st_mtime : return 2 		# current cache, no further update necessary
 		except:
@@ -361,7 +361,7 @@ class EMParticlesEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!particles"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.particledim,self.filetype,self.nimg,self.typ,self.quality=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
@@ -500,7 +500,7 @@ class EMCTFParticlesEntry(EMDirEntry):
 		self.updtime=0
 		cachename=self.name+"!ctf"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.particledim,self.filetype,self.nimg,self.typ,self.defocus,self.bfactor,self.sampling,self.snr,self.snrhi,self.quality,self.badparticlecount=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
@@ -737,7 +737,7 @@ class EMBoxesEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!boxes"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.boxcount,self.filetype,self.quality=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
@@ -836,7 +836,7 @@ class EMTomoBoxesEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!boxes_3d"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.boxcount,self.filetype,self.quality=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
@@ -937,7 +937,7 @@ class EMRCTBoxesEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!rct"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.boxcount,self.filetype,self.quality=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
@@ -1164,7 +1164,7 @@ class EMRawDataEntry(EMDirEntry):
 		cache=None
 		cachename=self.name+"!raw"
 		try:
-			cache=js_open_dict(self.root+"/.browsercache.json")
+			cache=browser_cache(self.root)
 			self.updtime,self.filetype,self.dim,self.quality=cache[cachename]		# try to read the cache for the current file
 			old=self.cache_old()
 			if old==0 : return 2 		# current cache, no further update necessary
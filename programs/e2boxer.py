@@ -41,9 +41,9 @@ from builtins import object
 from EMAN2 import *
 from EMAN2jsondb import *
 import numpy as np
-import threading
-import queue
 import os,sys
+import time
+import hashlib
 
 apix=0
 
@@ -277,9 +277,10 @@ def main():
 		#### let the autoboxer handle the parallelism if they can...
 		if hasattr(pcl, "do_autobox_all"):
 			pcl.do_autobox_all(args,goodrefs,badrefs,bgrefs,options.apix,options.threads,apick[1],None)
-			return
+			args_autobox=[]
+		else: args_autobox=args
 		
-		for i,fspi in enumerate(args):
+		for i,fspi in enumerate(args_autobox):
 			fsp=fspi.split()[1]
 			micrograph=load_micrograph(fsp)
 
@@ -321,7 +322,7 @@ def main():
 		print(".box files written to boxfiles/")
 
 	if options.write_ptcls:
-		write_particles(args,boxsize,options.verbose)
+		write_particles(args,boxsize,options.verbose,options.threads)
 		print("Particles written to particles/*_ptcls.hdf")
 
 	E2end(logid)
@@ -345,46 +346,108 @@ def write_boxfiles(files,boxsize):
 		for b in boxes:
 			out.write("{:0.0f}\t{:0.0f}\t{:0.0f}\t{:0.0f}\n".format(int(b[0]-boxsize2),int(b[1]-boxsize2),int(boxsize),int(boxsize)))
 
-def write_particles(files,boxsize,verbose):
+def write_particles(files,boxsize,verbose,nthreads=1):
 	"""This function will write a particles/*_ptcls.hdf file for each provided micrograph, based on
 	box locations in the corresponding info/*json file. To use this with .box files, they must be imported
-	to a JSON file first."""
+	to a JSON file first. Micrographs are processed in parallel with nthreads threads."""
 	
 	try: os.mkdir("particles")
 	except: pass
-	boxsize2=old_div(boxsize,2)
-	
-	for nm in files:
-		n,m=nm.split()
-		base=base_name(m)
-		ptcl="particles/{}.hdf".format(base)
-		
-		# get the list of box locations
-		db=js_open_dict(info_name(m))
-		boxes=db.setdefault("boxes",[])
-		if len(boxes)==0 :
-			if verbose :
-				print("No particles in ",m)
-			continue
-	
-		# remove any existing file
-		try: os.unlink(ptcl)
-		except: pass
-	
-		if verbose : print("{} : {} particles written to {}".format(m,len(boxes),ptcl))
-		micrograph=load_micrograph(m)		# read micrograph
-		for i,b in enumerate(boxes):
-			boxim=micrograph.get_clip(Region(b[0]-boxsize2,b[1]-boxsize2,boxsize,boxsize))
-			boxim["ptcl_source_coord"]=(b[0],b[1])
-			boxim["ptcl_source_image"]=m
-			boxim.write_image(ptcl,i)
-	
+
+	def boxlists():
+		for nm in files:
+			n,m=nm.split()
+
+			# get the list of box locations
+			db=js_open_dict(info_name(m))
+			boxes=db.setdefault("boxes",[])
+			if len(boxes)==0 :
+				if verbose :
+					print("No particles in ",m)
+				continue
+			yield m,boxes,boxsize
+
+	t0=time.time()
+	nptcl=0
+	ex=EMExecutor(nthreads,maxpending=2*nthreads)
+	for m,ptcl,n,t in ex.starmap(write_micrograph_particles,boxlists()):
+		nptcl+=n
+		if verbose : print("{} : {} particles written to {} ({:1.1f} particles/s)".format(m,n,ptcl,n/t))
+	t=max(time.time()-t0,1.0e-6)
+	print("{} particles extracted in {:1.1f} s ({:1.1f} particles/s)".format(nptcl,t,nptcl/t))
+
+# micrographs with at least this many pixels are read only in bands of rows containing boxes
+regionread_min=8192*8192
+
+def micrograph_bands(boxes,boxsize,ny):
+	"""Returns a list of (y0,y1) row ranges, clipped to the micrograph, covering all of the boxes. Ranges separated
+	by less than a box size are merged."""
+	rows=sorted([(max(0,int(b[1])-boxsize//2),min(ny,int(b[1])-boxsize//2+boxsize)) for b in boxes])
+	bands=[list(rows[0])]
+	for y0,y1 in rows[1:]:
+		if y0<=bands[-1][1]+boxsize : bands[-1][1]=max(bands[-1][1],y1)
+		else: bands.append([y0,y1])
+	return [tuple(i) for i in bands]
+
+def write_micrograph_particles(m,boxes,boxsize):
+	"""Extracts the boxed particles from a single micrograph and writes them to particles/<base>.hdf in a single pass.
+	Large single image micrographs are read only in bands of rows containing boxes. Returns (micrograph,output
+	file,number of particles,time)"""
+	t0=time.time()
+	boxsize2=boxsize//2
+	ptcl="particles/{}.hdf".format(base_name(m))
+
+	fsp=m
+	if os.path.exists("micrographs/"+m) : fsp="micrographs/"+m
+	hdr=EMData(fsp,0,True)
+	nx,ny=hdr["nx"],hdr["ny"]
+
+	# imgs is a list of (y0,y1,image) with image covering rows y0-y1 of the micrograph
+	imgs=None
+	if nx*ny>=regionread_min and EMUtil.get_image_count(fsp)==1 :
+		bands=micrograph_bands(boxes,boxsize,ny)
+		if sum([y1-y0 for y0,y1 in bands])<ny//2 :
+			imgs=[]
+			for y0,y1 in bands:
+				img=EMData()
+				img.read_image(fsp,0,False,Region(0,y0,nx,y1-y0))
+				if invert_on_read : img.mult(-1.0)
+				img["apix_x"]=apix
+				img["apix_y"]=apix
+				img["apix_z"]=apix
+				imgs.append((y0,y1,img))
+	if imgs==None : imgs=[(0,ny,load_micrograph(m))]
+
+	out=[]
+	for b in boxes:
+		for y0,y1,img in imgs:
+			if int(b[1])-boxsize2<y1 and int(b[1])-boxsize2+boxsize>y0 : break
+		boxim=img.get_clip(Region(b[0]-boxsize2,b[1]-boxsize2-y0,boxsize,boxsize))
+		boxim["ptcl_source_coord"]=(b[0],b[1])
+		boxim["ptcl_source_image"]=m
+		out.append(boxim)
+	imgs=None
+
+	# remove any existing file, then write the whole stack at once
+	try: os.unlink(ptcl)
+	except: pass
+	for i,boxim in enumerate(out): boxim.write_image(ptcl,i)
+
+	return m,ptcl,len(out),max(time.time()-t0,1.0e-6)
+
 ##########
 # to add a new autoboxer module, create a class here, then add it to the GUIBoxer.aboxmodes list below
 ##########
 
 class boxerByRef(QtCore.QObject):
 	"""Simple reference-based cross-corrlation picker with exhaustive rotational search"""
+
+	# The rotated, downsampled, padded and Fourier transformed references depend only on the references, downsample
+	# and gs, so they are shared by all micrographs of the same size. See prepare_refs()
+	refcache={}
+	refcache_max=2*1024**3		# bytes
+	timing={}
+
 	@staticmethod
 	def setup_gui(gridlay,boxerwindow=None):
 		boxerByRef.threshold=ValSlider(None,(0.1,8),"Threshold",6.0,90)
@@ -407,73 +470,65 @@ class boxerByRef(QtCore.QObject):
 				return
 			
 		print("threshold = ",threshold)
+		t0=time.time()
 		
 		downsample=old_div(10.0,apix)			# we downsample to 10 A/pix
 		microdown=micrograph.process("normalize.edgemean").process("math.fft.resample",{"n":downsample})
 		gs=good_size(max(microdown["nx"],microdown["ny"]))
 		microf=microdown.get_clip(Region(0,0,gs,gs)).do_fft()
 		print("downsample by ",downsample,"  Good size:",gs)
+
+		# reference FFTs, from the cache if possible
+		prep=boxerByRef.prepare_refs(goodrefs,downsample,gs,nthreads)
+		t1=time.time()
 	
 		## Here we precompute a normalization image to deal with local standard deviation variation
 		microlp=microdown.get_clip(Region(0,0,gs,gs)).process("filter.lowpass.gauss",{"cutoff_freq":0.005})		# we really only want the standard deviation of low resolution info
 		nx=goodrefs[0]["nx"]/downsample
-		circle=EMData(gs,gs,1)
-		circle.to_one()
-		circle.process_inplace("mask.sharp",{"outer_radius":nx/2})
-##		circle.process_inplace("normalize.unitlen")
-		circle.process_inplace("xform.phaseorigin.tocorner")
-#		circlef=circle.do_fft()
+		circlef=prep["circlef"]
 		
-		ccfc=microlp.calc_ccf(circle)
+		ccfc=microlp.calc_ccf(circlef)
 		ccfc.mult(1.0/(nx*nx))
 		ccfc.process_inplace("math.squared")
 		
 		md2=microlp.process("math.squared")
-		norm=md2.calc_ccf(circle)
+		norm=md2.calc_ccf(circlef)
 		norm.mult(1.0/(nx*nx))
 	
 		## Norm should now be the related to the variance
 		norm.sub(ccfc)
 	
-		# Iterate over refs
-		owner=EMData(gs,gs,1)
-		maxav=Averagers.get("minmax",{"max":1,"owner":owner})
-		
-		# Iterate over in-plane rotation for each ref
-		jsd=queue.Queue(0)
-		thrds=[threading.Thread(target=boxerByRef.ccftask,args=(jsd,ref,downsample,gs,microf,ri)) for ri,ref in enumerate(goodrefs)]
-
-		n=-1
-
-		# here we run the threads and save the results, no actual alignment done here
-		print(len(thrds)," threads")
-		thrtolaunch=0
-		while thrtolaunch<len(thrds) or threading.active_count()>1:
-			# If we haven't launched all threads yet, then we wait for an empty slot, and launch another
-			# note that it's ok that we wait here forever, since there can't be new results if an existing
-			# thread hasn't finished.
-			if thrtolaunch<len(thrds) and threading.active_count()!=nthreads:
-#				print "Starting thread {}/{}".format(thrtolaunch,len(thrds))
-				thrds[thrtolaunch].start()
-				thrtolaunch+=1
-			else: 
-				time.sleep(0.05)
-				if prog!=None : 
-					prog.setValue(prog.value())
-					if prog.wasCanceled() : break
-		
-			while not jsd.empty():
-				# add each ccf image to our maxval image as it comes in
-				ccf=jsd.get()
-				maxav.add_image(ccf)
-				sys.stdout.flush()
+		def poll():
+			if prog!=None :
+				prog.setValue(prog.value())
+				if prog.wasCanceled() : return False
+			return True
+
+		# Iterate over in-plane rotation for each ref, one reference per job
+		t2=time.time()
+		ex=EMExecutor(nthreads,maxpending=2*nthreads)
+		print(len(goodrefs)," jobs")
+		final=None
+		for cmax,cowner in ex.starmap(boxerByRef.ccftask,[(ref,downsample,gs,microf,ri,prep["refs"][ri]) for ri,ref in enumerate(goodrefs)],poll):
+			# merge each reference's best ccf and owner into ours as they come in
+			if final is None :
+				final,owner=cmax,cowner
+			else :
+				fa,ca=to_numpy(final),to_numpy(cmax)
+				better=ca>fa
+				fa[better]=ca[better]
+				to_numpy(owner)[better]=to_numpy(cowner)[better]
+			sys.stdout.flush()
 		print("")
+		t3=time.time()
 
-		for t in thrds:
-			t.join()
+		# cancelled from the progress dialog, the callers stop when we return None
+		if ex.cancelled or final is None :
+			ex.join()
+			return None
 
-			
-		final=maxav.finish()
+		final.update()
+		owner.update()
 		# smooth out a few spurious peaks. Hopefully doesn't mess up ownership assignment significantly
 		final.process_inplace("filter.lowpass.gauss",{"cutoff_freq":0.2})
 		# get rid of nasty edges
@@ -530,14 +585,124 @@ class boxerByRef(QtCore.QObject):
 			#cmpim.append(ali)
 			#cmpim.append(ptcl)
 		#display(cmpim)
-			
-		print("done")
+
+		# setup is reference preparation plus the local variance normalization, peaks includes refinement
+		t4=time.time()
+		boxerByRef.timing={"refs":t1-t0,"setup":t2-t0,"correlation":t3-t2,"peaks":t4-t3,"total":t4-t0}
+		print("done. setup {:1.2f} s (references {:1.2f} s), correlation {:1.2f} s, peaks {:1.2f} s".format(t2-t0,t1-t0,t3-t2,t4-t3))
 		
 		return boxes2
 
+	@staticmethod
+	def prepare_refs(goodrefs,downsample,gs,nthreads):
+		"""Returns a dictionary containing "refs", a list with (for each reference) a list of (angle,FFT) for each
+		in-plane rotation, or None for each reference if they are too large to keep in memory. "circlef" is the FFT of the
+		mask used for local variance normalization. Results are cached in boxerByRef.refcache."""
+		refkey=hashlib.md5()
+		for r in goodrefs : refkey.update(to_numpy(r).tobytes())
+		key=(refkey.hexdigest(),downsample,gs)
+		try: return boxerByRef.refcache[key]
+		except: pass
+
+		nx=goodrefs[0]["nx"]/downsample
+		circle=EMData(gs,gs,1)
+		circle.to_one()
+		circle.process_inplace("mask.sharp",{"outer_radius":nx/2})
+##		circle.process_inplace("normalize.unitlen")
+		circle.process_inplace("xform.phaseorigin.tocorner")
+		ret={"circlef":circle.do_fft(),"size":len(goodrefs)*36*gs*(gs+2)*4}
+
+		# if the references won't fit in the cache, ccftask() computes them for each micrograph as before
+		if ret["size"]>boxerByRef.refcache_max :
+			print("Warning: prepared references would require {:1.1f} GB. Not caching.".format(ret["size"]/1.0e9))
+			ret["refs"]=[None]*len(goodrefs)
+			return ret
+
+		ex=EMExecutor(nthreads,ordered=True)
+		ret["refs"]=list(ex.starmap(boxerByRef.preptask,[(ref,downsample,gs) for ref in goodrefs]))
+
+		# we only keep a few sets of references around
+		if sum([v["size"] for v in list(boxerByRef.refcache.values())])+ret["size"]>boxerByRef.refcache_max : boxerByRef.refcache={}
+		boxerByRef.refcache[key]=ret
+		return ret
+
+	@staticmethod
+	def preptask(ref,downsample,gs):
+		"""rotates, downsamples, pads and Fourier transforms a single reference at each in-plane angle"""
+		mref=ref.process("mask.soft",{"outer_radius":old_div(ref["nx"],2)-4,"width":3})
+		mref.process_inplace("normalize.unitlen")
+
+		ret=[]
+		for ang in range(0,360,10):
+			dsref=mref.process("xform",{"transform":Transform({"type":"2d","alpha":ang})})
+			# don't downsample until after rotation
+			dsref.process_inplace("math.fft.resample",{"n":downsample})
+			dsref.process_inplace("normalize")
+			diff=(gs-dsref["nx"])//2
+			dsref=dsref.get_clip(Region(-diff,-diff,gs,gs))
+			dsref.process_inplace("xform.phaseorigin.tocorner")
+			ret.append((ang,dsref.do_fft()))
+		return ret
+
+	@staticmethod
+	def do_autobox_all(filenames,goodrefs,badrefs,bgrefs,apix,nthreads,params,prog=None):
+		"""Autoboxes a list of micrographs in sequence, reusing the prepared references. Parallelism is over references
+		within each micrograph."""
+		boxsize2=goodrefs[0]["nx"]//2 if len(goodrefs)>0 else 0
+		times={}
+		for i,fspl in enumerate(filenames):
+			fsp=fspl.split()[1]
+			if prog:
+				prog.setValue(i)
+				if prog.wasCanceled() :
+					print("Autoboxing Aborted!")
+					break
+
+			micrograph=load_micrograph(fsp)
+			newboxes=boxerByRef.do_autobox(micrograph,goodrefs,badrefs,bgrefs,apix,nthreads,params,prog)
+			if newboxes==None : break
+			for k,v in list(boxerByRef.timing.items()) : times[k]=times.get(k,0)+v
+			newboxes=[b for b in newboxes if b[0]-boxsize2>=0 and b[1]-boxsize2>=0 and b[0]+boxsize2<micrograph["nx"] and b[1]+boxsize2<micrograph["ny"]]
+			print("{}) {} boxes -> {}".format(i,len(newboxes),fsp))
+
+			# if we got nothing, we just leave the current results alone
+			if len(newboxes)==0 : continue
+
+			# read the existing box list and update
+			db=js_open_dict(info_name(fsp))
+			try:
+				boxes=db["boxes"]
+				# Filter out all existing boxes for this picking mode
+				bname=newboxes[0][2]
+				boxes=[b for b in boxes if b[2]!=bname]
+			except:
+				boxes=[]
+
+			boxes.extend(newboxes)
+
+			db["boxes"]=boxes
+			db.close()
+
+		if len(times)>0 :
+			print("Total time {:1.1f} s: setup {:1.1f} s (references {:1.1f} s), correlation {:1.1f} s, peaks {:1.1f} s".format(times["total"],times["setup"],times["refs"],times["correlation"],times["peaks"]))
+
 
 	@staticmethod
-	def ccftask(jsd,ref,downsample,gs,microf,ri):
+	def ccftask(ref,downsample,gs,microf,ri,prepref=None):
+		"""Correlates the micrograph with one reference at each in-plane angle. Returns the maximum ccf over the angles
+		and an owner image with the corresponding 'ortid' at each pixel, rather than the ccf for every angle"""
+
+		owner=EMData(gs,gs,1)
+		maxav=Averagers.get("minmax",{"max":1,"owner":owner})
+
+		# references prepared by prepare_refs()
+		if prepref!=None:
+			for ang,dsreff in prepref:
+				ccf=microf.calc_ccf(dsreff)
+				ccf["ortid"]=ri+ang/360.0
+				maxav.add_image(ccf)
+			sys.stdout.write("*")
+			return (maxav.finish(),owner)
 
 		mref=ref.process("mask.soft",{"outer_radius":old_div(ref["nx"],2)-4,"width":3})
 		mref.process_inplace("normalize.unitlen")
@@ -569,9 +734,10 @@ class boxerByRef(QtCore.QObject):
 			#ccf.process_inplace("normalize")
 			ccf["ortid"]=ri+ang/360.0			# integer portion is projection number, fractional portion is angle, should be enough precision with the ~100 references we're using
 
-			jsd.put(ccf)
+			maxav.add_image(ccf)
 		
 		sys.stdout.write("*")
+		return (maxav.finish(),owner)
 		
 class boxerLocal(QtCore.QObject):
 	"""Reference based search by downsampling and 2-D alignment to references"""
@@ -609,38 +775,21 @@ class boxerLocal(QtCore.QObject):
 		r=goodrefs[0].process("math.fft.resample",{"n":downsample})
 		r.align("rotate_translate",r)
 		
-		jsd=queue.Queue(0)
-		thrds=[threading.Thread(target=boxerLocal.ccftask,args=(jsd,ref,downsample,microdown,ri)) for ri,ref in enumerate(goodrefs)]
-
-		n=-1
-
-		# here we run the threads and save the results, no actual alignment done here
-		print(len(thrds)," threads")
-		thrtolaunch=0
-		while thrtolaunch<len(thrds) or threading.active_count()>1:
-			# If we haven't launched all threads yet, then we wait for an empty slot, and launch another
-			# note that it's ok that we wait here forever, since there can't be new results if an existing
-			# thread hasn't finished.
-			if thrtolaunch<len(thrds) and threading.active_count()!=nthreads:
-#				print "Starting thread {}/{}".format(thrtolaunch,len(thrds))
-				thrds[thrtolaunch].start()
-				thrtolaunch+=1
-			else: 
-				time.sleep(0.05)
-				if prog!=None : 
-					prog.setValue(prog.value())
-					if prog.wasCanceled() : break
-		
-			while not jsd.empty():
-				# add each ccf image to our maxval image as it comes in
-				ccf=jsd.get()
-				maxav.add_image(ccf)
-				sys.stdout.flush()
+		def poll():
+			if prog!=None :
+				prog.setValue(prog.value())
+				if prog.wasCanceled() : return False
+			return True
+
+		# one reference per job
+		ex=EMExecutor(nthreads,maxpending=2*nthreads)
+		print(len(goodrefs)," jobs")
+		for ccfs in ex.starmap(boxerLocal.ccftask,[(ref,downsample,microdown,ri) for ri,ref in enumerate(goodrefs)],poll):
+			# add each ccf image to our maxval image as it comes in
+			for ccf in ccfs : maxav.add_image(ccf)
+			sys.stdout.flush()
 		print("")
 
-		for t in thrds:
-			t.join()
-
 			
 		final=maxav.finish()
 		# smooth out a few spurious peaks. Hopefully doesn't mess up ownership assignment significantly
@@ -704,7 +853,7 @@ class boxerLocal(QtCore.QObject):
 
 
 	@staticmethod
-	def ccftask(jsd,ref,downsample,microdown,ri):
+	def ccftask(ref,downsample,microdown,ri):
 
 		mref=ref.process("mask.soft",{"outer_radius":old_div(ref["nx"],2)-4,"width":3})
 		mref.process_inplace("math.fft.resample",{"n":downsample})
@@ -734,8 +883,8 @@ class boxerLocal(QtCore.QObject):
 				ay=int(ay+y+old_div(nxdown,2))
 				if frc>ptclmap[ax,ay] : ptclmap[ax,ay]=frc
 		
-		jsd.put(ptclmap)
 		sys.stdout.write("*")
+		return [ptclmap]
 		
 
 
@@ -1102,51 +1251,36 @@ class boxerConvNet(QtCore.QObject):
 			jobs.append((fsp, i, layers, shrinkfac, nx, ny))
 		
 		#### worker function
-		def autobox_worker(que, job):
+		def autobox_worker(job):
 			fname, idx, layers, shrinkfac, nx, ny = job
 			nnout=boxerConvNet.apply_network(fname, layers, shrinkfac, nx, ny, nnet_classify, params)
-			que.put((idx, fname,  nnout))
-			return
+			return (idx, fname,  nnout)
 		
 		#### now start autoboxing...
-		jsd=queue.Queue(0)
-		NTHREADS=max(nthreads+1,2)
-		thrds=[threading.Thread(target=autobox_worker,args=(jsd,job)) for job in jobs]
-		thrtolaunch=0
-		while thrtolaunch<len(thrds) or threading.active_count()>1:
-			#print thrtolaunch, len(thrds)
-			if thrtolaunch<len(thrds) :
+		ex=EMExecutor(nthreads,maxpending=2*nthreads)
+		for ndone,(idx, fsp, nnout) in enumerate(ex.map(autobox_worker,jobs)):
+			newboxes, nbad = nnout
+			print("{}) {} boxes, excluding {} bad -> {}".format(idx,len(newboxes), nbad,fsp))
+			if prog:
+				prog.setValue(ndone+1)
+	
+			# if we got nothing, we just leave the current results alone
+			if len(newboxes)==0 : continue
+		
+			# read the existing box list and update
+			db=js_open_dict(info_name(fsp))
+			try: 
+				boxes=db["boxes"]
+				# Filter out all existing boxes for this picking mode
+				bname=newboxes[0][2]
+				boxes=[b for b in boxes if b[2]!=bname]
+			except:
+				boxes=[]
 				
-				while (threading.active_count()==NTHREADS ) : time.sleep(.1)
-				print("Starting on img {}...".format(thrtolaunch))
-				thrds[thrtolaunch].start()
-				thrtolaunch+=1
-			else: time.sleep(1)
-		
-			while not jsd.empty():
-				idx, fsp, nnout=jsd.get()
-				newboxes, nbad = nnout
-				print("{}) {} boxes, excluding {} bad -> {}".format(i,len(newboxes), nbad,fsp))
-		
-				# if we got nothing, we just leave the current results alone
-				if len(newboxes)==0 : continue
+			boxes.extend(newboxes)
 			
-				# read the existing box list and update
-				db=js_open_dict(info_name(fsp))
-				try: 
-					boxes=db["boxes"]
-					# Filter out all existing boxes for this picking mode
-					bname=newboxes[0][2]
-					boxes=[b for b in boxes if b[2]!=bname]
-				except:
-					boxes=[]
-					
-				boxes.extend(newboxes)
-				
-				db["boxes"]=boxes
-				db.close()
-				if prog:
-					prog.setValue(thrtolaunch-threading.active_count())
+			db["boxes"]=boxes
+			db.close()
 				
 		return
 
@@ -1935,6 +2069,9 @@ class GUIBoxer(QtGui.QWidget):
 			micrograph=load_micrograph(fsp)
 
 			newboxes=cls.do_autobox(micrograph,self.goodrefs,self.badrefs,self.bgrefs,self.vbbapix.getValue(),self.vbthreads.getValue(),{},prog)
+			if newboxes==None :
+				print("Autoboxing Aborted!")
+				break
 			newboxes=[b for b in newboxes if b[0]-boxsize2>=0 and b[1]-boxsize2>=0 and b[0]+boxsize2<micrograph["nx"] and b[1]+boxsize2<micrograph["ny"]]
 
 			print("{}) {} boxes -> {}".format(i,len(newboxes),fsp))
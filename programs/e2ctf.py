@@ -48,7 +48,8 @@ import weakref
 import traceback
 from numpy import array,arange
 import numpy
-import threading
+import time
+import multiprocessing
 
 from Simplex import Simplex
 
@@ -127,7 +128,7 @@ NOTE: This program should be run from the project directory, not from within the
 	parser.add_argument("--extrapad",action="store_true",help="If particles were boxed more tightly than EMAN requires, this will add some extra padding, but only to processed output particles",default=False, guitype='boolbox', row=5, col=2, rowspan=1, colspan=1, mode='genoutp[False]')
 	parser.add_argument("--phaseflipsmall",action="store_true",help="Produce an output set with 1/2 size particles for faster initial model work",default=False, guitype='boolbox', row=6, col=0, rowspan=1, colspan=1, mode='genoutp[True]')
 	parser.add_argument("--wiener",action="store_true",help="Wiener filter (optionally phaseflipped) particles.",default=False, guitype='boolbox', row=6, col=1, rowspan=1, colspan=1, mode='genoutp[True]')
-	parser.add_argument("--proctag",help="Tag added to the name of each particle when using the phaseflipproc options",default="proc", guitype='strbox', row=8, col=0, rowspan=1, colspan=1, mode='genoutp["proc"]')
+	parser.add_argument("--proctag",action="append",help="Tag added to the name of each particle when using the phaseflipproc options. May be specified multiple times as tag=proc1;proc2;... (processors separated by ';') to generate several processed particle sets in a single pass, with each particle read and phase flipped only once",default=None, guitype='strbox', row=8, col=0, rowspan=1, colspan=1, mode='genoutp["proc"]')
 	parser.add_argument("--phaseflipproc",help="If specified _proc particles will be generated. Typical = filter.lowpass.gauss:cutoff_freq=.07",default=None, guitype='strbox', row=9, col=0, rowspan=1, colspan=3, mode='genoutp["filter.lowpass.gauss:cutoff_freq=.07"]')
 	parser.add_argument("--phaseflipproc2",help="If specified _proc particles will be generated. Typical = filter.highpass.gauss:cutoff_freq=.005",default=None, guitype='strbox', row=10, col=0, rowspan=1, colspan=3, mode='genoutp["filter.highpass.gauss:cutoff_freq=.005"]')
 	parser.add_argument("--phaseflipproc3",help="If specified _proc particles will be generated. Typical = math.meanshrink:n=2",default=None, guitype='strbox', row=11, col=0, rowspan=1, colspan=3, mode='genoutp["math.meanshrink:n=2"]')
@@ -140,7 +141,7 @@ NOTE: This program should be run from the project directory, not from within the
 	parser.add_argument("--classify",type=int,help="Highly experimental ! Subclassify particles (hopefully by defocus) into n groups.",default=0)
 	parser.add_argument("--sf",type=str,help="The name of a file containing a structure factor curve. Specify 'none' to use the built in generic structure factor. Default=auto",default="auto",guitype='strbox',nosharedb=True,returnNone=True,row=16,col=1,rowspan=1,colspan=1, mode='autofit,tuning')
 	parser.add_argument("--parallel", default=None, help="parallelism argument. This program supports only thread:<n>")
-	parser.add_argument("--threads", default=1,type=int,help="Number of threads to run in parallel on a single computer when multi-computer parallelism isn't useful",guitype='intbox', row=16, col=2, rowspan=1, colspan=1, mode='autofit[1]')
+	parser.add_argument("--threads", default=1,type=int,help="Number of processes to run in parallel on a single computer. Micrographs are distributed over the processes for fitting and particle output",guitype='intbox', row=16, col=2, rowspan=1, colspan=1, mode='autofit[1]')
 	parser.add_argument("--debug",action="store_true",default=False)
 	parser.add_argument("--dbds",type=str,default=None,help="Obsolete option for old e2workflow. Present only to provide warning messages.")
 	parser.add_argument("--source_image",type=str,default=None,help="Filters particles only with matching ptcl_source_image parameters in the header")
@@ -153,6 +154,14 @@ NOTE: This program should be run from the project directory, not from within the
 		print("--dbds no longer supported, as this was part of the retired e2workflow interface. Exiting.")
 		sys.exit(1)
 
+	# --proctag may be a plain tag for use with --phaseflipproc*, or any number of tag=proc1;proc2;... specifications
+	if options.proctag==None : options.proctag=["proc"]
+	options.procspecs=[(t.split("=",1)[0],t.split("=",1)[1].split(";")) for t in options.proctag if "=" in t]
+	options.proctag=[t for t in options.proctag if "=" not in t]+["proc"]
+	if options.phaseflipproc!=None and len(options.proctag)>2 :
+		print("ERROR: only one plain --proctag may be used with --phaseflipproc")
+		sys.exit(1)
+
 	if options.threads : nthreads=options.threads
 	elif options.parallel!=None :
 		if options.parallel[:7]!="thread:":
@@ -235,18 +244,10 @@ NOTE: This program should be run from the project directory, not from within the
 
 	options.filenames = args
 
-	# This is where threading occurs, we call ourselves recursively here if we have --threads
-	if nthreads>1 and not options.gui and not options.computesf:
-		print("Fitting in parallel with ",nthreads," threads")
-		chunksize=int(ceil(old_div(float(len(args)),nthreads)))
-#		print " ".join(sys.argv+["--chunk={},{}".format(chunksize,0)])
-		threads=[threading.Thread(target=os.system,args=[" ".join(sys.argv+["--chunk={},{}".format(chunksize,i)])]) for i in range(nthreads)]
-		for t in threads: t.start()
-		for t in threads: t.join()
-		print("Parallel fitting complete")
-		E2end(logid)
-		sys.exit(0)
-		
+	# Fitting and particle output are parallelized over micrographs in worker processes, see ctf_map()
+	options.threads=nthreads
+	if nthreads>1 : print("Processing in parallel with ",nthreads," processes")
+
 	### Power spectrum and CTF fitting
 	img_sets=None
 	if options.autofit:
@@ -285,7 +286,7 @@ NOTE: This program should be run from the project directory, not from within the
 	### Process input files
 	if debug : print("Phase flipping / Wiener filtration")
 	# write wiener filtered and/or phase flipped particle data to the local database
-	if options.phaseflip or options.wiener or options.phasefliphp or options.phaseflipsmall or options.phaseflipproc or options.storeparm: # only put this if statement here to make the program flow obvious
+	if options.phaseflip or options.wiener or options.phasefliphp or options.phaseflipsmall or options.phaseflipproc or len(options.procspecs)>0 or options.storeparm: # only put this if statement here to make the program flow obvious
 		write_e2ctf_output(options) # converted to a function so to work with the workflow
 
 	if options.computesf :
@@ -402,63 +403,72 @@ def write_e2ctf_output(options):
 	"write wiener filtered and/or phase flipped particle data to the local database"
 	global logid
 
-	if options.phaseflip or options.wiener or options.phasefliphp or options.phaseflipproc!=None or options.storeparm:
-		for i,filename in enumerate(options.filenames):
-			name=base_name(filename)
-			if debug: print("Processing ",filename)
-			try: im=EMData(filename,0,True)
-			except:
-				print("Error processing {}. Does not appear to be an image stack. Skipping.".format(filename))
-				continue
+	if options.phaseflip or options.wiener or options.phasefliphp or options.phaseflipproc!=None or len(options.procspecs)>0 or options.storeparm:
+		for i,(filename,t) in enumerate(ctf_map(write_e2ctf_micrograph,options)):
+			if options.verbose : print("{} processed in {:1.1f} s".format(filename,t))
+			if logid : E2progress(logid,old_div(float(i+1),len(options.filenames)))
+
+def write_e2ctf_micrograph(options,filename):
+	"""Writes the requested phase flipped/filtered particles for a single particle stack. Returns (filename,time)"""
+	t0=time.time()
+	name=base_name(filename)
+	if debug: print("Processing ",filename)
+	try: im=EMData(filename,0,True)
+	except:
+		print("Error processing {}. Does not appear to be an image stack. Skipping.".format(filename))
+		return filename,time.time()-t0
 
-			if options.phaseflip: phaseout=get_ptcl_name(filename, "flip")
-			else: phaseout=None
+	if options.phaseflip: phaseout=get_ptcl_name(filename, "flip")
+	else: phaseout=None
 
-			if options.phasefliphp: phasehpout=get_ptcl_name(filename, "flip_hp")
-			else: phasehpout=None
+	if options.phasefliphp: phasehpout=get_ptcl_name(filename, "flip_hp")
+	else: phasehpout=None
 
-			if options.phaseflipsmall: phasesmout=get_ptcl_name(filename, "flip_small")
-			else: phasesmout=None
+	if options.phaseflipsmall: phasesmout=get_ptcl_name(filename, "flip_small")
+	else: phasesmout=None
 
-			if options.wiener:
-				if options.autohp: wienerout=get_ptcl_name(filename, "wiener_hp")
-				else: wienerout=get_ptcl_name(filename, "wiener")
-			else : wienerout=None
+	if options.wiener:
+		if options.autohp: wienerout=get_ptcl_name(filename, "wiener_hp")
+		else: wienerout=get_ptcl_name(filename, "wiener")
+	else : wienerout=None
 
-			phaseprocout=None
-			if options.phaseflipproc!=None:
-				phaseprocout=[get_ptcl_name(filename, "flip_{}".format(options.proctag)),parsemodopt(options.phaseflipproc)]
+	phaseprocout=[]
+	for tag,procs in options.procspecs:
+		phaseprocout.append([get_ptcl_name(filename, "flip_{}".format(tag))]+[parsemodopt(p) for p in procs])
 
-				if options.phaseflipproc2!=None:
-					phaseprocout.append(parsemodopt(options.phaseflipproc2))
+	if options.phaseflipproc!=None:
+		phaseprocout.append([get_ptcl_name(filename, "flip_{}".format(options.proctag[0])),parsemodopt(options.phaseflipproc)])
 
-				if options.phaseflipproc3!=None:
-					phaseprocout.append(parsemodopt(options.phaseflipproc3))
+		if options.phaseflipproc2!=None:
+			phaseprocout[-1].append(parsemodopt(options.phaseflipproc2))
 
-				if options.phaseflipproc4!=None:
-					phaseprocout.append(parsemodopt(options.phaseflipproc4))
+		if options.phaseflipproc3!=None:
+			phaseprocout[-1].append(parsemodopt(options.phaseflipproc3))
 
-				if options.phaseflipproc5!=None:
-					phaseprocout.append(parsemodopt(options.phaseflipproc5))
+		if options.phaseflipproc4!=None:
+			phaseprocout[-1].append(parsemodopt(options.phaseflipproc4))
 
-			try:
-				js=js_open_dict(info_name(filename))
-				ctf=js["ctf"][0]		# EMAN2CTF object from disk
-				js.close()
-			except:
-				print("No CTF parameters found in {}, skipping {}.".format(info_name(filename),filename))
-				continue
-			if options.constbfactor>0: ctf.bfactor=options.constbfactor
+		if options.phaseflipproc5!=None:
+			phaseprocout[-1].append(parsemodopt(options.phaseflipproc5))
 
-			if phaseout : print("Phase image out: ",phaseout,"\t", end=' ')
-			if phaseprocout : print("Processed phase image out: ",phaseprocout[0],"\t", end=' ')
-			if phasehpout : print("Phase-hp image out: ",phasehpout,"\t", end=' ')
-			if wienerout : print("Wiener image out: ",wienerout, end=' ')
-			print("  defocus=",ctf.defocus)
+	try:
+		js=js_open_dict(info_name(filename))
+		ctf=js["ctf"][0]		# EMAN2CTF object from disk
+		js.close()
+	except:
+		print("No CTF parameters found in {}, skipping {}.".format(info_name(filename),filename))
+		return filename,time.time()-t0
+	if options.constbfactor>0: ctf.bfactor=options.constbfactor
 
-			process_stack(filename,phaseout,phasehpout,phasesmout,wienerout,phaseprocout,options.extrapad,not options.nonorm,options.oversamp,ctf,invert=options.invert,storeparm=options.storeparm,source_image=options.source_image,zero_ok=options.zerook)
+	if phaseout : print("Phase image out: ",phaseout,"\t", end=' ')
+	for p in phaseprocout : print("Processed phase image out: ",p[0],"\t", end=' ')
+	if phasehpout : print("Phase-hp image out: ",phasehpout,"\t", end=' ')
+	if wienerout : print("Wiener image out: ",wienerout, end=' ')
+	print("  defocus=",ctf.defocus)
 
-			if logid : E2progress(logid,old_div(float(i+1),len(options.filenames)))
+	process_stack(filename,phaseout,phasehpout,phasesmout,wienerout,phaseprocout,options.extrapad,not options.nonorm,options.oversamp,ctf,invert=options.invert,storeparm=options.storeparm,source_image=options.source_image,zero_ok=options.zerook)
+
+	return filename,time.time()-t0
 
 def compute_envelope(img_sets,smax=.06):
 		"""This computes the intensity of the background subtracted power spectrum around each CTF maximum for
@@ -555,114 +565,169 @@ def fixnegbg(bg_1d,im_1d,ds):
 
 def pspec_and_ctf_fit(options,debug=False):
 	"""Power spectrum and CTF fitting. Returns an 'image sets' list. Each item in this list contains
-	filename,EMAN2CTF,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d/None"""
+	filename,EMAN2CTF,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d/None. Micrographs are fit in parallel
+	when options.threads>1. The info files are all updated by this process once fitting is complete. The
+	time spent fitting each micrograph is stored in options.fittimes."""
 	global logid
 	img_sets=[]
-	#db_parms=db_open_dict("bdb:e2ctf.parms")
-	#db_im2d=db_open_dict("bdb:e2ctf.im2d")
-	#db_bg2d=db_open_dict("bdb:e2ctf.bg2d")
+	updates=[]
+	options.fittimes={}
+	apix=None
 
-	for i,filename in enumerate(options.filenames):
-		name=base_name(filename)
-		try : js_parms=js_open_dict(info_name(filename))
-		except :
-			print("ERROR: Cannot open {} for metadata storage. Exiting.".format(info_name(filename)))
-			sys.exit(1)
+	for i,(filename,fsets,jsupdate,fapix,t) in enumerate(ctf_map(ctf_fit_micrograph,options,debug)):
+		options.fittimes[filename]=t
+		if options.verbose : print("{} fit in {:1.1f} s".format(filename,t))
+		if logid : E2progress(logid,old_div(float(i+1),len(options.filenames)))
+		if fsets==None : continue
+		img_sets.extend(fsets)
+		updates.append((filename,jsupdate))
+		apix=fapix
 
-		# compute the power spectra
-		if options.verbose or debug : print("Processing ",filename)
-		apix=options.apix
-		if apix<=0 : apix=EMData(filename,0,1)["apix_x"]
-
-		# After this, PS contains a list of (im_1d,bg_1d,im_2d,bg_2d,bg_1d_low) tuples. If classify is <2 then this list will have only 1 tuple in it
-		if options.classify>1 : ps=split_powspec_with_bg(filename,options.source_image,radius=options.bgmask,edgenorm=not options.nonorm,oversamp=options.oversamp,apix=apix,nclasses=options.classify,zero_ok=options.zerook)
-		else: ps=list((powspec_with_bg(filename,options.source_image,radius=options.bgmask,edgenorm=not options.nonorm,oversamp=options.oversamp,apix=apix,zero_ok=options.zerook,wholeimage=options.wholeimage,highdensity=options.highdensity),))
-		# im_1d,bg_1d,im_2d,bg_2d,bg_1d_low,micro_1d/none
-		if ps==None :
-			print("Error fitting CTF on ",filename)
-			continue
-		try: ds=1.0/(apix*ps[0][2].get_ysize())
-		except:
-			print("Error fitting CTF (ds) on ",filename)
-			continue
+	# store the results back in the database, one update per info file
+	for filename,jsupdate in updates:
+		js_parms=js_open_dict(info_name(filename))
+		if jsupdate["ctf_microbox"]==None :
+			js_parms.delete("ctf_microbox",deferupdate=True)
+			del jsupdate["ctf_microbox"]
+		js_parms.update(jsupdate)
+		js_parms.close()
 
-		for j,p in enumerate(ps):
-			try: im_1d,bg_1d,im_2d,bg_2d,bg_1d_low,micro_1d=p
-			except:
-				im_1d,bg_1d,im_2d,bg_2d,bg_1d_low=p
-				micro_1d=None
-			if not options.nosmooth : bg_1d=smooth_bg(bg_1d,ds)
-			if options.fixnegbg :
-				bg_1d=fixnegbg(bg_1d,im_1d,ds)		# This insures that we don't have unreasonable negative values
+	if len(options.fittimes)>0 :
+		t=list(options.fittimes.values())
+		print("CTF fitting time per micrograph: mean {:1.1f} s, max {:1.1f} s ({})".format(old_div(sum(t),len(t)),max(t),max(list(options.fittimes.items()),key=lambda x:x[1])[0]))
 
-			if debug: Util.save_data(0,ds,bg_1d,"ctf.bgb4.txt")
+	project_db = js_open_dict("info/project.json")
+	try: project_db.update({ "global.microscope_voltage":options.voltage, "global.microscope_cs":options.cs, "global.apix":apix })
+	except:
+		print("ERROR: apix not found. This probably means that no CTF curves were sucessfully fit !")
+
+	return img_sets
+
+def ctf_fit_micrograph(options,filename,debug=False):
+	"""Computes the power spectra and fits the CTF for a single particle stack. The info file is only read, so
+	this may be run in a worker process. Returns (filename,img_sets,jsupdate,apix,time), where jsupdate is a
+	dictionary of values to store in the info file. img_sets and jsupdate are None if the fit failed."""
+	t0=time.time()
+	img_sets=[]
+	jsupdate={}
+	name=base_name(filename)
+	try : js_parms=js_open_dict(info_name(filename))
+	except : raise Exception("Cannot open {} for metadata storage".format(info_name(filename)))
+
+	# compute the power spectra
+	if options.verbose or debug : print("Processing ",filename)
+	apix=options.apix
+	if apix<=0 : apix=EMData(filename,0,1)["apix_x"]
+
+	# After this, PS contains a list of (im_1d,bg_1d,im_2d,bg_2d,bg_1d_low) tuples. If classify is <2 then this list will have only 1 tuple in it
+	if options.classify>1 : ps=split_powspec_with_bg(filename,options.source_image,radius=options.bgmask,edgenorm=not options.nonorm,oversamp=options.oversamp,apix=apix,nclasses=options.classify,zero_ok=options.zerook)
+	else: ps=list((powspec_with_bg(filename,options.source_image,radius=options.bgmask,edgenorm=not options.nonorm,oversamp=options.oversamp,apix=apix,zero_ok=options.zerook,wholeimage=options.wholeimage,highdensity=options.highdensity),))
+	# im_1d,bg_1d,im_2d,bg_2d,bg_1d_low,micro_1d/none
+	if ps==None :
+		print("Error fitting CTF on ",filename)
+		return filename,None,None,apix,time.time()-t0
+	try: ds=1.0/(apix*ps[0][2].get_ysize())
+	except:
+		print("Error fitting CTF (ds) on ",filename)
+		return filename,None,None,apix,time.time()-t0
 
-			# Fit the CTF parameters
-			if debug : print("Fit CTF")
-			if options.curdefocushint or options.curdefocusfix:
+	for j,p in enumerate(ps):
+		try: im_1d,bg_1d,im_2d,bg_2d,bg_1d_low,micro_1d=p
+		except:
+			im_1d,bg_1d,im_2d,bg_2d,bg_1d_low=p
+			micro_1d=None
+		if not options.nosmooth : bg_1d=smooth_bg(bg_1d,ds)
+		if options.fixnegbg :
+			bg_1d=fixnegbg(bg_1d,im_1d,ds)		# This insures that we don't have unreasonable negative values
+
+		if debug: Util.save_data(0,ds,bg_1d,"ctf.bgb4.txt")
+
+		# Fit the CTF parameters
+		if debug : print("Fit CTF")
+		if options.curdefocushint or options.curdefocusfix:
+			try:
+				if options.useframedf : raise Exception		# a bit of a hack...
+				ctf=js_parms["ctf"][0]
+				ctf.apix=apix
+				curdf=ctf.defocus
+				curdfdiff=ctf.dfdiff
+				curdfang=ctf.dfang
+				if options.curdefocushint: dfhint=(curdf-0.1,curdf+0.1)
+				else: dfhint=(curdf-.001,curdf+.001)
+				print("Using existing defocus as hint :",dfhint)
+			except :
 				try:
-					if options.useframedf : raise Exception		# a bit of a hack...
-					ctf=js_parms["ctf"][0]
+					ctf=js_parms["ctf_frame"][1]
 					ctf.apix=apix
 					curdf=ctf.defocus
 					curdfdiff=ctf.dfdiff
 					curdfang=ctf.dfang
 					if options.curdefocushint: dfhint=(curdf-0.1,curdf+0.1)
 					else: dfhint=(curdf-.001,curdf+.001)
-					print("Using existing defocus as hint :",dfhint)
-				except :
-					try:
-						ctf=js_parms["ctf_frame"][1]
-						ctf.apix=apix
-						curdf=ctf.defocus
-						curdfdiff=ctf.dfdiff
-						curdfang=ctf.dfang
-						if options.curdefocushint: dfhint=(curdf-0.1,curdf+0.1)
-						else: dfhint=(curdf-.001,curdf+.001)
-						print("Using existing defocus from frame as hint :",dfhint)
-					except:
-						dfhint=None
-						print("No existing defocus to start with")
-			else: dfhint=(options.defocusmin,options.defocusmax)
-			ctf=ctf_fit(im_1d,bg_1d,bg_1d_low,im_2d,bg_2d,options.voltage,max(options.cs,0.01),options.ac,options.phaseplate,apix,bgadj=not options.nosmooth,autohp=options.autohp,dfhint=dfhint,highdensity=options.highdensity,verbose=options.verbose)
-			if options.astigmatism and not options.curdefocusfix : ctf_fit_stig(im_2d,bg_2d,ctf,verbose=1)
-			elif options.astigmatism:
-				ctf.dfdiff=curdfdiff
-				ctf.dfang=curdfang
-
-			im_1d,bg_1d=calc_1dfrom2d(ctf,im_2d,bg_2d)
-			if options.constbfactor>0 : ctf.bfactor=options.constbfactor
-			else: ctf.bfactor=ctf_fit_bfactor(list(array(im_1d)-array(bg_1d)),ds,ctf)
-
-
-			if debug:
-				Util.save_data(0,ds,im_1d,"ctf.fg.txt")
-				Util.save_data(0,ds,bg_1d,"ctf.bg.txt")
-				Util.save_data(0,ds,ctf.snr,"ctf.snr.txt")
-
-			try : qual=js_parms["quality"]
-			except :
-				qual=5
-				js_parms["quality"]=5
-			if j==0: img_sets.append([filename,ctf,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d])
-			else: img_sets.append([filename+"_"+str(j),ctf,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d])
-
-		# store the results back in the database. We omit the filename, quality and bg_1d_low (which can be easily recomputed)
-		if img_sets[-1][-1]==None: js_parms.delete("ctf_microbox")
-		else: js_parms["ctf_microbox"]=img_sets[-1][-1]
-		js_parms["ctf"]=img_sets[-1][1:4]
-		js_parms["ctf_im2d"]=img_sets[-1][4]
-		js_parms["ctf_bg2d"]=img_sets[-1][5]
-		js_parms.close()
+					print("Using existing defocus from frame as hint :",dfhint)
+				except:
+					dfhint=None
+					print("No existing defocus to start with")
+		else: dfhint=(options.defocusmin,options.defocusmax)
+		ctf=ctf_fit(im_1d,bg_1d,bg_1d_low,im_2d,bg_2d,options.voltage,max(options.cs,0.01),options.ac,options.phaseplate,apix,bgadj=not options.nosmooth,autohp=options.autohp,dfhint=dfhint,highdensity=options.highdensity,verbose=options.verbose)
+		if options.astigmatism and not options.curdefocusfix : ctf_fit_stig(im_2d,bg_2d,ctf,verbose=1)
+		elif options.astigmatism:
+			ctf.dfdiff=curdfdiff
+			ctf.dfang=curdfang
+
+		im_1d,bg_1d=calc_1dfrom2d(ctf,im_2d,bg_2d)
+		if options.constbfactor>0 : ctf.bfactor=options.constbfactor
+		else: ctf.bfactor=ctf_fit_bfactor(list(array(im_1d)-array(bg_1d)),ds,ctf)
+
+
+		if debug:
+			Util.save_data(0,ds,im_1d,"ctf.fg.txt")
+			Util.save_data(0,ds,bg_1d,"ctf.bg.txt")
+			Util.save_data(0,ds,ctf.snr,"ctf.snr.txt")
+
+		try : qual=js_parms["quality"]
+		except :
+			qual=5
+			jsupdate["quality"]=5
+		if j==0: img_sets.append([filename,ctf,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d])
+		else: img_sets.append([filename+"_"+str(j),ctf,im_1d,bg_1d,im_2d,bg_2d,qual,bg_1d_low,micro_1d])
+
+	# We omit the filename, quality and bg_1d_low (which can be easily recomputed)
+	jsupdate["ctf_microbox"]=img_sets[-1][-1]
+	jsupdate["ctf"]=img_sets[-1][1:4]
+	jsupdate["ctf_im2d"]=img_sets[-1][4]
+	jsupdate["ctf_bg2d"]=img_sets[-1][5]
+	js_parms.close()
 
-		if logid : E2progress(logid,old_div(float(i+1),len(options.filenames)))
+	return filename,img_sets,jsupdate,apix,time.time()-t0
 
-	project_db = js_open_dict("info/project.json")
-	try: project_db.update({ "global.microscope_voltage":options.voltage, "global.microscope_cs":options.cs, "global.apix":apix })
-	except:
-		print("ERROR: apix not found. This probably means that no CTF curves were sucessfully fit !")
+def ctf_pool_init(sf,sf2,goodsf,dbg):
+	"""Worker process initializer. The structure factor curves are read once by the parent and passed to each worker"""
+	global sfcurve,sfcurve2,hasgoodsf,debug,logid
+	sfcurve,sfcurve2,hasgoodsf,debug=sf,sf2,goodsf,dbg
+	logid=None
 
-	return img_sets
+def ctf_pool_run(job):
+	fn,args=job
+	return fn(*args)
+
+def ctf_map(fn,options,*args):
+	"""Generator calling fn(options,filename,*args) for each of options.filenames and yielding the results in order.
+	If options.threads>1, the calls are distributed over a pool of worker processes."""
+	nthreads=getattr(options,"threads",1)		# not set when called from the workflow
+	if nthreads==None or nthreads<=1 or len(options.filenames)<2 :
+		for filename in options.filenames : yield fn(options,filename,*args)
+		return
+
+	pool=multiprocessing.Pool(min(nthreads,len(options.filenames)),ctf_pool_init,(sfcurve,sfcurve2,hasgoodsf,debug))
+	try:
+		for r in pool.imap(ctf_pool_run,[(fn,(options,filename)+args) for filename in options.filenames]) : yield r
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
 
 def refine_and_smoothsnr(options,strfact,debug=False):
 	"""This will refine already determined defocus values by maximizing high-resolution smoothed
@@ -764,8 +829,13 @@ def process_stack(stackfile,phaseflip=None,phasehp=None,phasesmall=None,wiener=N
 	phaseflip should be the path for writing the phase-flipped particles
 	wiener should be the path for writing the Wiener filtered (and possibly phase-flipped) particles
 	oversamp will oversample as part of the processing, ostensibly permitting phase-flipping on a wider range of defocus values
+	phaseproc is a list of [output path, (processor,parms), ...] lists. Each particle is phase flipped once, then each processor
+	chain is applied to a copy and written to its own output. A single [output path, ...] list is also accepted.
 	"""
 
+	if phaseproc!=None and len(phaseproc)>0 and not isinstance(phaseproc[0],list) : phaseproc=[phaseproc]
+	if phaseproc!=None and len(phaseproc)==0 : phaseproc=None
+
 	im=EMData(stackfile,0)
 	ys=im.get_ysize()*oversamp
 	ys2=im.get_ysize()
@@ -877,14 +947,14 @@ def process_stack(stackfile,phaseflip=None,phasehp=None,phasesmall=None,wiener=N
 					x = EMData(phaseflip,i,False)
 					print(x.get_attr_dict())
 					display(x)
-			if phaseproc!=None:
+			for pp in (phaseproc if phaseproc!=None else []):
 				out2=out.copy()				# processor may or may not be in Fourier space
 				out2["ctf"]=ctf
 				out2["apix_x"] = ctf.apix
 				out2["apix_y"] = ctf.apix
 				out2["apix_z"] = ctf.apix
 				# we take a sequence of processor option 2-tuples
-				for op in phaseproc[1:]:
+				for op in pp[1:]:
 					if op[0]=="math.bispectrum.slice" and extrapad:
 						pad=good_size(out2["ny"]*1.25)
 						out2.clip_inplace(Region(old_div(-(pad-out2["nx"]),2),old_div(-(pad-out2["ny"]),2),pad,pad))
@@ -898,7 +968,7 @@ def process_stack(stackfile,phaseflip=None,phasehp=None,phasesmall=None,wiener=N
 				if extrapad and out2["nx"]==out2["ny"]:
 					pad=good_size(out2["ny"]*1.25)
 					out2.clip_inplace(Region(old_div(-(pad-out2["nx"]),2),old_div(-(pad-out2["ny"]),2),pad,pad))
-				out2.write_image(phaseproc[0],i)
+				out2.write_image(pp[0],i)
 
 			if phasehp:
 				fft2=fft1.copy()
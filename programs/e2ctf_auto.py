@@ -348,65 +348,36 @@ resolution, but for high resolution work, fitting defocus/astig from frames is r
 	if options.extrapad : extrapad="--extrapad"
 	else : extrapad=""
 
-	if options.lores :
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp20 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.05 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad1,maskwid=maskwid1,resamp=resample1,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		E2progress(logid,0.85)
-
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp12 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.08333 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad3,maskwid=maskwid3,resamp=resample3,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-
-		print("Phase-flipped output files:\n__ctf_flip_lp20 - masked, downsampled, filtered to 20 A resolution\n__ctf_flip_lp12 - masked, downsampled, filtered to 12 A resolution")
+	# All of the processed particle sets are generated by a single e2ctf.py run, so each particle is only read and
+	# phase flipped once. Each --proctag is tag=processor;processor;...
+	lpspec="{tag}=filter.highpass.gauss:cutoff_pixels={hpp};filter.lowpass.gauss:cutoff_freq={lp};normalize.circlemean:width={maskwid}:radius={maskrad};mask.soft:outer_radius={maskrad}:width={maskwid};math.fft.resample:n={resamp}"
+	fullspec="fullres=filter.highpass.gauss:cutoff_pixels={hpp};normalize.circlemean:width={maskwid}:radius={maskrad};mask.soft:outer_radius={maskrad}:width={maskwid}".format(
+		maskrad=maskrad4,maskwid=maskwid4,hpp=hppixels)
+	bispecspec="bispec=filter.highpass.gauss:cutoff_freq=0.01;normalize.circlemean:width={maskwid}:radius={maskrad};mask.soft:outer_radius={maskrad}:width={maskwid};math.bispectrum.slice:size={bssz}:fp={bsfp}".format(
+		maskrad=maskrad4,maskwid=maskwid4,bssz=bispec_invar_parm[0],bsfp=bispec_invar_parm[1])
 
+	if options.lores :
+		specs=[lpspec.format(tag="lp20",lp=0.05,maskrad=maskrad1,maskwid=maskwid1,resamp=resample1,hpp=hppixels),
+			lpspec.format(tag="lp12",lp=0.08333,maskrad=maskrad3,maskwid=maskwid3,resamp=resample3,hpp=hppixels)]
+		outdesc="__ctf_flip_lp20 - masked, downsampled, filtered to 20 A resolution\n__ctf_flip_lp12 - masked, downsampled, filtered to 12 A resolution"
 	elif options.midres:
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp20 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.05 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad1,maskwid=maskwid1,resamp=resample1,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		E2progress(logid,0.8)
-
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp7 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.14 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad2,maskwid=maskwid2,resamp=resample2,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		E2progress(logid,0.9)
-
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag fullres --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc3 mask.soft:outer_radius={maskrad}:width={maskwid} {extrapad} --threads {threads}".format(
-			maskrad=maskrad4,maskwid=maskwid4,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		print("Phase-flipped output files:\n__ctf_flip_lp20 - masked, downsampled, filtered to 20 A resolution\n__ctf_flip_lp7 - masked, downsampled, filtered to 7 A resolution\n__ctf_flip_fullres - masked, full sampling")
-
+		specs=[lpspec.format(tag="lp20",lp=0.05,maskrad=maskrad1,maskwid=maskwid1,resamp=resample1,hpp=hppixels),
+			lpspec.format(tag="lp7",lp=0.14,maskrad=maskrad2,maskwid=maskwid2,resamp=resample2,hpp=hppixels),
+			fullspec]
+		outdesc="__ctf_flip_lp20 - masked, downsampled, filtered to 20 A resolution\n__ctf_flip_lp7 - masked, downsampled, filtered to 7 A resolution\n__ctf_flip_fullres - masked, full sampling"
 	else :
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp12 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.08333 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad3,maskwid=maskwid3,resamp=resample3,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		E2progress(logid,0.8)
-
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag lp5 --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 filter.lowpass.gauss:cutoff_freq=0.2 --phaseflipproc3 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc4 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc5 math.fft.resample:n={resamp} {extrapad} --threads {threads}".format(
-			maskrad=maskrad5,maskwid=maskwid5,resamp=resample5,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		launch_childprocess(com)
-		E2progress(logid,0.9)
-
-		com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag fullres --phaseflipproc filter.highpass.gauss:cutoff_pixels={hpp} --phaseflipproc2 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc3 mask.soft:outer_radius={maskrad}:width={maskwid} {extrapad} --threads {threads}".format(
-			maskrad=maskrad4,maskwid=maskwid4,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,hpp=hppixels,missingonly=missingonly)
-		if options.verbose: print(com)
-		
-		
-		launch_childprocess(com)
-		print("Phase-flipped output files:\n__ctf_flip_lp12 - masked, downsampled, filtered to 12 A resolution\n__ctf_flip_lp5 - masked, downsampled, filtered to 5 A resolution\n__ctf_flip_fullres - masked, full sampling")
-
-	com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} --proctag bispec --phaseflipproc filter.highpass.gauss:cutoff_freq=0.01 --phaseflipproc2 normalize.circlemean:width={maskwid}:radius={maskrad} --phaseflipproc3 mask.soft:outer_radius={maskrad}:width={maskwid} --phaseflipproc4 math.bispectrum.slice:size={bssz}:fp={bsfp} {extrapad} --threads {threads} ".format(
-		maskrad=maskrad4,maskwid=maskwid4,invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,bssz=bispec_invar_parm[0],bsfp=bispec_invar_parm[1],missingonly=missingonly)
+		specs=[lpspec.format(tag="lp12",lp=0.08333,maskrad=maskrad3,maskwid=maskwid3,resamp=resample3,hpp=hppixels),
+			lpspec.format(tag="lp5",lp=0.2,maskrad=maskrad5,maskwid=maskwid5,resamp=resample5,hpp=hppixels),
+			fullspec]
+		outdesc="__ctf_flip_lp12 - masked, downsampled, filtered to 12 A resolution\n__ctf_flip_lp5 - masked, downsampled, filtered to 5 A resolution\n__ctf_flip_fullres - masked, full sampling"
+	specs.append(bispecspec)
+
+	com="e2ctf.py --allparticles {invert} {missingonly} --minqual={minqual} {specs} {extrapad} --threads {threads}".format(
+		invert=invert,minqual=options.minqual,extrapad=extrapad,threads=options.threads,missingonly=missingonly,specs=" ".join(['--proctag "{}"'.format(i) for i in specs]))
 	if options.verbose: print(com)
 	launch_childprocess(com)
-	print("Phase-flipped output files:\n__ctf_flip_bispec - bispectra footprints computed from high pass filtered normalized particles")
+	E2progress(logid,0.9)
+	print("Phase-flipped output files:\n"+outdesc+"\n__ctf_flip_bispec - bispectra footprints computed from high pass filtered normalized particles")
 
 	print("Building default set with all particles for convenience")
 	com="e2buildsets.py --setname=all --excludebad --allparticles"
@@ -94,11 +94,11 @@ For more information on ctffind3 please see: Mindell, JA, Grigorieff N.  2003.
 				im=info_name(imfsp)		# should work regardless of extension
 				jdb=js_open_dict(im)
 				
-				dfu=star["rlnDefocusU"][i]
-				dfv=star["rlnDefocusV"][i]
-				dfang=star["rlnDefocusAngle"][i]
+				dfu=float(star["rlnDefocusU"][i])
+				dfv=float(star["rlnDefocusV"][i])
+				dfang=float(star["rlnDefocusAngle"][i])
 				ctf=EMAN2Ctf()
-				ctf.from_dict({"defocus":old_div((dfu+dfv),20000.0),"dfang":dfang,"dfdiff":old_div((dfu-dfv),10000.0),"voltage":star["rlnVoltage"][i],"cs":star["rlnSphericalAberration"][i],"ampcont":star["rlnAmplitudeContrast"][i]*100.0,"apix":options.apix})
+				ctf.from_dict({"defocus":old_div((dfu+dfv),20000.0),"dfang":dfang,"dfdiff":old_div((dfu-dfv),10000.0),"voltage":float(star["rlnVoltage"][i]),"cs":float(star["rlnSphericalAberration"][i]),"ampcont":float(star["rlnAmplitudeContrast"][i])*100.0,"apix":options.apix})
 				jdb["ctf_frame"]=[512,ctf,(256,256),tuple(),5,1]
 				js_close_dict(im)
 
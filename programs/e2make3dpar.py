@@ -428,8 +428,8 @@ def initialize_data(inputfile,inputmodel,tltfile,pad,no_weights,preprocess):
 			print("Error : %d images and only %d lines in .tlt file"%(n_input,len(data)))
 			exit(1)
 	else :
-		tmp=EMData()
-		
+		# all of the headers are read in one pass (and cached for later runs), rather than one image at a time
+		keys=["xform.projection","model_id","ptcl_repr","class_qual"]
 		#### deal with lst input with transform in comment
 		getlst=False
 		if inputfile.endswith(".lst"):
@@ -437,33 +437,33 @@ def initialize_data(inputfile,inputmodel,tltfile,pad,no_weights,preprocess):
 			lstinfo=lst.read(0)
 			if lstinfo[2]:
 				getlst=True
+				keys.append("lst_comment")
+
+		hdrs=EMData.read_headers(inputfile,list(range(n_input)),keys)
 
 		for i in range(n_input):
-			tmp.read_image(inputfile,i,True)
-			#else : tmp=get_processed_image(inputfile,i,-1,preprocess,pad)
 			# these rely only on the header
 			
 			if getlst:
-				lstinfo=lst.read(i)
-				dc=eval(lstinfo[2])
+				dc=eval(hdrs["lst_comment"][i])
 				if "score" in dc:
 					score=dc.pop("score")
 				else:
 					score=2
 				elem={"xform":Transform(dc)}
 			else:
-			
-				try: elem={"xform":tmp["xform.projection"]}
-				except : continue
+				elem={"xform":hdrs["xform.projection"][i]}
+				if elem["xform"] is None : continue
 					#raise Exception,"Image %d doesn't have orientation information in its header"%i
 
 			# skip any particles targeted at a different model
-			if inputmodel != None and tmp["model_id"]!=inputmodel : continue
+			if inputmodel != None and hdrs["model_id"][i]!=inputmodel : continue
 
 			if no_weights==1: elem["weight"]=1.0
 			else :
 				try:
-					elem["weight"]=float(tmp["ptcl_repr"])
+					elem["weight"]=float(hdrs["ptcl_repr"][i])		# NaN or None if the image has no ptcl_repr
+					if isnan(elem["weight"]) : raise ValueError
 					if no_weights==2 : elem["weight"]=sqrt(elem["weight"])
 				except: elem["weight"]=1.0
 				# This is bad if you have actual empty classes...
@@ -471,7 +471,9 @@ def initialize_data(inputfile,inputmodel,tltfile,pad,no_weights,preprocess):
 					#print "Warning, weight %1.2f on particle %d. Setting to 1.0"%(elem["weight"],i)
 					#elem["weight"]=1.0
 
-			try: elem["quality"]=float(tmp["class_qual"])
+			try:
+				elem["quality"]=float(hdrs["class_qual"][i])
+				if isnan(elem["quality"]) : raise ValueError
 			except:
 				try: elem["quality"]=old_div(1.0,(elem["weight"]+.00001))
 				except: elem["quality"]=1.0
@@ -164,11 +164,22 @@ def runlocaltask(taskin,taskout):
 #	from e2tomoaverage import EMTomoAlignTaskDC
 	
 	task=load(open(taskin,"rb"))
-	
-	try: dump(task.execute(progcb),open(taskout,"wb"),-1)
+
+	# progress is passed back to EMLocalTaskHandler through a small file, at most once per second
+	lastupdate=[0]
+	def progress(prog):
+		if time.time()-lastupdate[0]>1 :
+			try: open(taskout+".prog","w").write(str(int(prog)))
+			except: pass
+			lastupdate[0]=time.time()
+		return True
+
+	try: dump(task.execute(progress),open(taskout,"wb"),-1)
 	except:
-		err=open("/tmp/eman2threaderr.txt","w")
+		traceback.print_exc(30)
+		err=open(taskout+".err","w")		# EMLocalTaskHandler saves this with the task if it is quarantined
 		traceback.print_exc(30,err)
+		err.close()
 		sys.exit(1)		# Error !
 #	print "Done %s (%s)"%(taskin,taskout)
 	
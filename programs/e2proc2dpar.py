@@ -49,8 +49,6 @@ import datetime
 import time
 import traceback
 from collections import Counter
-import queue
-import threading
 
 # usage: e2proc2d.py [options] input ... input output
 
@@ -91,6 +89,7 @@ def main():
 	parser.add_argument("--verbose", "-v", dest="verbose", action="store", metavar="n", type=int, help="verbose level [0-9], higner number means higher level of verboseness",default=1)
 	parser.add_argument("--parallel","-P",type=str,help="Run in parallel, only thread:n supported",default=None)
 	parser.add_argument("--threads", default=4,type=int,help="Number of threads to run in parallel on a single computer when multi-computer parallelism isn't useful", guitype='intbox', row=30, col=2, rowspan=1, colspan=1, mode="refinement[4]")
+	parser.add_argument("--batch", default=10,type=int,help="Number of images read, processed and written as a unit. Memory use is about 3*threads*batch images. Default=10")
 
 
 	(options, args) = parser.parse_args()
@@ -104,7 +103,6 @@ def main():
 		if options.parallel[:7]=="thread:" : options.threads=int(options.parallel[7:])
 
 	if options.threads<1 : options.threads=1
-	options.threads+=1		# one thread does the I/O, so we add an extra
 
 	logid = E2init(sys.argv,options.ppid)
 
@@ -113,49 +111,38 @@ def main():
 		sys.exit(1)
 	
 	N=EMUtil.get_image_count(args[0])
-	npt=max(min(100,old_div(N,(options.threads-2))+1),1)
-	
-	jsd=queue.Queue(0)
-	# these start as arguments, but get replaced with actual threads
-	thrds=[(jsd,args,options,i,i*npt,min(i*npt+npt,N)) for i in range(old_div(N,npt)+1)]
+	batch=max(1,options.batch)
+	nbatch=old_div(N+batch-1,batch)
 
-	#import pprint
-	#pprint.pprint(thrds)
-	
-	thrtolaunch=0
-	while thrtolaunch<len(thrds) or threading.active_count()>1:
-		if thrtolaunch<len(thrds):
-			while (threading.active_count()>=options.threads) : time.sleep(0.1)
-			if options.verbose>0 : 
-				print("\r Starting thread {}/{}      ".format(thrtolaunch,len(thrds)), end=' ')
-				sys.stdout.flush()
-			thrds[thrtolaunch]=threading.Thread(target=procfn,args=thrds[thrtolaunch])		# replace args
-			thrds[thrtolaunch].start()
-			thrtolaunch+=1
-		else: time.sleep(0.1)
-		
-		# return is [N,dict] a dict of image# keyed processed images
-		while not jsd.empty():
-			rd=jsd.get()
-			for k in list(rd[1].keys()):
-				writeimage(rd[1][k],args[1],k,options)
-			
-			thrds[rd[0]].join()
-			thrds[rd[0]]=None
-			
-			if options.verbose>1:
-				print("{} done with {} ptcls. ".format(rd[0],len(rd[1])), end=' ')
+	# This is a three stage pipeline. The reader (the generator below, run by the executor's feeder thread) reads
+	# batches of images in one read_images() call each, the workers process the batches, and the main thread
+	# writes them strictly in index order, so the output file is written sequentially. maxpending bounds the
+	# number of batches in flight, so memory use doesn't depend on the size of the input
+	def reader():
+		for n0 in range(0,N,batch):
+			yield (n0,EMData.read_images(args[0],list(range(n0,min(n0+batch,N)))))
+
+	optionlist = pyemtbx.options.get_optionlist(sys.argv[1:])
+	ex=EMExecutor(options.threads,maxpending=2*options.threads,ordered=True)
+	for i,(n0,imgs) in enumerate(ex.starmap(lambda n0,imgs:(n0,procfn(options,optionlist,n0,imgs)),reader())):
+		for n,d in enumerate(imgs,n0):
+			writeimage(d,args[1],n,options)
+
+		if options.verbose>0 :
+			print("\r {}/{} images done      ".format(min((i+1)*batch,N),N), end=' ')
+			sys.stdout.flush()
 
+	if options.verbose>1 :
+		st=ex.stats()
+		print("\n{} batches, {:1.2f} s/batch, {:1.0f}% thread utilization".format(st["jobs"],st["run"],st["efficiency"]*100.0))
 
 	E2end(logid)
 	
 	
-def procfn(jsd,args,options,thrn,n0,n1):
-	optionlist = pyemtbx.options.get_optionlist(sys.argv[1:])
+def procfn(options,optionlist,n0,imgs):
+	"""Processes a list of images in place, n0 is the image number of the first image. Returns the list"""
 
-	ret=[thrn,{}]
-	for n in range(n0, n1):
-		d=EMData(args[0],n)
+	for n,d in enumerate(imgs,n0):
 
 		index_d = Counter()
 
@@ -340,9 +327,9 @@ def procfn(jsd,args,options,thrn,n0,n1):
 							print("Error: invalid common-line mode '" + sclmd + "'")
 
 						sys.exit(1)
-		ret[1][n]=d
+		imgs[n-n0]=d		# some options replace d rather than modifying it
 
-	jsd.put(ret)
+	return imgs
 
 def writeimage(d,fsp,n,options):
 
@@ -36,32 +36,74 @@ from __future__ import division
 # $Id$
 
 
+from past.utils import old_div
+from builtins import range
 from EMAN2 import *
+from EMAN2jobs import EMExecutor
 from optparse import OptionParser
 import sys
 from math import *
 import os.path
-import pyemtbx.options
-from pyemtbx.options import intvararg_callback
-from pyemtbx.options import floatvararg_callback
+import time
+import threading
+
+# Processors which operate on each voxel independently, and thus need no overlap between bricks
+pointwise_procs=("math.absvalue","math.floor","math.reciprocal","math.pow","math.squared","math.sqrt","math.linear","math.exp",
+	"math.log","math.finite","threshold.notzero","threshold.belowtozero","threshold.belowtozero_cut","threshold.clampminmax",
+	"threshold.belowtominval","threshold.binary","threshold.binaryrange","threshold.compress")
+
+# Processors computing each voxel from a (2*radius+1)^3 neighborhood
+box_procs=("eman1.filter.median","math.localsigma","math.localmax","math.submax")
+
+def fourier_cutoff(name,parms,apix,nx):
+	"""Converts the cutoff of a Fourier filter to cutoff_abs, since cutoff_pixels would otherwise be interpreted relative
+	to the brick size rather than the full volume. Returns the cutoff in 1/pixel, or None if it can't be determined."""
+	if "cutoff_abs" in parms : return parms["cutoff_abs"]
+	if "cutoff_freq" in parms :
+		parms["cutoff_abs"]=parms.pop("cutoff_freq")*apix
+		return parms["cutoff_abs"]
+	if "cutoff_pixels" in parms :
+		parms["cutoff_abs"]=old_div(float(parms.pop("cutoff_pixels")),nx)
+		return parms["cutoff_abs"]
+	return None
+
+def processor_halo(name,parms,apix,nx):
+	"""Returns the number of voxels of overlap a brick needs on each side so the processor produces the same result
+	in the brick interior as it would on the full volume, or None if this isn't known. parms may be modified."""
+	if name in pointwise_procs : return 0
+	if name in box_procs : return parms.get("radius",1)
+	if name=="filter.bilateral" : return parms.get("half_width",1)*parms.get("niter",1)
+	if name.startswith("filter.lowpass.") or name.startswith("filter.highpass.") or name.startswith("filter.bandpass."):
+		c=fourier_cutoff(name,parms,apix,nx)
+		if c==None or c<=0 : return None
+		# a Gaussian has negligible amplitude beyond ~3 sigma in real space, sharper filters ring much further
+		if name.endswith(".gauss") : return int(ceil(old_div(1.5,c)))
+		return int(ceil(old_div(4.0,c)))
+	return None
+
+def bricks(nx,ny,nz,size):
+	"""list of (x0,y0,z0,x1,y1,z1) covering the volume"""
+	return [(x,y,z,min(x+size,nx),min(y+size,ny),min(z+size,nz)) for z in range(0,nz,size) for y in range(0,ny,size) for x in range(0,nx,size)]
 
 def main():
 	progname = os.path.basename(sys.argv[0])
-	usage = progname + """ [options] <inputfile>
+	usage = progname + """ [options] <inputfile> [outputfile]
 	This is a specialized version of e2proc3d.py targeted at performing a limited set of operations on
-very large volumes in-place (such as tomograms) which may not readily fit into system memory. Operations are 
-performed by reading portions of the image, processing, then writing the portion back to disk. Unlike e2proc3d.py
-you may pass only a single operation to the program for each invocation, or behavior will be undefined. It will 
-process a single volume in a single file in-place.
+very large volumes (such as tomograms) which may not readily fit into system memory. The volume is divided into
+bricks, each of which is read with a surrounding halo, processed, trimmed and written to the output. The halo is
+determined from the real-space extent of each processor, so processors with a known extent give the same result
+as processing the whole volume at once. Processors which depend on global statistics (normalize.*, masks
+positioned relative to the volume center, ...) can't be used. Any number of --process options may be given, and
+are applied in order, followed by --multfile, --mult and --add.
+
+The output must be an HDF file. If no output file is specified, the input is processed in-place, which is only
+possible when no halo is required.
 
 """
 	parser = OptionParser(usage)
 	
-
-	parser.add_option("--streaksubtract",type="string",help="This will subtract the histogram peak value along a single axis in the volume.",default=None)
-
 	parser.add_option("--process", metavar="processor_name:param1=value1:param2=value2", type="string",
-								action="append", help="apply a processor named 'processorname' with all its parameters/values. WARNING: this works by operating on fragments of the overall image at a time, and some processors won't work properly this way.")
+								action="append", help="apply a processor named 'processorname' with all its parameters/values. May be specified multiple times.")
 
 	parser.add_option("--mult", metavar="f", type="float", 
 								help="Scales the densities by a fixed number in the output")
@@ -72,29 +114,100 @@ process a single volume in a single file in-place.
 	parser.add_option("--add", metavar="f", type="float", 
 								help="Adds a constant 'f' to the densities")
 
-	parser.add_option("--trans", metavar="dx,dy,dz", type="string", default=0, help="Translate map by dx,dy,dz ")
+	parser.add_option("--bricksize", type="int", default=256, help="Size of the bricks the volume is processed in, excluding the halo. default=256")
+	parser.add_option("--halo", type="int", default=-1, help="Override the halo computed from the processors. Required for processors with an unknown extent.")
+	parser.add_option("--threads", type="int", default=4, help="Number of bricks to process in parallel. default=4")
 	parser.add_option("--ppid", type=int, help="Set the PID of the parent process, used for cross platform PPID",default=-1)
 	parser.add_option("--verbose", "-v", dest="verbose", action="store", metavar="n", type="int", default=0, help="verbose level [0-9], higner number means higher level of verboseness")
 		
 	(options, args) = parser.parse_args()
 
-	print("Sorry, this program still under development. Not functional yet.")
-	sys.exit(1)
+	if len(args)<1 : parser.error("Input file required")
+	infile=args[0]
+	if len(args)>1 : outfile=args[1]
+	else : outfile=infile
 
 	try:
-		hdr=EMData(args[1],0,1)
+		hdr=EMData(infile,0,True)
 	except:
 		print("ERROR: Can't read input file header")
 		sys.exit(1)
+	nx,ny,nz=hdr["nx"],hdr["ny"],hdr["nz"]
+	apix=hdr["apix_x"]
+
+	# parse the processors and work out how much overlap they need. Halos add when processors are chained.
+	procs=[]
+	halo=0
+	if options.process!=None :
+		for p in options.process:
+			name,parms=parsemodopt(p)
+			if parms==None : parms={}
+			h=processor_halo(name,parms,apix,max(nx,ny,nz))
+			if h==None and options.halo<0 :
+				print("ERROR: {} can't be applied to bricks automatically. If it depends only on nearby voxels, specify --halo.".format(name))
+				sys.exit(1)
+			if options.verbose and h!=None : print("{} requires a halo of {} voxels".format(name,h))
+			procs.append((name,parms))
+			if h!=None : halo+=h
+	if options.halo>=0 : halo=options.halo
+
+	if outfile==infile and halo>0 :
+		print("ERROR: in-place processing is only possible for processors without a halo. Please specify an output file.")
+		sys.exit(1)
 
-
-	if options.mediansubtract!=None :
-		pass  # Added this to make python happy
-		
-
-def findmode(img) :
-	"""This computes something akin to the mode"""
-
+	if outfile!=infile :
+		if outfile[-4:]!=".hdf" :
+			print("ERROR: output file must be HDF")
+			sys.exit(1)
+		if os.path.exists(outfile) : os.unlink(outfile)
+		# a header-only image has no data, so this creates an empty volume of the full size to write regions into
+		hdr.write_image(outfile,0)
+
+	if options.multfile!=None :
+		for f in options.multfile:
+			h2=EMData(f,0,True)
+			if (h2["nx"],h2["ny"],h2["nz"])!=(nx,ny,nz) :
+				print("ERROR: {} is not the same size as {}".format(f,infile))
+				sys.exit(1)
+
+	logid=E2init(sys.argv,options.ppid)
+
+	bl=bricks(nx,ny,nz,options.bricksize)
+	bmem=(options.bricksize+2*halo)**3*4
+	if options.verbose : print("{} bricks with a halo of {} voxels, ~{:1.1f} GB in memory".format(len(bl),halo,bmem*options.threads*3/1.0e9))
+
+	# all file I/O goes through this lock, since the image I/O libraries aren't thread-safe
+	iolock=threading.Lock()
+
+	def readbricks():
+		for b in bl:
+			x0,y0,z0,x1,y1,z1=b
+			r=(max(0,x0-halo),max(0,y0-halo),max(0,z0-halo),min(nx,x1+halo),min(ny,y1+halo),min(nz,z1+halo))
+			with iolock:
+				img=EMData(infile,0,False,Region(r[0],r[1],r[2],r[3]-r[0],r[4]-r[1],r[5]-r[2]))
+				masks=[EMData(f,0,False,Region(x0,y0,z0,x1-x0,y1-y0,z1-z0)) for f in options.multfile] if options.multfile!=None else []
+			yield b,r,img,masks
+
+	def procbrick(b,r,img,masks):
+		x0,y0,z0,x1,y1,z1=b
+		for name,parms in procs : img.process_inplace(name,parms)
+		if halo>0 : img=img.get_clip(Region(x0-r[0],y0-r[1],z0-r[2],x1-x0,y1-y0,z1-z0))
+		for m in masks : img.mult(m)
+		if options.mult!=None : img.mult(options.mult)
+		if options.add!=None : img.add(options.add)
+		return b,img
+
+	t0=time.time()
+	ex=EMExecutor(options.threads,maxpending=2*options.threads)
+	for i,(b,img) in enumerate(ex.starmap(procbrick,readbricks())):
+		x0,y0,z0,x1,y1,z1=b
+		with iolock:
+			img.write_image(outfile,0,IMAGE_UNKNOWN,False,Region(x0,y0,z0,x1-x0,y1-y0,z1-z0))
+		if options.verbose>1 : print("{}/{} bricks".format(i+1,len(bl)))
+		E2progress(logid,old_div(float(i+1),len(bl)))
+
+	if options.verbose : print("Complete in {:1.1f} s".format(time.time()-t0))
+	E2end(logid)
 
 if __name__ == "__main__":
 	main()
@@ -42,6 +42,7 @@ import os
 import sys
 import time
 import traceback
+import numpy as np
 from EMAN2star import StarFile
 
 
@@ -82,9 +83,28 @@ CTF autoprocessing after importing is complete.
 	if options.verbose>0 : print("Parsing STAR file")
 	star=StarFile("../"+args[0])
 
+	# Relion 3.1+ files have the particles in a second data_ block, with microscope parameters for each optics group in data_optics
+	if "rlnImageName" not in star :
+		ptcl=[b for b in star.blocks if "rlnImageName" in b]
+		if len(ptcl)==0 :
+			print("No rlnImageName found in STAR file")
+			sys.exit(1)
+		ptcl=ptcl[0]
+		if "rlnOpticsGroup" in star and "rlnOpticsGroup" in ptcl :
+			# optics groups are normally listed in order, but nothing requires it
+			optrow=dict((g,i) for i,g in enumerate(star["rlnOpticsGroup"].tolist()))
+			try: grp=np.array([optrow[g] for g in ptcl["rlnOpticsGroup"].tolist()],dtype=int)
+			except KeyError as e:
+				print("Optics group {} used by particles is not in data_optics".format(e))
+				sys.exit(1)
+			for k in list(star.keys()):
+				if k not in ptcl : ptcl[k]=star[k][grp]
+		star=ptcl
+
 	if options.apix<=0 :
 		try:
-			options.apix=old_div(star["rlnDetectorPixelSize"][0],star["rlnMagnification"][0])*10000.0
+			if "rlnImagePixelSize" in star : options.apix=float(star["rlnImagePixelSize"][0])
+			else: options.apix=old_div(float(star["rlnDetectorPixelSize"][0]),float(star["rlnMagnification"][0]))*10000.0
 			print("Using {} A/pix from Relion file".format(options.apix))
 		except:
 			print("A/pix not specified and not found in STAR file")
@@ -93,9 +113,9 @@ CTF autoprocessing after importing is complete.
 	prj=js_open_dict("info/project.json")
 	try:
 		prj["global.apix"]=options.apix
-		prj["global.microscope_cs"]=star["rlnSphericalAberration"][0]
+		prj["global.microscope_cs"]=float(star["rlnSphericalAberration"][0])
 		if prj["global.microscope_cs"]<=0.0 : prj["global.microscope_cs"]=0.001
-		prj["global.microscope_voltage"]=star["rlnVoltage"][0]
+		prj["global.microscope_voltage"]=float(star["rlnVoltage"][0])
 		print("V={} Cs={}".format(prj["global.microscope_voltage"],prj["global.microscope_cs"]))
 	except:
 		print("Did not find Voltage and Cs in Relion file")
@@ -126,11 +146,11 @@ CTF autoprocessing after importing is complete.
 			jdb=js_open_dict(info_name(microname))
 			
 			# Make a "micrograph" CTF entry for each set of different defocuses to use when fitting
-			dfu=star["rlnDefocusU"][i]
-			dfv=star["rlnDefocusV"][i]
-			dfang=star["rlnDefocusAngle"][i]
+			dfu=float(star["rlnDefocusU"][i])
+			dfv=float(star["rlnDefocusV"][i])
+			dfang=float(star["rlnDefocusAngle"][i])
 			ctf=EMAN2Ctf()
-			ctf.from_dict({"defocus":old_div((dfu+dfv),20000.0),"dfang":dfang,"dfdiff":old_div((dfu-dfv),10000.0),"voltage":star["rlnVoltage"][i],"cs":max(star["rlnSphericalAberration"][i],0.0001),"ampcont":star["rlnAmplitudeContrast"][i]*100.0,"apix":options.apix})
+			ctf.from_dict({"defocus":old_div((dfu+dfv),20000.0),"dfang":dfang,"dfdiff":old_div((dfu-dfv),10000.0),"voltage":float(star["rlnVoltage"][i]),"cs":max(float(star["rlnSphericalAberration"][i]),0.0001),"ampcont":float(star["rlnAmplitudeContrast"][i])*100.0,"apix":options.apix})
 			jdb["ctf_frame"]=[512,ctf,(256,256),tuple(),5,1]
 		
 		# copy the image
@@ -85,6 +85,43 @@ def opt_rectangular_subdivision(x,y,n):
 
 		return candidates[0][1]
 
+# Fixed cost of launching one simmx task (s) used by the tiling cost model, opt_cost_subdivision(). These are not
+# measured, since that would take several tasks. The thread mode starts a new python process per task, which must
+# import EMAN2 and read its task (~2 s), the other parallel modes reuse running workers and only pay for queueing
+# and transferring the task (~0.5 s). Only their size relative to the calibrated per-image and per-cell times
+# matters, so rough values are fine.
+SIMMX_TASK_OVERHEAD_THREAD=2.0
+SIMMX_TASK_OVERHEAD=0.5
+
+def simmx_tile_time(nc,nr,tcell,timg,overhead):
+	"""Predicted run time in seconds of one simmx task covering nc references x nr particles"""
+	return overhead+timg*(nc+nr)+tcell*nc*nr
+
+def opt_cost_subdivision(x,y,ncpu,tcell,timg,overhead,imgbytes,memlimit):
+	'''
+	@param x,y the dimensions of the matrix (references x particles)
+	@param ncpu the number of tasks which can run simultaneously
+	@param tcell the time to align and compare one reference/particle pair (s)
+	@param timg the time to read and preprocess one image (s)
+	@param overhead the fixed cost of launching one task (s)
+	@param imgbytes memory required per image in a task, and memlimit the memory available to each task
+	@return (number of x subdivisions, number of y subdivisions, predicted total time)
+	Unlike opt_rectangular_subdivision, this picks the tiling with the lowest predicted wall time, rather than a
+	fixed number of tiles. Larger tiles amortize the image reads and task overhead over more cells, but too few
+	tiles leave CPUs idle at the end, and tiles must fit in memory.
+	'''
+	best=None
+	for xsub in range(1,min(x,ncpu*16)+1):
+		nc=int(ceil(float(x)/xsub))
+		for ysub in sorted(set([max(1,min(y,int(ceil(float(k*ncpu)/xsub)))) for k in range(1,17)])):
+			nr=int(ceil(float(y)/ysub))
+			if (nc+nr)*imgbytes>memlimit and nc+nr>2 : continue
+			# tiles are all about the same size, so they run in ceil(ntiles/ncpu) waves
+			t=int(ceil(float(xsub*ysub)/ncpu))*simmx_tile_time(nc,nr,tcell,timg,overhead)
+			if best==None or (t,xsub*ysub)<best[0] : best=((t,xsub*ysub),(xsub,ysub,t))
+
+	if best==None : return (x,y,simmx_tile_time(1,1,tcell,timg,overhead)*ceil(float(x*y)/ncpu))
+	return best[1]
 
 
 class EMParallelSimMX(object):
@@ -104,11 +141,10 @@ class EMParallelSimMX(object):
 		self.etc=EMTaskCustomer(options.parallel)
 		if options.colmasks!=None : self.etc.precache([args[0],args[1],options.colmasks])
 		else : self.etc.precache([args[0],args[1]])
-		self.num_cpus = self.etc.cpu_est()
-		if self.num_cpus < 32: # lower limit
-			self.num_cpus = 32
+		self.num_cpus = max(1,self.etc.cpu_est())
 
 		self.__task_options = None
+		self.cachestats = {"hits":0,"misses":0,"bytessaved":0,"byteswritten":0}
 
 	def __get_task_options(self,options):
 		'''
@@ -168,15 +204,53 @@ class EMParallelSimMX(object):
 		for i in range(1,n):
 			e.write_image(output,i)
 
-	def __get_blocks(self):
+	def __calibrate(self):
 		'''
-		Gets the blocks that will be processed in parallel, these are essentially ranges
+		Runs a small block of the matrix locally to measure the time per image read and per matrix cell, which
+		the tiling in __get_blocks is based on. Returns (tcell,timg,imgbytes). The block bypasses the node image
+		cache, since images cached by an earlier run would make reads look nearly free.
 		'''
+		nc=min(self.clen,3)
+		nr=min(self.rlen,3)
+		shrink=self.__get_task_options(self.options)["shrink"]
+
+		t0=time.time()
+		for fsp,n in ((self.args[0],nc),(self.args[1],nr)):
+			for i in range(n):
+				img=EMData(fsp,i)
+				if shrink!=None and shrink>1 : img.process_inplace("math.fft.resample",{"n":shrink})
+		timg=(time.time()-t0)/(nc+nr)
+		imgbytes=img["nx"]*img["ny"]*img["nz"]*4*(2 if self.options.colmasks!=None else 1)
+
+		data = {"references":("cache",self.args[0],0,nc),"particles":("cache",self.args[1],0,nr)}
+		if self.options.colmasks!=None : data["colmasks"] = ("cache",self.options.colmasks,0,nc)
+		if self.options.mask!=None : data["mask"] = ("cache",self.options.mask,0,1)
+		options=dict(self.__get_task_options(self.options))
+		options["nocache"]=True
+		t0=time.time()
+		EMSimTaskDC(data=data,options=options).execute()
+		tcell=max(time.time()-t0-timg*(nc+nr),1.0e-4)/(nc*nr)
+
+		return tcell,timg,imgbytes
 
-		steve_factor = 3 # increase number of jobs a bit for better distribution
-		total_jobs = steve_factor*self.num_cpus
+	def __get_blocks(self):
+		'''
+		Gets the blocks that will be processed in parallel, these are essentially ranges. The tiling is chosen from
+		a cost model calibrated on a small block, see opt_cost_subdivision()
+		'''
 
-		[col_div,row_div] = opt_rectangular_subdivision(self.clen,self.rlen,total_jobs)
+		try:
+			self.tcell,self.timg,imgbytes=self.__calibrate()
+			self.overhead = SIMMX_TASK_OVERHEAD_THREAD if self.options.parallel.startswith("thread") else SIMMX_TASK_OVERHEAD
+			try: memlimit=0.5*os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_PHYS_PAGES")/max(1,min(self.num_cpus,os.sysconf("SC_NPROCESSORS_ONLN")))
+			except: memlimit=1.0e9
+			col_div,row_div,self.predicted = opt_cost_subdivision(self.clen,self.rlen,self.num_cpus,self.tcell,self.timg,self.overhead,imgbytes,memlimit)
+			print("Matrix size %d x %d, %1.3g s/cell, %1.3g s/image -> %d x %d blocks, predicted time %1.0f s"%(self.clen,self.rlen,self.tcell,self.timg,col_div,row_div,self.predicted))
+		except:
+			# if the calibration fails for some reason, fall back to the old fixed tile count
+			if self.options.verbose>0 : traceback.print_exc()
+			self.predicted=None
+			[col_div,row_div] = opt_rectangular_subdivision(self.clen,self.rlen,3*self.num_cpus)
 
 
 		block_c = old_div(self.clen,col_div)
@@ -256,7 +330,13 @@ class EMParallelSimMX(object):
 				else :
 					task = EMSimTaskDC(data=data,options=self.__get_task_options(self.options))
 					#print "Est %d CPUs"%etc.cpu_est()
-					tasks.append(task)
+					if self.options.fillzero : ncells=sum([i[2]-i[1]+1 for i in data["partial"]])
+					else : ncells=(block[1]-block[0])*(block[3]-block[2])
+					tasks.append((ncells,task))
+
+			# issue the most expensive tiles first, so the small ones fill in at the end
+			tasks.sort(key=lambda x:-x[0])
+			tasks=[i[1] for i in tasks]
 
 			# This just verifies that all particles have at least one class
 			#a=set()
@@ -268,6 +348,7 @@ class EMParallelSimMX(object):
 			#print b
 
 			print("%d/%d         "%(bn,len(blocks)))
+			starttime=time.time()
 			self.tids=self.etc.send_tasks(tasks)
 			print(len(self.tids)," tasks submitted")
 #
@@ -304,6 +385,18 @@ class EMParallelSimMX(object):
 				time.sleep(10)
 			print("\nAll simmx tasks complete ")
 
+			# the cached images on this node won't be reused, entries on other nodes expire or are evicted by the cache itself
+			from EMAN2PAR import EMImageCache
+			cache=EMImageCache()
+			for fsp in (self.args[0],self.args[1],self.options.colmasks,self.options.mask):
+				if fsp!=None :
+					try: cache.remove(fsp)
+					except: pass
+			if self.predicted!=None : print("Predicted time %1.0f s, actual time %1.0f s"%(self.predicted,time.time()-starttime))
+			if self.options.verbose>0 :
+				cs=self.cachestats
+				print("Node image cache: %d hits, %d misses, %1.1f MB read from cache instead of reprocessed"%(cs["hits"],cs["misses"],cs["bytessaved"]/1.0e6))
+
 			# if using fillzero, we must fix the -1.0e38 values placed into empty cells
 			if self.options.fillzero :
 				l=EMData(self.args[2],0,True)
@@ -333,6 +426,9 @@ class EMParallelSimMX(object):
 		result_data = rslts["rslt_data"]
 		output = self.args[2]
 
+		if "cachestats" in rslts :
+			for k in self.cachestats : self.cachestats[k]+=rslts["cachestats"][k]
+
 		insertion_c = rslts["min_ref_idx"]
 		insertion_r = rslts["min_ptcl_idx"]
 		result_mx = result_data[0]
@@ -366,16 +462,39 @@ class EMSimTaskDC(JSTask):
 
 		self.sim_data = {} # this will store the eventual results
 
+	def __read_image(self,fsp,idx,shrink):
+		"""Reads and shrinks one image, retrying for up to 100 s in case the file is being written"""
+		for datareadid in range(20):
+			try: image = EMData(fsp,idx)
+			except:
+				print("Failed to read %s in %s. Wait for 5s and try again."%(str(idx),fsp))
+				time.sleep(5)
+			else: break
+		else:
+			print("Cannot read image. Give up.")
+			raise Exception("Couldn't read data in init_memory")
+
+		if shrink != None: image.process_inplace("math.fft.resample",{"n":shrink})
+		return image
+
 	def __init_memory(self,options):
 		'''
-		This function assigns critical attributes
+		This function assigns critical attributes. Since the matrix is tiled, the same references and particles
+		are needed by many tasks, so the shrunken images are shared between tasks on the same node through EMImageCache
 		'''
 #		print "init ",options
-		from EMAN2PAR import image_range
+		from EMAN2PAR import image_range,EMImageCache
 		shrink = None
 		if "shrink" in options and options["shrink"] != None and options["shrink"] > 1:
 			shrink = options["shrink"]
 
+		cache=EMImageCache()
+		tag="shrink%s"%str(shrink)
+		def cached(fsp,idx):
+			# unshrunken images are just read from the file again, caching them would only duplicate the file in memory
+			if shrink==None or options.get("nocache",False) : return self.__read_image(fsp,idx,shrink)
+			return cache.get(fsp,idx,tag,lambda:self.__read_image(fsp,idx,shrink))
+
 		ref_data_name=self.data["references"][1]
 		ref_indices = image_range(*self.data["references"][2:])
 
@@ -383,62 +502,25 @@ class EMSimTaskDC(JSTask):
 			ref_masks_name=self.data["colmasks"][1]
 		else : ref_masks_name=None
 
-		if "mask" in self.data :
-			mask=EMData(self.data["mask"][1],self.data["mask"][2])
-			if shrink != None : mask.process_inplace("math.fft.resample",{"n":shrink})
+		if "mask" in self.data : mask=cached(self.data["mask"][1],self.data["mask"][2])
 		else : mask=None
 
 #		print self.data["references"][2:]
 		refs = {}
 		for idx in ref_indices:
-			datareaderror=True
-			for datareadid in range(20):
-				try: image = EMData(ref_data_name,idx)
-				except:
-					print("Failed to read %s. Wait for 5s and try again."%(str(idx)))
-					time.sleep(5)
-				else:
-					datareaderror=False
-					break
-			if datareaderror:
-				print("Cannot read image. Give up.")
-				raise Exception("Couldn't read data in init_memory")
-				
-			if shrink != None:
-				image.process_inplace("math.fft.resample",{"n":shrink})
-
-			if ref_masks_name==None :
-				refs[idx] = [image,None]
-			else :
-				mask=EMData(ref_masks_name,idx)
-				if shrink != None:
-					mask.process_inplace("math.fft.resample",{"n":shrink})
-				refs[idx] = [image,mask]
+			if ref_masks_name==None : refs[idx] = [cached(ref_data_name,idx),None]
+			else : refs[idx] = [cached(ref_data_name,idx),cached(ref_masks_name,idx)]
 
 		ptcl_data_name=self.data["particles"][1]
 		ptcl_indices = image_range(*self.data["particles"][2:])
 
 		ptcls = {}
 		for idx in ptcl_indices:
-			datareaderror=True
-			for datareadid in range(20):
-				try: image = EMData(ptcl_data_name,idx)
-				except:
-					print("Failed to read %s in %s from range %s. Wait for 5s and try again."%(str(idx),ptcl_data_name,str(ptcl_indices)))
-					time.sleep(5)
-				else:
-					datareaderror=False
-					break
-			if datareaderror:
-				print("Cannot read image. Give up.")
-				raise Exception("Couldn't read data in init_memory")
-			
-			
-			if shrink != None:
-				image.process_inplace("math.fft.resample",{"n":options["shrink"]})
 # removed 8/2/12 stevel. Don't want to apply mask before alignment
 #			if mask!=None : image.mult(mask)
-			ptcls[idx] = image
+			ptcls[idx] = cached(ptcl_data_name,idx)
+
+		self.cachestats=cache.stats
 
 		# Note that 'refs' is now a dictionary of tuples: (reference,mask) or (reference,None)
 		return refs,ptcls,shrink,mask
@@ -597,6 +679,7 @@ class EMSimTaskDC(JSTask):
 		d["rslt_data"] = result_data
 		d["min_ref_idx"] = min_ref_idx
 		d["min_ptcl_idx"] = min_ptcl_idx
+		d["cachestats"] = self.cachestats
 		return d
 
 jsonclasses["EMSimTaskDC"]=EMSimTaskDC.from_jsondict
@@ -38,11 +38,9 @@ from builtins import range
 from EMAN2 import *
 import time
 import os
-import threading
-import queue
 from sys import argv,exit
 
-def alifn(jsd,fsp,i,a,options):
+def alifn(fsp,i,a,options):
 	t=time.time()
 	b=EMData(fsp,i).do_fft()
 	b.process_inplace("xform.phaseorigin.tocorner")
@@ -52,8 +50,8 @@ def alifn(jsd,fsp,i,a,options):
 	c=a.xform_align_nbest("rotate_translate_3d_tree",b,{"verbose":0,"sym":options.sym,"sigmathis":0.1,"sigmato":1.0, "maxres":options.maxres},options.nsoln)
 	for cc in c : cc["xform.align3d"]=cc["xform.align3d"].inverse()
 
-	jsd.put((fsp,i,c[0]))
 	if options.verbose>1 : print("{}\t{}\t{}\t{}".format(fsp,i,time.time()-t,c[0]["score"]))
+	return (fsp,i,c[0])
 
 def main():
 	progname = os.path.basename(sys.argv[0])
@@ -92,7 +90,6 @@ This program will take an input stack of subtomograms and a reference volume, an
 		else: options.iter=max(fls)+1
 
 	reffile=args[1]
-	NTHREADS=max(options.threads+1,2)		# we have one thread just writing results
 
 	logid=E2init(sys.argv, options.ppid)
 
@@ -119,40 +116,31 @@ This program will take an input stack of subtomograms and a reference volume, an
 	ref[1]=ref[1].do_fft()
 	ref[1].process_inplace("xform.phaseorigin.tocorner")
 
-	angs=js_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter))
-	jsd=queue.Queue(0)
+	angs=js_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter),journal=True)		# results are stored one particle at a time
 
-	n=-1
 	N=EMUtil.get_image_count(args[0])
-	thrds=[threading.Thread(target=alifn,args=(jsd,args[0],i,ref[i%2],options)) for i in range(N)]
-
-	# here we run the threads and save the results, no actual alignment done here
-	print(len(thrds)," threads")
-	thrtolaunch=0
-	while thrtolaunch<len(thrds) or threading.active_count()>1:
-		# If we haven't launched all threads yet, then we wait for an empty slot, and launch another
-		# note that it's ok that we wait here forever, since there can't be new results if an existing
-		# thread hasn't finished.
-		if thrtolaunch<len(thrds) :
-			while (threading.active_count()==NTHREADS ) : time.sleep(.1)
-			if options.verbose : print("Starting thread {}/{}".format(thrtolaunch,len(thrds)))
-			thrds[thrtolaunch].start()
-			thrtolaunch+=1
-		else: time.sleep(1)
-
-		while not jsd.empty():
-			fsp,n,d=jsd.get()
-			angs[(fsp,n)]=d
-			if options.saveali:
-				v=EMData(fsp,n)
-				v.transform(d["xform.align3d"])
-				if options.savealibin>1:
-					v.process_inplace("math.meanshrink",{"n":options.savealibin})
-				v.write_image("{}/aliptcls_{:02d}.hdf".format(options.path, options.iter),n)
-
-
-	for t in thrds:
-		t.join()
+	ex=EMExecutor(options.threads)
+	for i in range(N) : ex.submit(alifn,args[0],i,ref[i%2],options)
+	ex.close()
+
+	# here we save the results as they come in, no actual alignment done here
+	for jobid,(fsp,n,d) in ex.results():
+		if options.verbose : print("Finished {}/{}".format(jobid,N))
+		angs[(fsp,n)]=d
+		if options.saveali:
+			v=EMData(fsp,n)
+			v.transform(d["xform.align3d"])
+			if options.savealibin>1:
+				v.process_inplace("math.meanshrink",{"n":options.savealibin})
+			v.write_image("{}/aliptcls_{:02d}.hdf".format(options.path, options.iter),n)
+
+	# fold the journal back into the .json file, so it doesn't outlive the run
+	if angs.compactor!=None : angs.compactor.join()
+	angs.compact()
+	angs.close()
+
+	# columnar copy of the results, much faster than the .json file for large particle sets
+	ptcl_convert_json("{}/particle_parms_{:02d}.json".format(options.path,options.iter),"xform.align3d")
 
 	E2end(logid)
 
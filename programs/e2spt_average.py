@@ -9,6 +9,7 @@ standard_library.install_aliases()
 from builtins import range
 from EMAN2 import *
 import time
+import numpy as np
 import os
 import threading
 import queue
@@ -101,7 +102,7 @@ Will read metadata from the specified spt_XX directory, as produced by e2spt_ali
 			sys.exit(2)
 		options.iter=max(fls)
 		if options.verbose : print("Using iteration ",options.iter)
-		angs=js_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter))
+		angs=ptcl_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter))
 	else:
 		fls=[int(i[15:17]) for i in os.listdir(options.path) if i[:15]=="particle_parms_" and str.isdigit(i[15:17])]
 		if len(fls)==0 : 
@@ -109,9 +110,9 @@ Will read metadata from the specified spt_XX directory, as produced by e2spt_ali
 			sys.exit(2)
 		mit=max(fls)
 		if options.iter>mit : 
-			angs=js_open_dict("{}/particle_parms_{:02d}.json".format(options.path,mit))
+			angs=ptcl_open_dict("{}/particle_parms_{:02d}.json".format(options.path,mit))
 			print("WARNING: no particle_parms found for iter {}, using parms from {}".format(options.iter,mit))
-		else : angs=js_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter))
+		else : angs=ptcl_open_dict("{}/particle_parms_{:02d}.json".format(options.path,options.iter))
 
 	if options.listfile!=None :
 		plist=set([int(i) for i in open(options.listfile,"r")])
@@ -128,13 +129,17 @@ Will read metadata from the specified spt_XX directory, as produced by e2spt_ali
 	avg[1]=Averagers.get("mean.tomo",{"thresh_sigma":options.wedgesigma})
 
 	# filter the list of particles to include 
-	keys=list(angs.keys())
+	# filtering is done on the columnar store directly
+	store=angs.store
+	sel=np.ones(len(store),dtype=bool)
 	if options.listfile!=None :
-		keys=[i for i in keys if eval(i)[1] in plist]
-		if options.verbose : print("{}/{} particles based on list file".format(len(keys),len(list(angs.keys()))))
-	
-	keys=[k for k in keys if angs[k]["score"]<=options.simthr and inrange(options.minalt,angs[k]["xform.align3d"].get_params("eman")["alt"],options.maxalt)]
-	if options.verbose : print("{}/{} particles after filters".format(len(keys),len(list(angs.keys()))))
+		sel&=np.isin(store.ptcl,list(plist))
+		if options.verbose : print("{}/{} particles based on list file".format(sel.sum(),len(store)))
+
+	alt=store.alt()
+	sel&=(store.score<=options.simthr)&(alt>=options.minalt)&(alt<=options.maxalt)
+	keys=[ptcl_key(fsp,n) for fsp,n in store.select(sel).keys()]
+	if options.verbose : print("{}/{} particles after filters".format(len(keys),len(store)))
 																		 
 
 	# Rotation and insertion are slow, so we do it with threads. 
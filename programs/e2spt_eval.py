@@ -284,7 +284,7 @@ class SPTBrowserWidget(embrowser.EMBrowserWidget):
 
 	def closeEvent(self, event) :
 		E2saveappwin("e2display", "main", self)
-		self.updthreadexit = True
+		self.indexer.clear()
 
 		for w in self.view2d+self.view2ds+self.view3d+self.viewplot2d+self.viewplot3d+self.viewhist :
 			w.close()
@@ -137,6 +137,8 @@ else: Blockdata["node_volume"] = [0,0]
 #  We need two CPUs for processing of volumes, they are taken to be main CPUs on each volume
 #  We have to send the two myids to all nodes so we can identify main nodes on two selected groups.
 Blockdata["main_shared_nodes"]	= [Blockdata["node_volume"][0]*Blockdata["no_of_processes_per_group"],Blockdata["node_volume"][1]*Blockdata["no_of_processes_per_group"]]
+#  Shared memory windows holding the particles read by getindexdata, keyed by data set
+Blockdata["particle_store"]		= {}
 # end of Blockdata
 global_def.BATCH = True
 global_def.MPI = True
@@ -934,6 +936,8 @@ def getindexdata(partids, partstack, particle_groups, original_data=None, small_
 
 	im_start, im_end = MPI_start_end(len(partstack), nproc, myid)
 	partstack = partstack[im_start:im_end]
+	allpartids = partids
+	allgroup_reference = group_reference
 	partids   = partids[im_start:im_end]
 	group_reference = group_reference[im_start:im_end]
 	'''
@@ -958,11 +962,90 @@ def getindexdata(partids, partstack, particle_groups, original_data=None, small_
 	"""
 
 	if( original_data == None or small_memory):
-		original_data = EMData.read_images(Tracker["constants"]["stack"], partids)
-		for im in range( len(original_data) ):
-			original_data[im].set_attr("particle_group", group_reference[im])
+		if( mpi_comm == MPI_COMM_WORLD and Blockdata["no_of_processes_per_group"] > 1 ):
+			original_data = read_particles_shared(Tracker["constants"]["stack"], allpartids, allgroup_reference, im_start, im_end, particle_groups)
+		else:
+			original_data = EMData.read_images(Tracker["constants"]["stack"], partids)
+			for im in range( len(original_data) ):
+				original_data[im].set_attr("particle_group", group_reference[im])
 	return original_data, partstack
 
+def read_particles_shared(stack, partids, group_reference, im_start, im_end, store_key):
+	global Tracker, Blockdata
+	"""
+	One process on each node reads the particles for all processes on the node into an MPI-3 shared
+	  memory window, and every process gets EMData objects which are views of its own images in the window.
+	So only one process per node reads the stack, sequentially, instead of all of them at once.
+	partids and group_reference are the complete lists, this process gets images im_start:im_end.
+	The images must be treated as read-only, which is how original_data is used (copy() or cyclic_shift).
+	The window from the previous call with the same store_key is freed, the caller must not use those images any more.
+	Collective on Blockdata["shared_comm"].
+	"""
+	nnxo 		= Tracker["constants"]["nnxo"]
+	disp_unit 	= np.dtype("f4").itemsize
+	readonly 	= ["nx", "ny", "nz", "mean", "mean_nonzero", "sigma", "sigma_nonzero", "square_sum", "maximum", "minimum"]
+
+	if store_key in Blockdata["particle_store"]:
+		mpi_win_free(Blockdata["particle_store"][store_key][0])
+		del Blockdata["particle_store"][store_key]
+
+	#  Images are stored in the window in the order of the processes on the node
+	ranges = wrap_mpi_gatherv([im_start, im_end], 0, Blockdata["shared_comm"])
+	ranges = wrap_mpi_bcast(ranges, 0, Blockdata["shared_comm"])
+	counts = [ranges[2*i+1] - ranges[2*i] for i in range(len(ranges)//2)]
+	offset = sum(counts[:Blockdata["myid_on_node"]])
+	nima   = im_end - im_start
+	if( sum(counts) == 0 ):  return []
+
+	orgsize = sum(counts)*nnxo*nnxo
+	if( Blockdata["myid_on_node"] == 0 ): size = orgsize
+	else:  size = 0
+
+	win_ptcl, base_ptcl  = mpi_win_allocate_shared( size*disp_unit , disp_unit, MPI_INFO_NULL, Blockdata["shared_comm"])
+	size = orgsize
+	if( Blockdata["myid_on_node"] != 0 ):
+		base_ptcl, = mpi_win_shared_query(win_ptcl, MPI_PROC_NULL)
+
+	ptclbuf = np.frombuffer(np.core.multiarray.int_asbuffer(base_ptcl, size*disp_unit), dtype = 'f4')
+	ptclbuf = ptclbuf.reshape(sum(counts), nnxo, nnxo)
+
+	if( Blockdata["myid_on_node"] == 0 ):
+		at = time()
+		k = 0
+		for p in range(len(counts)):
+			headers = []
+			for i in range(ranges[2*p], ranges[2*p+1], 1000):
+				#  read in blocks, so the reading process does not need a second copy of the data
+				for img in EMData.read_images(stack, partids[i:min(i+1000, ranges[2*p+1])]):
+					ptclbuf[k] = EMNumPy.em2numpy(img)
+					hdr = img.get_attr_dict()
+					for q in readonly:  hdr.pop(q, None)
+					headers.append(hdr)
+					k += 1
+			if( p == 0 ):  myheaders = headers
+			else:  wrap_mpi_send(headers, p, Blockdata["shared_comm"])
+		del headers
+		if( Blockdata["myid"] == Blockdata["main_node"] ):
+			print(strftime("%Y-%m-%d_%H:%M:%S", localtime()) + " =>", "Read %d particles into shared memory  %10.1fs"%(k, time()-at))
+	else:
+		myheaders = wrap_mpi_recv(0, Blockdata["shared_comm"])
+	mpi_barrier(Blockdata["shared_comm"])
+
+	emnumpys = []
+	original_data = []
+	for im in range(nima):
+		emnumpy = EMNumPy()
+		img = emnumpy.register_numpy_to_emdata(ptclbuf[offset+im])
+		img.set_attr_dict(myheaders[im])
+		img.set_attr("particle_group", group_reference[im_start+im])
+		img.update()
+		emnumpys.append(emnumpy)
+		original_data.append(img)
+
+	#  The EMNumPy objects own the EMData views, so they have to stay alive with the window
+	Blockdata["particle_store"][store_key] = [win_ptcl, emnumpys]
+	return original_data
+
 def get_shrink_data(nxinit, procid, original_data = None, oldparams = None, \
 					return_real = False, preshift = False, apply_mask = True, nonorm = False, nosmearing = False, npad = 1):
 	global Tracker, Blockdata
@@ -1168,7 +1251,7 @@ def get_refangs_and_shifts():
 
 	refang = Blockdata["symclass"].even_angles(Tracker["delta"])
 	coarse = Blockdata["symclass"].even_angles(2*Tracker["delta"])
-	refang = Blockdata["symclass"].reduce_anglesets( rotate_params(refang, [-0.5*Tracker["delta"], -0.5*Tracker["delta"], -0.5*Tracker["delta"]]) )
+	refang = Blockdata["symclass"].reduce_anglesets_batch( rotate_params(refang, [-0.5*Tracker["delta"], -0.5*Tracker["delta"], -0.5*Tracker["delta"]]) ).tolist()
 
 	"""
 	if(Tracker["delta"] == 15.0):  refang = read_text_row("refang15.txt")
@@ -7406,7 +7489,7 @@ def cerrs(params, ctfs, particle_groups):
 		#log = None
 		ref_vol = model_blank(Tracker["nxinit"], Tracker["nxinit"], Tracker["nxinit"])
 	mpi_barrier(MPI_COMM_WORLD)
-	bcast_EMData_to_all(ref_vol, Blockdata["myid"], Blockdata["nodes"][procid])
+	bcast_EMData_to_all_hierarchical(ref_vol, Blockdata["myid"], Blockdata["nodes"][procid])
 	interpolation_method = 1
 	ref_vol = prep_vol(ref_vol, npad = 2, interpolation_method = interpolation_method )
 
@@ -8733,7 +8816,7 @@ def XYXali3D_local_polar_ccc(refang, shifts, coarse_angles, coarse_shifts, proci
 
 def recons3d_trl_struct_MPI_nosmearing(myid, main_node, prjlist, parameters, CTF, upweighted, mpi_comm, target_size):
 	global Tracker, Blockdata
-	from utilities      import reduce_EMData_to_root, random_string, get_im, findall, model_blank, info, get_params_proj
+	from utilities      import reduce_EMData_to_root_hierarchical, random_string, get_im, findall, model_blank, info, get_params_proj
 	from EMAN2          import Reconstructors
 	from filter		    import filt_table
 	from mpi            import MPI_COMM_WORLD, mpi_barrier
@@ -8767,8 +8850,8 @@ def recons3d_trl_struct_MPI_nosmearing(myid, main_node, prjlist, parameters, CTF
 		s2y = js2y-round(js2y)
 		prjlist[im] = fshift(prjlist[im], s2x, s2y)
 		r.insert_slice(prjlist[im], Transform({"type":"spider","phi":phi, "theta":theta, "psi":psi}), 1.0)
-	reduce_EMData_to_root(fftvol, myid, main_node, comm=mpi_comm)
-	reduce_EMData_to_root(weight, myid, main_node, comm=mpi_comm)
+	reduce_EMData_to_root_hierarchical(fftvol, myid, main_node, comm=mpi_comm)
+	reduce_EMData_to_root_hierarchical(weight, myid, main_node, comm=mpi_comm)
 	if myid == main_node: dummy = r.finish(True)
 	mpi_barrier(mpi_comm)
 	if myid == main_node: return fftvol, weight, refvol
@@ -9268,8 +9351,8 @@ def refinement_one_iteration(partids, partstack, original_data, oldparams, projd
 
 		rangle        = shakenumber*Tracker["delta"]
 		rshift        = shakenumber*Tracker["ts"]
-		refang        = Blockdata["symclass"].reduce_anglesets( rotate_params(refang, [-rangle,-rangle,-rangle]) )
-		coarse_angles = Blockdata["symclass"].reduce_anglesets( rotate_params(coarse_angles, [-rangle,-rangle,-rangle]) )
+		refang        = Blockdata["symclass"].reduce_anglesets_batch( rotate_params(refang, [-rangle,-rangle,-rangle]) ).tolist()
+		coarse_angles = Blockdata["symclass"].reduce_anglesets_batch( rotate_params(coarse_angles, [-rangle,-rangle,-rangle]) ).tolist()
 		shakegrid(rshifts, rshift)
 		shakegrid(coarse_shifts, rshift)
 
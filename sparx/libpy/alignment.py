@@ -6026,7 +6026,7 @@ def generate_indices_and_refrings(nima, projangles, volft, kb, nx, delta, an, ra
 	from morphology import bracket_def, goldsearch_astigmatism
 	from applications import computenumberofrefs
 	from utilities import even_angles, assign_projangles_f, assign_projangles
-	from utilities import cone_ang_with_index
+	from utilities import cone_ang_with_index, cone_ang_index
 	import sys
 	from projection import prep_vol
 
@@ -6141,11 +6141,13 @@ def generate_indices_and_refrings(nima, projangles, volft, kb, nx, delta, an, ra
 			len_of_all_refs_angles_within_asymmetric_unit = len(all_refs_angles_within_asymmetric_unit)
 			
 			all_refs_angles_within_asymmetric_unit_plus_mirror_and_symmetries = generate_list_of_reference_angles_for_search(all_refs_angles_within_asymmetric_unit, sym)
+			#  the same reference angles are searched for every cone
+			all_refs_index = cone_ang_index(all_refs_angles_within_asymmetric_unit_plus_mirror_and_symmetries)
 			
 			for k in xrange(len(coneangles)):
 				if(len(assignments[k]) > 0):
 					filtered_refsincone_plus_mirror_and_symmetries_with_original_index, original_index = \
-					cone_ang_with_index(all_refs_angles_within_asymmetric_unit_plus_mirror_and_symmetries, coneangles[k][0], coneangles[k][1], min(largest_angles_in_cones[k] + an/2 + 1.5*delta, 180))
+					cone_ang_with_index(all_refs_angles_within_asymmetric_unit_plus_mirror_and_symmetries, coneangles[k][0], coneangles[k][1], min(largest_angles_in_cones[k] + an/2 + 1.5*delta, 180), index = all_refs_index)
 
 					reduced_original_index = [i % len_of_all_refs_angles_within_asymmetric_unit for i in original_index]
 					set_of_reduced_original_index = sorted(list(set(reduced_original_index)))
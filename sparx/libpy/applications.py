@@ -6301,7 +6301,7 @@ def ali3dlocal_MPI(stack, ref_vol, outdir, maskfile = None, ir = 1, ou = -1, rs
 
 			else:
 				from morphology import  bracket_def
-				from utilities  import  assign_projangles, cone_ang
+				from utilities  import  assign_projangles, cone_ang, cone_ang_index
 				from alignment  import  refprojs
 
 				h = 1.0
@@ -6312,11 +6312,13 @@ def ali3dlocal_MPI(stack, ref_vol, outdir, maskfile = None, ir = 1, ou = -1, rs
 				if myid == main_node:
 					print_msg("\n   Computed cone delta = %f  , and the number of cones = %d \n"%(def1, len(coneangles)))
 				assignments = assign_projangles(projangles, coneangles)
+				#  the same reference angles are searched for every cone
+				refsall = even_angles(delta, method = ref_a, symmetry = sym)
+				refsindex = cone_ang_index(refsall, fold = True)
 				for k in xrange(len(coneangles)):
 					if(len(assignements[k]) > 0):
-						refsincone = even_angles(delta, method = ref_a, symmetry = sym)
 						ant = 1.5*an[N_step]
-						refsincone = cone_ang( refsincone, coneangles[k][0], coneangles[k][1], ant )
+						refsincone = cone_ang( refsall, coneangles[k][0], coneangles[k][1], ant, index = refsindex )
 						refrings = refprojs( volf, kb, refsincone, cnx, cny, numr, "F", wr_four )
 						#    match projections to its cone using an as a distance.
 						for im in assignments[k]:
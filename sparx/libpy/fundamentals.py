@@ -1679,6 +1679,69 @@ def recmat_np(mat):
 	return  np.degrees(np.mod(phi,pi2)),np.degrees(np.mod(theta,pi2)),np.degrees(np.mod(psi,pi2))
 """
 
+def rotmatrix_batch(angles):
+	"""
+	  Batch version of rotmatrix.
+	  Input:  (N,3) array of [phi,theta,psi] in degrees
+	  Output: (N,3,3) array of rotation matrices
+	"""
+	import numpy as np
+	angles = np.radians(np.asarray(angles, dtype=np.float64).reshape(-1,3))
+	cosphi   = np.cos(angles[:,0])
+	sinphi   = np.sin(angles[:,0])
+	costheta = np.cos(angles[:,1])
+	sintheta = np.sin(angles[:,1])
+	cospsi   = np.cos(angles[:,2])
+	sinpsi   = np.sin(angles[:,2])
+	mat = np.empty((len(angles),3,3), dtype=np.float64)
+
+	mat[:,0,0] =  cospsi*costheta*cosphi - sinpsi*sinphi
+	mat[:,1,0] = -sinpsi*costheta*cosphi - cospsi*sinphi
+	mat[:,2,0] =            sintheta*cosphi
+
+	mat[:,0,1] =  cospsi*costheta*sinphi + sinpsi*cosphi
+	mat[:,1,1] = -sinpsi*costheta*sinphi + cospsi*cosphi
+	mat[:,2,1] =            sintheta*sinphi
+
+	mat[:,0,2] = -cospsi*sintheta
+	mat[:,1,2] =  sinpsi*sintheta
+	mat[:,2,2] =            costheta
+	return mat
+
+def mulmat_batch(m1, m2):
+	"""
+	  All products of (N,3,3) matrices m1 with (L,3,3) matrices m2.
+	  Output: (N,L,3,3) array, [n,l] = mulmat(m1[n], m2[l]).  The sums are done in the same order as in mulmat.
+	"""
+	m1 = m1[:,None,:,:]
+	m2 = m2[None,:,:,:]
+	return m1[:,:,:,0:1]*m2[:,:,0:1,:] + m1[:,:,:,1:2]*m2[:,:,1:2,:] + m1[:,:,:,2:3]*m2[:,:,2:3,:]
+
+def recmat_batch(mat):
+	"""
+	  Batch version of recmat.
+	  Input:  (...,3,3) array of rotation matrices
+	  Output: (...,3) array of [phi,theta,psi] in degrees
+	"""
+	import numpy as np
+	mat = np.asarray(mat, dtype=np.float64)
+	m00 = mat[...,0,0]; m01 = mat[...,0,1]; m02 = mat[...,0,2]
+	m12 = mat[...,1,2]; m20 = mat[...,2,0]; m21 = mat[...,2,1]; m22 = mat[...,2,2]
+	north = (m22 ==  1.0)
+	south = (m22 == -1.0)
+	general = ~(north|south)
+	with np.errstate(invalid="ignore"):
+		theta = np.arccos(m22)
+		#  acos returns theta>=0, so the sign of theta used by recmat is always 1
+		phi = np.where(m20 == 0.0, np.where(m21 < 0.0, 1.5*np.pi, 0.5*np.pi), np.arctan2(m21, m20))
+		psi = np.where(m02 == 0.0, np.where(m12 < 0.0, 1.5*np.pi, 0.5*np.pi), np.arctan2(m12, -m02))
+		polar = np.where(north, 1.0, -1.0)
+		polar_phi = np.where(m00 == 0.0, np.arcsin(polar*m01), np.arctan2(polar*m01, polar*m00))
+	phi   = np.where(general, phi, polar_phi)
+	theta = np.where(north, 0.0, np.where(south, np.pi, theta))
+	psi   = np.where(general, psi, 0.0)
+	return np.stack((np.degrees(phi)%360.0, np.degrees(theta)%360.0, np.degrees(psi)%360.0), axis=-1)
+
 class symclass(object):
 	import numpy as np
 	def __init__(self, sym):
@@ -1766,6 +1829,9 @@ class symclass(object):
 		for args in self.symangles:
 			self.transform.append(Transform({"type":"spider", "phi":args[0], "theta":args[1], "psi":args[2]}))
 			self.symatrix.append(rotmatrix(args[0],args[1],args[2]))
+		#  (nsym,3,3) array of the same matrices used by the batch methods
+		import numpy as np
+		self.symatrix_np = np.array(self.symatrix, dtype=np.float64)
 
 	def is_in_subunit(self, phi, theta, inc_mirror=1):
 		"""
@@ -2167,3 +2233,290 @@ class symclass(object):
 						angles.append([i*delta,90.0-j*theta2,90.0])
 			"""
 		return angles
+
+	#  Batch versions of the methods above.  They take (N,3) arrays (or lists) of [phi,theta,psi], use the
+	#  precomputed self.symatrix_np, and return numpy arrays with the same values as the per-angle methods.
+	#  Symmetry expansions are done in chunks of rows, so memory use is bounded for icos with large N.
+
+	def _chunks(self, n, nexpand):
+		step = max(1, (1<<18)//max(1,nexpand))
+		for i in range(0, n, step):  yield slice(i, min(i+step, n))
+
+	def is_in_subunit_batch(self, angles, inc_mirror=1):
+		"""
+		Input: array of projection directions, the last axis is (phi, theta[, psi]).
+				inc_mirror = 1 consider mirror directions as unique
+				inc_mirror = 0 consider mirror directions as outside of unique range.
+		Output: boolean array with the shape of angles without its last axis, see is_in_subunit.
+		"""
+		import numpy as np
+		angles = np.asarray(angles, dtype=np.float64)
+		phi   = angles[...,0]
+		theta = angles[...,1]
+		br = self.brackets[inc_mirror]
+		if( (self.sym[0] == "c")  or  (self.sym[0] == "d" and (self.nsym//2)%2 == 0) ):
+			return (phi>= 0.0) & (phi<br[0]) & (theta<=br[1])
+		elif( self.sym[0] == "d" and (self.nsym//2)%2 == 1 ):
+			inside = (theta<=br[1]) & (phi>=0.0) & (phi<self.brackets[1][0])
+			if(inc_mirror==1):  return inside
+			phib = 360.0/self.nsym
+			return inside & ( ((phi>= 0.0) & (phi<phib/2)) | ((phi>= phib) & (phi<(phib+phib/2))) )
+		elif( (self.sym[:3] == "oct")  or  (self.sym[:4] == "icos")  or  (self.sym[:3] == "tet") ):
+			inside = (phi>= 0.0) & (phi<br[0]) & (theta<=br[3])
+			baldwin_lower_alt_bound, baldwin_upper_alt_bound = self._baldwin_bounds_batch(phi, inc_mirror)
+			inside &= (baldwin_lower_alt_bound>theta)
+			if( baldwin_upper_alt_bound is not None ):  inside &= ~(baldwin_upper_alt_bound<theta)
+			return inside
+		else:  ERROR("unknown symmetry","symclass: is_in_subunit_batch",1)
+
+	def _baldwin_bounds_batch(self, phi, inc_mirror):
+		"""
+		  Lower and upper (None unless tet without mirror) theta bounds of the platonic subunit at the given phi, see is_in_subunit.
+		"""
+		import numpy as np
+		br = self.brackets[inc_mirror]
+		tmphi = np.minimum(phi, br[2]-phi)
+		baldwin_upper_alt_bound = None
+		with np.errstate(divide="ignore", invalid="ignore"):
+			baldwin_lower_alt_bound = \
+			(np.sin(np.radians(br[2]/2.0-tmphi))/np.tan(np.radians(br[1])) + \
+				np.sin(np.radians(tmphi))/np.tan(np.radians(br[3])))/np.sin(np.radians(br[2]/2.0))
+			baldwin_lower_alt_bound = np.degrees(np.arctan(1.0/baldwin_lower_alt_bound))
+			if( self.sym[:3] == "tet" and inc_mirror == 0 ):
+				baldwin_upper_alt_bound = \
+				(np.sin(np.radians(br[2]/2.0-tmphi))/np.tan(np.radians(br[1])) + \
+					np.sin(np.radians(tmphi))/np.tan(np.radians(br[3]/2.0)))/np.sin(np.radians(br[2]/2.0))
+				baldwin_upper_alt_bound = np.degrees(np.arctan(1.0/baldwin_upper_alt_bound))
+		return baldwin_lower_alt_bound, baldwin_upper_alt_bound
+
+	def symmetry_related_batch(self, angles):
+		"""
+		Batch version of symmetry_related.
+		Input:  (N,3) array of [phi,theta,psi]
+		Output: (N,nsym,3) array, [n] holds the symmetry related versions of angles[n] in the order
+		        returned by symmetry_related, [n,0] is angles[n] itself.
+		"""
+		import numpy as np
+		angles = np.asarray(angles, dtype=np.float64).reshape(-1,3)
+		n = len(angles)
+		redang = np.empty((n,self.nsym,3), dtype=np.float64)
+		redang[:,0] = angles
+		if(self.sym[0] == "c" or self.sym[0] == "d"):
+			if(self.sym[0] == "c"):  nsm = self.nsym
+			else:                    nsm = self.nsym//2
+			qt = 360.0/nsm
+			for l in range(1,nsm):
+				redang[:,l,0] = (angles[:,0]+l*qt)%360.0
+				redang[:,l,1:] = angles[:,1:]
+			for l in range(nsm,self.nsym):
+				redang[:,l,0] = (360.0-redang[:,l-nsm,0])%360.0
+				redang[:,l,1] = 180.0-angles[:,1]
+				redang[:,l,2] = (angles[:,2]+180.0*(nsm%2))%360.0
+		else:
+			for c in self._chunks(n, self.nsym):
+				mats = rotmatrix_batch(angles[c])
+				redang[c,1:] = recmat_batch(mulmat_batch(mats, self.symatrix_np[1:]))
+		return redang
+
+	def symmetry_neighbors_batch(self, angles):
+		"""
+		Batch version of symmetry_neighbors.
+		Input:  (N,3) array of [phi,theta,psi]
+		Output: (N,k+1,3) array, where k is the number of asymmetric regions adjacent to the zero's one,
+		        [n,0] is angles[n] and psi of the neighbors is set to zero, as in symmetry_neighbors.
+		"""
+		import numpy as np
+		angles = np.asarray(angles, dtype=np.float64).reshape(-1,3)
+		n = len(angles)
+		if( self.sym[0] == "c" or self.sym[0] == "d" ):
+			#  The per-angle loop for cn and dn is already in C++
+			if( n == 0 ):  return angles.reshape(0,1,3)
+			temp = np.array(Util.symmetry_neighbors(angles.tolist(), self.sym), dtype=np.float64).reshape(n,-1,3)
+			temp[:,:,2] = 0.0
+			return temp
+		#  Same ordering of the symmetry matrices as in symmetry_neighbors
+		neighbors = {}
+		neighbors["oct"]  = [1,2,3,8,9,12,13]
+		neighbors["tet"]  = [1,2,3,4,6,7]
+		neighbors["icos"] = [1,2,3,4,6,7,11,12]
+		smat = self.symatrix_np[neighbors[self.sym]]
+		sang = np.empty((n,len(smat)+1,3), dtype=np.float64)
+		sang[:,0] = angles
+		for c in self._chunks(n, len(smat)):
+			sang[c,1:] = recmat_batch(mulmat_batch(rotmatrix_batch(angles[c]), smat))
+		sang[:,1:,2] = 0.0
+		return sang
+
+	def _near_subunit_edge(self, angles, inc_mirror):
+		"""
+		  True where the platonic is_in_subunit_batch of the directions could differ from is_in_subunit, ie - the direction
+		  lies within rounding error of the subunit border (numpy and math trigonometry may differ in the last bit).
+		"""
+		import numpy as np
+		eps = 1.0e-9
+		angles = np.asarray(angles, dtype=np.float64)
+		phi   = angles[...,0]
+		theta = angles[...,1]
+		br = self.brackets[inc_mirror]
+		near = (np.abs(phi) <= eps) | (np.abs(phi-br[0]) <= eps) | (np.abs(theta-br[3]) <= eps)
+		baldwin_lower_alt_bound, baldwin_upper_alt_bound = self._baldwin_bounds_batch(phi, inc_mirror)
+		with np.errstate(invalid="ignore"):
+			near |= (np.abs(baldwin_lower_alt_bound-theta) <= eps)
+			if( baldwin_upper_alt_bound is not None ):  near |= (np.abs(baldwin_upper_alt_bound-theta) <= eps)
+		return near
+
+	def _first_in_subunit(self, angles, inc_mirror):
+		"""
+		  For each row of (N,3) angles, find the first symmetry matrix mapping it into the asymmetric subunit.
+		  Returns the mapped angles (N,3), the index of the matrix (N), whether one was found (N) and whether
+		  the choice could differ from the one of reduce_anglesets (N), as a candidate up to the chosen one is on the border.
+		"""
+		import numpy as np
+		n = len(angles)
+		smat = self.symatrix_np
+		mapped = np.empty((n,3), dtype=np.float64)
+		first  = np.zeros(n, dtype=np.int64)
+		found  = np.zeros(n, dtype=bool)
+		unsure = np.zeros(n, dtype=bool)
+		for c in self._chunks(n, self.nsym):
+			mats = rotmatrix_batch(angles[c])
+			#  (phi,theta) of recmat only depend on the last row of the product, unless it is a pole
+			row = mats[:,None,2,0:1]*smat[None,:,0,:] + mats[:,None,2,1:2]*smat[None,:,1,:] + mats[:,None,2,2:3]*smat[None,:,2,:]
+			cand = np.empty(row.shape[:2]+(2,), dtype=np.float64)
+			with np.errstate(invalid="ignore"):
+				cand[...,0] = np.degrees(np.where(row[...,0] == 0.0, np.where(row[...,1] < 0.0, 1.5*np.pi, 0.5*np.pi), \
+									np.arctan2(row[...,1], row[...,0])))%360.0
+				cand[...,1] = np.degrees(np.arccos(row[...,2]))%360.0
+			for i,l in zip(*np.nonzero(np.abs(row[...,2]) == 1.0)):
+				cand[i,l] = recmat(mulmat(mats[i].tolist(), self.symatrix[l]))[:2]
+			ok = self.is_in_subunit_batch(cand, inc_mirror)
+			first[c] = np.argmax(ok, axis=1)
+			found[c] = ok.any(axis=1)
+			last = np.where(found[c], first[c], self.nsym-1)
+			unsure[c] = (self._near_subunit_edge(cand, inc_mirror) & (np.arange(self.nsym)[None,:] <= last[:,None])).any(axis=1)
+			sel = smat[first[c]]
+			mapped[c] = recmat_batch(mats[:,:,0:1]*sel[:,0:1,:] + mats[:,:,1:2]*sel[:,1:2,:] + mats[:,:,2:3]*sel[:,2:3,:])
+		return mapped, first, found, unsure
+
+	def reduce_anglesets_batch(self, angles, inc_mirror=1):
+		"""
+		  Batch version of reduce_anglesets.
+		  Input is an (N,3) array of [phi,theta,psi]
+				inc_mirror = 1 consider mirror directions as unique
+				inc_mirror = 0 consider mirror directions as outside of unique range.
+		  Returns an (N,3) array with all triplets mapped to the first asymmetric subunit.
+		"""
+		import numpy as np
+		angles = np.asarray(angles, dtype=np.float64).reshape(-1,3)
+		redang = angles.copy()
+		phi = redang[:,0]; theta = redang[:,1]; psi = redang[:,2]
+		is_platonic_sym = self.sym[0] == "o" or self.sym[0] == "i"
+		if is_platonic_sym:
+			inside = self.is_in_subunit_batch(angles, 1)
+			unsure = self._near_subunit_edge(angles, 1)
+			outside = np.nonzero(~inside)[0]
+			#  if no matrix maps the angles into the subunit, they are left unchanged and the last index is used
+			used = np.zeros(len(angles), dtype=np.int64)
+			mapped, first, found, unsure_mapped = self._first_in_subunit(angles[outside], 1)
+			redang[outside[found]] = mapped[found]
+			used[outside] = np.where(found, first, self.nsym-1)
+			unsure[outside] |= unsure_mapped
+			if( inc_mirror == 0 ):
+				unsure |= (np.abs(phi-self.brackets[0][0]) <= 1.0e-9)
+				mirror = (phi>=self.brackets[0][0])
+				phi[mirror] = self.brackets[1][0]-phi[mirror]
+				mirror &= (inside | (used>0))
+				psi[mirror] = (360.0-psi[mirror])%360.0
+		elif( self.sym[0] == "t" ):
+			inside = self.is_in_subunit_batch(angles, inc_mirror)
+			unsure = self._near_subunit_edge(angles, inc_mirror)
+			outside = np.nonzero(~inside)[0]
+			mapped, first, found, unsure_mapped = self._first_in_subunit(angles[outside], inc_mirror)
+			redang[outside[found]] = mapped[found]
+			unsure[outside] |= unsure_mapped
+			outside = outside[~found]
+			if(inc_mirror == 1):
+				for i in range(np.count_nonzero(~unsure[outside])):  print("  FAILED no mirror ")
+			phi[outside] = (180.0+phi[outside])%360.0; theta[outside] = 180.0 - theta[outside]; psi[outside] = (180.0 - psi[outside])%360.0
+			mapped, first, found, unsure_mapped = self._first_in_subunit(redang[outside], 0)
+			redang[outside[found]] = mapped[found]
+			unsure[outside] |= unsure_mapped
+			for i in range(np.count_nonzero(~found & ~unsure[outside])):  print("  FAILED mirror ")
+		else:
+			if(self.sym[0] == "c"): qs = 360.0/self.nsym
+			else:                   qs = 720.0/self.nsym
+			if( inc_mirror == 0 ):
+				mirror = (theta>90.0)
+				phi[mirror] = (180.0+phi[mirror])%360.0; theta[mirror] = 180.0 - theta[mirror]; psi[mirror] = (180.0 - psi[mirror])%360.0
+			phi %= qs
+			if( self.sym[0] == "d" and inc_mirror == 0 ):
+				if((self.nsym//2)%2 == 0):
+					mirror = (phi>=qs/2)
+					phi[mirror] = qs-phi[mirror]
+					psi[mirror] = (360.0-psi[mirror])%360.0
+				else:
+					mirror1 = (phi>=360.0/self.nsym/2) & (phi<360.0/self.nsym)
+					mirror2 = (phi>=360.0/self.nsym+360.0/self.nsym/2) & (phi<720.0/self.nsym)
+					phi[mirror1] = 360.0/self.nsym-phi[mirror1]
+					psi[mirror1] = 360.0 - psi[mirror1]
+					phi[mirror2] = 720.0/self.nsym-phi[mirror2]+360.0/self.nsym
+					psi[mirror2] = (360.0-psi[mirror2])%360.0
+		if is_platonic_sym or self.sym[0] == "t":
+			#  directions on the border of the subunit are redone by reduce_anglesets, so both pick the same representative
+			for i in np.nonzero(unsure)[0]:  redang[i] = self.reduce_anglesets(angles[i].tolist(), inc_mirror)
+		return redang
+
+	def even_angles_batch(self, delta = 15.0, theta1=-1.0, theta2=-1.0, phi1=-1.0, phi2=-1.0, \
+					method = 'S', phiEqpsi = "Zero", inc_mirror = 1):
+		"""
+		  Batch version of even_angles, returns the same angles as an (N,3) array.
+		"""
+		import numpy as np
+		from math import pi, cos, sin, radians
+		phi2_org = phi2
+		if(phi2_org < 0.0):  phi2_org = self.brackets[1][0] - 1.0e-7 # exclude right border of unit
+		theta2_org = theta2
+		if(theta2_org < 0.0): theta2_org = self.brackets[1][3]
+		if(phi2<phi1 or theta2<theta1 or delta <= 0.0):  ERROR("even_angles","incorrect parameters (phi1,phi2,theta1,theta2,delta): %f   %f   %f   %f   %f"%(phi1,phi2,theta1,theta2,delta),1)
+		if(phi1 < 0.0):  phi1 = 0.0
+		if(phi2 < 0.0):  phi2 = self.brackets[inc_mirror][0] - 1.0e-7 # exclude right border of unit
+		if(theta1 < 0.0): theta1 = 0.0
+		if(theta2 < 0.0): theta2 = self.brackets[inc_mirror][3]
+		if (method == 'P'):
+			rings = []
+			theta = theta1
+			while(theta <= theta2):
+				if(theta==0.0 or theta==180.0): detphi = 2*phi2
+				else:  detphi = delta/sin(radians(theta))
+				#  cumsum adds the steps in the same order as the per-angle loop
+				phis = np.full(int((phi2-phi1)/detphi)+3, detphi)
+				phis[0] = phi1
+				phis = np.cumsum(phis)
+				phis = phis[phis<phi2]
+				rings.append(np.stack((phis, np.full(len(phis), theta), np.zeros(len(phis))), axis=1))
+				theta += delta
+			if len(rings) > 0:  angles = np.concatenate(rings)
+			else:               angles = np.zeros((0,3), dtype=np.float64)
+		else:
+			# I have to use original phi2 and theta2 to compute Deltaz and wedgeFactor as otherwise
+			# points for include mirror differ from do not include mirror.
+			Deltaz  = cos(radians(theta2_org))-cos(radians(theta1))
+			s       = delta*pi/180.0
+			NFactor = 3.6/s
+			wedgeFactor = abs(Deltaz*(phi2_org-phi1)/720.0)
+			NumPoints   = int(NFactor*NFactor*wedgeFactor)
+			phistep = phi2_org-phi1
+			z1 = cos(radians(theta1))
+			k = np.arange(1, max(1,NumPoints-1), dtype=np.float64)
+			z = z1 + Deltaz*k/(NumPoints-1)
+			r = np.sqrt(1.0-z*z)
+			phi = phi1+np.cumsum(delta/r)%phistep
+			theta = np.degrees(np.arccos(z))
+			angles = np.stack((phi, theta, np.zeros(len(phi))), axis=1)
+			angles = angles[self.is_in_subunit_batch(angles, inc_mirror)]
+			angles = np.concatenate(([[phi1, theta1, 0.0]], angles))
+		if (phiEqpsi == 'Minus'):
+			angles[:,2] = (720.0 - angles[:,0])%360.0
+		if( (self.sym[0] == "c" or self.sym[0] == "d") and ((theta2 == 180.) or (theta2 >= 180. and delta == 180.0))):
+			angles = np.concatenate((angles, [[0.0, 180.0, 0.0]]))
+		return angles
@@ -66,6 +66,10 @@ MPI = False
 # variable for disabling bdb cache use, For running sparx on clusters, set it to True to disable cache,
 CACHE_DISABLE = False
 
+# wrap_mpi_* messages larger than this many bytes are zlib compressed. Compression only pays off on slow
+# interconnects, so it is off (-1) by default. NumPy arrays and EMData are always sent uncompressed.
+MPI_COMPRESS_THRESHOLD = -1
+
 
 global LOGFILE
 LOGFILE = "logfile"
@@ -1426,7 +1426,7 @@ def recons3d_trl_struct_MPI(myid, main_node, prjlist, paramstructure, refang, rs
 		Input
 			list_of_prjlist: list of lists of projections to be included in the reconstruction
 	"""
-	from utilities  import reduce_EMData_to_root, random_string, get_im, findall
+	from utilities  import reduce_EMData_to_root_hierarchical, random_string, get_im, findall
 	from EMAN2      import Reconstructors
 	from utilities  import model_blank
 	from filter	import filt_table
@@ -1493,8 +1493,8 @@ def recons3d_trl_struct_MPI(myid, main_node, prjlist, paramstructure, refang, rs
 	del bckgn, recdata, tdir, ipsiandiang, allshifts, probs
 
 
-	reduce_EMData_to_root(fftvol, myid, main_node, comm=mpi_comm)
-	reduce_EMData_to_root(weight, myid, main_node, comm=mpi_comm)
+	reduce_EMData_to_root_hierarchical(fftvol, myid, main_node, comm=mpi_comm)
+	reduce_EMData_to_root_hierarchical(weight, myid, main_node, comm=mpi_comm)
 
 	if myid == main_node:
 		dummy = r.finish(True)
@@ -2703,6 +2703,175 @@ def bcast_EMData_to_all(tavg, myid, source_node = 0, comm = -1):
 		tavg_data1d = reshape(tavg_data,(ntot,))
 		tavg_data1d[0:ntot] = tavg_tmp[0:ntot]
 
+hierarchical_comms = {}
+
+def get_hierarchical_comms(comm):
+	"""
+	Topology for the node-aware collectives, cached for each communicator. shared_comm contains the processes
+	on one node (from wrap_mpi_split_shared_memory), leader_comm the first process on each node, and node is the
+	rank of this node's leader in leader_comm.
+	Returns None if the processes grouped into a node are not actually on the same host, which can happen
+	since wrap_mpi_split_shared_memory assumes consecutive ranks are placed on the same node.
+	"""
+	import socket
+	from mpi import mpi_comm_split, mpi_comm_rank
+
+	if comm not in hierarchical_comms:
+		shared_comm, color, key, nlocal, nnodes = wrap_mpi_split_shared_memory(comm)
+		hosts = wrap_mpi_gatherv([socket.gethostname()], 0, shared_comm)
+		if key == 0:  ok = [int(len(set(hosts)) == 1)]
+		else:         ok = []
+		ok = wrap_mpi_gatherv(ok, 0, comm)
+		if ok != None:  ok = min(ok)
+		ok = wrap_mpi_bcast(ok, 0, comm)
+		if ok:
+			leader_comm = mpi_comm_split(comm, int(key != 0), int(color))
+			#  Ranks in leader_comm are 0..nnodes-1 whatever the colors are, so the leader's rank identifies the node
+			if key == 0:  node = mpi_comm_rank(leader_comm)
+			else:         node = None
+			node = wrap_mpi_bcast(node, 0, shared_comm)
+			hierarchical_comms[comm] = {"shared_comm":shared_comm, "leader_comm":leader_comm, "node":node, "local_rank":key, \
+										"nlocal":nlocal, "root_node":{}}
+		else:
+			hierarchical_comms[comm] = None
+	return hierarchical_comms[comm]
+
+def hierarchical_window(topo, ntot):
+	"""
+	Shared memory window of ntot float32 elements on the node, returns the window, to be released with
+	mpi_win_free, and a numpy view of it. Collective on shared_comm.
+	"""
+	import numpy as np
+	from mpi import mpi_win_allocate_shared, mpi_win_shared_query, MPI_INFO_NULL, MPI_PROC_NULL
+
+	disp_unit = np.dtype("f4").itemsize
+	if topo["local_rank"] == 0:  size = ntot
+	else:                        size = 0
+	win, base = mpi_win_allocate_shared(size*disp_unit, disp_unit, MPI_INFO_NULL, topo["shared_comm"])
+	if topo["local_rank"] != 0:
+		base, = mpi_win_shared_query(win, MPI_PROC_NULL)
+	buf = np.frombuffer(np.core.multiarray.int_asbuffer(base, ntot*disp_unit), dtype = 'f4')
+	return win, buf
+
+def hierarchical_root_node(topo, myid, root, comm):
+	"""Rank in leader_comm of the leader of the node of process root"""
+	if root not in topo["root_node"]:
+		topo["root_node"][root] = bcast_number_to_all(topo["node"], source_node = root, mpi_comm = comm)
+	return topo["root_node"][root]
+
+def reduce_EMData_to_root_hierarchical(data, myid, main_node = 0, comm = -1, verbose = False):
+	"""
+	Node-aware reduce_EMData_to_root, with the same arguments and result (the sum is in data on main_node).
+	The image is processed in blocks of at most count voxels, staged through a shared memory window of the
+	size of one block, which is released before returning.  For each block:
+	1. Within each node, local process i sums slice i of the block over the processes on the node, and writes it
+	   into the window, so the work is spread over the node.
+	2. The node leaders reduce their windows to the leader of main_node's node.
+	3. main_node copies the result from the window directly into the data of its image.
+	If verbose, main_node prints the time spent in each level.
+	Falls back to reduce_EMData_to_root if the communicator can't be split into nodes.
+	"""
+	from time import time
+	from mpi  import mpi_reduce, mpi_barrier, mpi_comm_rank, mpi_win_free, MPI_FLOAT, MPI_SUM, MPI_COMM_WORLD
+
+	if comm == -1 or comm == None:  comm = MPI_COMM_WORLD
+	topo = get_hierarchical_comms(comm)
+	if topo == None:  return reduce_EMData_to_root(data, myid, main_node, comm)
+
+	array1d = get_image_data(data).reshape(-1)
+	ntot    = array1d.size
+	nlocal  = topo["nlocal"]
+	count   = min((75*4+2)*(75*4)**2, ntot)
+	win, window = hierarchical_window(topo, count)
+	root_node = hierarchical_root_node(topo, myid, main_node, comm)
+	if topo["local_rank"] == 0:  leader_myid = mpi_comm_rank(topo["leader_comm"])
+
+	tnode = tleader = tcopy = 0.0
+	for block_begin in range(0, ntot, count):
+		block_size = min(block_begin + count, ntot) - block_begin
+		t0 = time()
+		for i in range(nlocal):
+			slice_begin = i*block_size//nlocal
+			slice_end   = (i+1)*block_size//nlocal
+			if slice_end == slice_begin:  continue
+			tmpsum = mpi_reduce(array1d[block_begin+slice_begin:block_begin+slice_end], slice_end-slice_begin, MPI_FLOAT, MPI_SUM, i, topo["shared_comm"])
+			if topo["local_rank"] == i:
+				window[slice_begin:slice_end] = tmpsum[0:slice_end-slice_begin]
+		mpi_barrier(topo["shared_comm"])
+
+		t1 = time()
+		if topo["local_rank"] == 0:
+			tmpsum = mpi_reduce(window[0:block_size], block_size, MPI_FLOAT, MPI_SUM, root_node, topo["leader_comm"])
+			if leader_myid == root_node:
+				window[0:block_size] = tmpsum[0:block_size]
+		mpi_barrier(topo["shared_comm"])
+
+		t2 = time()
+		if myid == main_node:
+			array1d[block_begin:block_begin+block_size] = window[0:block_size]
+		#  The window is reused by the next block
+		mpi_barrier(topo["shared_comm"])
+		tnode += t1-t0;  tleader += t2-t1;  tcopy += time()-t2
+
+	if myid == main_node:  data.update()
+	mpi_win_free(win)
+
+	if verbose and myid == main_node:
+		print("  reduce_EMData_to_root_hierarchical %d voxels:  within nodes %7.3fs,  between node leaders %7.3fs,  copy %7.3fs"%(ntot, tnode, tleader, tcopy))
+
+def bcast_EMData_to_all_hierarchical(tavg, myid, source_node = 0, comm = -1, verbose = False):
+	"""
+	Node-aware bcast_EMData_to_all, with the same arguments. tavg must already have the right size on all
+	processes, its data is overwritten in place.
+	The image is processed in blocks of at most count voxels, staged through a shared memory window of the
+	size of one block, which is released before returning.  For each block:
+	1. source_node copies its block into the shared memory window on its node.
+	2. The node leaders broadcast the window into the windows on the other nodes.
+	3. Every process copies the window on its node directly into the data of its image.
+	If verbose, source_node prints the time spent in each level.
+	Falls back to bcast_EMData_to_all if the communicator can't be split into nodes.
+	"""
+	from time import time
+	from mpi  import mpi_bcast, mpi_barrier, mpi_comm_rank, mpi_win_free, MPI_FLOAT, MPI_COMM_WORLD
+
+	if comm == -1 or comm == None:  comm = MPI_COMM_WORLD
+	topo = get_hierarchical_comms(comm)
+	if topo == None:  return bcast_EMData_to_all(tavg, myid, source_node, comm)
+
+	array1d = get_image_data(tavg).reshape(-1)
+	ntot    = array1d.size
+	count   = min((75*4+2)*(75*4)**2, ntot)
+	win, window = hierarchical_window(topo, count)
+	root_node = hierarchical_root_node(topo, myid, source_node, comm)
+	if topo["local_rank"] == 0:  leader_myid = mpi_comm_rank(topo["leader_comm"])
+
+	tnode = tleader = tcopy = 0.0
+	for block_begin in range(0, ntot, count):
+		block_size = min(block_begin + count, ntot) - block_begin
+		t0 = time()
+		if myid == source_node:  window[0:block_size] = array1d[block_begin:block_begin+block_size]
+		mpi_barrier(topo["shared_comm"])
+
+		t1 = time()
+		if topo["local_rank"] == 0:
+			tmp = mpi_bcast(window[0:block_size], block_size, MPI_FLOAT, root_node, topo["leader_comm"])
+			if leader_myid != root_node:
+				window[0:block_size] = tmp[0:block_size]
+		mpi_barrier(topo["shared_comm"])
+
+		t2 = time()
+		if myid != source_node:
+			array1d[block_begin:block_begin+block_size] = window[0:block_size]
+		#  The window is reused by the next block
+		mpi_barrier(topo["shared_comm"])
+		tnode += t1-t0;  tleader += t2-t1;  tcopy += time()-t2
+
+	if myid != source_node:  tavg.update()
+	mpi_win_free(win)
+
+	if verbose and myid == source_node:
+		print("  bcast_EMData_to_all_hierarchical %d voxels:  to node window %7.3fs,  between node leaders %7.3fs,  copy %7.3fs"%(ntot, tnode, tleader, tcopy))
+
 '''
 def bcast_EMData_to_all(img, myid, main_node = 0, comm = -1):
 
@@ -3583,47 +3752,277 @@ def assign_projangles_slow(projangles, refangles):
 		assignments[best_i].append(i)
 	return assignments
 
-
-def nearest_many_full_k_projangles(reference_normals, angles, howmany = 1, sym_class=None):
-	# 
-	from utilities import getfvec, angles_to_normals
-	#refnormal = normals[:]
-	assignments = [-1]*len(angles)
+def angles_to_normals_f(angles, fold = False):
+	"""
+	  (N,3) float32 array of normals of angles [[phi0,theta0,...],[phi1,theta1,...],...], identical to the ones
+	  computed by the C++ getfvec, or by getvec when fold is set (theta folded to the upper hemisphere).
+	"""
+	import numpy as np
+	if( len(angles) == 0 ):  return np.zeros((0,3), dtype="f4")
+	phi   = np.array([q[0] for q in angles], dtype="f4")
+	theta = np.array([q[1] for q in angles], dtype="f4")
+	if fold:
+		#  the same single precision arithmetic as in Util::getvec
+		lower = (theta > 180.0)
+		theta[lower] -= 180.0
+		phi[lower]   += 180.0
+		mirror = (~lower) & (theta > 90.0)
+		theta[mirror] = 180.0 - theta[mirror]
+		phi[mirror]  += 180.0
+	return np.array(Util.angles_to_normals(np.stack((phi, theta), axis=1).tolist()), dtype="f4").reshape(-1,3)
+
+class projdir_index(object):
+	"""
+	  Spatial index of projection directions (unit normals) for nearest direction and cone searches.
+	  The sphere is divided into rings of constant theta, and each ring into roughly square cells of constant phi.
+	  For every cell that is hit by a query, the list of reference normals that could possibly be an answer for any
+	  point in the cell is computed once and kept, so repeated searches against the same references only score
+	  a small number of candidates.
+
+	  normals:  list of lists [[x0,y0,z0],[x1,y1,z1],...] or (N,3) array of reference normals
+	  dtype:    precision in which the scores are computed.  Use "f4" for normals produced by the C++ Util functions
+	            (the results are then identical to Util.nearest_* and Util.cone_dirs_f), "f8" for normals
+	            computed in python.
+
+	  Queries are (M,3) arrays or lists of normals, or (M,S,3) when each query is represented by S symmetry related
+	  copies, in which case the score of a reference is the largest dot product with any of the copies.
+	  With absolute=True the absolute value of the dot product is used, so mirror directions are the same.
+	  Ties are resolved in favor of the lower reference index.
+
+	  The cells are only set up when a search has at least brute_limit query directions, smaller searches score
+	  all the references, which is faster than building the cells.  Build the index once and pass it to the
+	  functions that accept index= when they are called repeatedly with the same references.
+	"""
+	brute_limit = 256
+
+	def __init__(self, normals, dtype = "f4", cellsize = None):
+		import numpy as np
+		self.normals  = np.asarray(normals, dtype = dtype).reshape(-1,3)
+		self.dtype    = self.normals.dtype
+		self.cellsize = cellsize
+		self.centers  = None
+		self.candidates = {}
+
+	def _build(self):
+		import numpy as np
+		from math import pi, sqrt, ceil
+		if self.cellsize is None:
+			#  about eight reference directions per cell
+			cellsize = sqrt(8.0*4.0*pi/max(len(self.normals),1))
+		else:
+			cellsize = self.cellsize*pi/180.0
+		cellsize = min(max(cellsize, 0.25*pi/180.0), pi/6.0)
+		self.nring  = int(ceil(pi/cellsize))
+		self.wring  = pi/self.nring
+		thetac = (np.arange(self.nring) + 0.5)*self.wring
+		self.nphi  = np.maximum(1, np.round(2.0*pi*np.sin(thetac)/self.wring)).astype(np.int64)
+		self.first = np.concatenate(([0], np.cumsum(self.nphi)))
+		self.ncell = int(self.first[-1])
+
+		#  cell centers and radii, that is the largest angular distance from the center to a point in the cell
+		ring   = np.repeat(np.arange(self.nring), self.nphi)
+		sector = np.arange(self.ncell) - self.first[ring]
+		wphi   = 2.0*pi/self.nphi[ring]
+		self.centers = self._vectors((ring + 0.5)*self.wring, (sector + 0.5)*wphi)
+		t = np.linspace(0.0, 1.0, 17)
+		bt = np.concatenate((np.zeros(17), np.ones(17), t, t))
+		bp = np.concatenate((t, t, np.zeros(17), np.ones(17)))
+		boundary = self._vectors((ring[:,None] + bt[None,:])*self.wring, (sector[:,None] + bp[None,:])*wphi[:,None])
+		cosr = np.clip(np.sum(boundary*self.centers[:,None,:], axis=2).min(axis=1), -1.0, 1.0)
+		#  margin for the spacing of the boundary samples and for float32 normals
+		self.radius = np.arccos(cosr) + np.maximum(self.wring, wphi)/16.0 + 1.0e-4
+		self.radius[self.nphi[ring] == 1] = pi
+
+	def _vectors(self, theta, phi):
+		import numpy as np
+		st = np.sin(theta)
+		return np.stack((st*np.cos(phi), st*np.sin(phi), np.cos(theta)), axis=-1)
+
+	def cell_of(self, dirs):
+		"""
+		  Cell index of each of the (...,3) directions
+		"""
+		import numpy as np
+		from math import pi
+		if self.centers is None:  self._build()
+		dirs  = np.asarray(dirs, dtype = np.float64)
+		theta = np.arccos(np.clip(dirs[...,2], -1.0, 1.0))
+		phi   = np.arctan2(dirs[...,1], dirs[...,0])%(2.0*pi)
+		ring  = np.minimum((theta/self.wring).astype(np.int64), self.nring-1)
+		nphi  = self.nphi[ring]
+		return self.first[ring] + np.minimum((phi*nphi/(2.0*pi)).astype(np.int64), nphi-1)
+
+	def _get_candidates(self, cells, key):
+		"""
+		  Returns a dictionary cell:sorted array of candidate reference indexes, computing the missing ones.
+		  key is ("k",howmany) for nearest searches, ("cone",angle) for cone searches.
+		"""
+		import numpy as np
+		cache = self.candidates.setdefault(key, {})
+		missing = [c for c in cells if c not in cache]
+		normals = self.normals.astype(np.float64)
+		for i in range(0, len(missing), 256):
+			block = np.array(missing[i:i+256], dtype=np.int64)
+			dots  = np.dot(self.centers[block], normals.T)
+			if( key[0] == "k" ):
+				#  The k nearest to any point in the cell are within r_k(center) + 2*radius of the center
+				cosk = -np.partition(-dots, key[1]-1, axis=1)[:,key[1]-1]
+				reach = np.arccos(np.clip(cosk, -1.0, 1.0)) + 2*self.radius[block]
+			else:
+				reach = key[1] + self.radius[block]
+			cosreach = np.where(reach >= np.pi, -2.0, np.cos(np.minimum(reach, np.pi)))
+			for j,c in enumerate(block):  cache[c] = np.nonzero(dots[j] >= cosreach[j])[0]
+		return cache
+
+	def _scores(self, dirs, absolute, key, howmany = None, minscore = None):
+		"""
+		  For a chunk of (M,S,3) queries returns arrays of query index, copy index, reference index and score for
+		  all the candidates of the cells hit by the copies, only for the howmany best candidates of each copy,
+		  or only for the candidates with a score of at least minscore.
+		"""
+		import numpy as np
+		m, nsym = dirs.shape[:2]
+		if absolute:
+			dirs = np.concatenate((dirs, -dirs), axis=1)
+		flat  = dirs.reshape(-1,3)
+		if( self.centers is None and len(flat) < self.brute_limit ):
+			#  all the references are candidates for all the query directions
+			groups = [(np.arange(len(flat)), np.arange(len(self.normals)))]
+		else:
+			cells = self.cell_of(flat)
+			order = np.argsort(cells, kind="mergesort")
+			cells = cells[order]
+			bounds = np.nonzero(np.diff(cells))[0] + 1
+			starts = np.concatenate(([0], bounds))
+			ends   = np.concatenate((bounds, [len(cells)]))
+			cand   = self._get_candidates(cells[starts].tolist(), key)
+			groups = [(order[b:e], cand[cells[b]]) for b,e in zip(starts, ends)]
+		out_q = []; out_s = []; out_i = []; out_v = []
+		for pairs,idx in groups:
+			if len(idx) == 0:  continue
+			q = flat[pairs]
+			r = self.normals[idx]
+			#  same order of operations as in the C++ code
+			v = q[:,0:1]*r[None,:,0] + q[:,1:2]*r[None,:,1] + q[:,2:3]*r[None,:,2]
+			if( minscore is not None ):
+				#  with absolute the negated copies are scored as well, so the score itself is compared
+				rows, cols = np.nonzero(v >= minscore)
+				out_q.append(pairs[rows]//dirs.shape[1])
+				out_s.append(pairs[rows]%dirs.shape[1])
+				out_i.append(idx[cols])
+				out_v.append(v[rows, cols])
+				continue
+			elif howmany is None:
+				kk = len(idx)
+				out_i.append(np.tile(idx, len(pairs)))
+				out_v.append(v.ravel())
+			else:
+				#  idx is sorted, so ties go to the lower reference index
+				kk = min(howmany, len(idx))
+				if( kk == 1 ):  top = np.argmax(v, axis=1)[:,None]
+				else:           top = np.argsort(-v, axis=1, kind="stable")[:,:kk]
+				out_i.append(idx[top].ravel())
+				out_v.append(np.take_along_axis(v, top, axis=1).ravel())
+			out_q.append(np.repeat(pairs//dirs.shape[1], kk))
+			out_s.append(np.repeat(pairs%dirs.shape[1], kk))
+		if len(out_q) == 0:
+			return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, self.dtype)
+		s = np.concatenate(out_s)
+		if absolute:  s %= nsym
+		return np.concatenate(out_q), s, np.concatenate(out_i), np.concatenate(out_v)
+
+	def _queries(self, dirs):
+		import numpy as np
+		dirs = np.asarray(dirs, dtype = self.dtype)
+		if dirs.ndim == 1:  dirs = dirs.reshape(1,1,3)
+		elif dirs.ndim == 2:  dirs = dirs.reshape(-1,1,3)
+		return dirs
+
+	def nearestk(self, dirs, howmany = 1, absolute = False, chunk = 8192):
+		"""
+		  Returns an (M,howmany) array of reference indexes, ordered from the nearest.
+		"""
+		import numpy as np
+		dirs = self._queries(dirs)
+		if( howmany > len(self.normals) ):  ERROR("number of neighbors cannot be larger than number of reference directions","projdir_index.nearestk",1)
+		result = np.empty((len(dirs), howmany), dtype = np.int64)
+		for c0 in range(0, len(dirs), chunk):
+			#  a reference in the howmany nearest of a query is also in the howmany nearest of the copy
+			#  that gives its score, so it is enough to merge the best candidates of each copy
+			q, s, i, v = self._scores(dirs[c0:c0+chunk], absolute, ("k",howmany), howmany)
+			#  a reference found through several copies gets its largest score
+			o = np.lexsort((-v, i, q))
+			q = q[o]; i = i[o]; v = v[o]
+			keep = np.ones(len(q), dtype=bool)
+			keep[1:] = (q[1:] != q[:-1]) | (i[1:] != i[:-1])
+			q = q[keep]; i = i[keep]; v = v[keep]
+			o = np.lexsort((i, -v, q))
+			q = q[o]; i = i[o]
+			starts = np.searchsorted(q, q, side="left")
+			rank = np.arange(len(q)) - starts
+			result[c0:c0+chunk] = i[rank < howmany].reshape(-1, howmany)
+		return result
+
+	def nearest(self, dirs, absolute = False, chunk = 8192):
+		"""
+		  Returns an (M,) array with the index of the nearest reference of each query.
+		"""
+		return self.nearestk(dirs, 1, absolute, chunk)[:,0]
+
+	def within_cone(self, dirs, cone, inclusive = False, absolute = False, return_copy = False, chunk = 8192):
+		"""
+		  For each query, returns a sorted array of indexes of references whose score is larger than cone
+		  (the cosine of the cone angle), or larger or equal if inclusive is set.
+		  With return_copy, a second list contains for each found reference the index of the first copy
+		  of the query which gave the highest score.
+		"""
+		import numpy as np
+		dirs = self._queries(dirs)
+		ant = np.arccos(np.clip(float(cone), -1.0, 1.0))
+		found = []; copies = []
+		for c0 in range(0, len(dirs), chunk):
+			q, s, i, v = self._scores(dirs[c0:c0+chunk], absolute, ("cone",ant), minscore = cone)
+			if absolute:  v = np.abs(v)
+			if inclusive:  sel = (v >= cone)
+			else:          sel = (v > cone)
+			q = q[sel]; s = s[sel]; i = i[sel]; v = v[sel]
+			o = np.lexsort((s, -v, i, q))
+			q = q[o]; s = s[o]; i = i[o]
+			keep = np.ones(len(q), dtype=bool)
+			keep[1:] = (q[1:] != q[:-1]) | (i[1:] != i[:-1])
+			q = q[keep]; s = s[keep]; i = i[keep]
+			bounds = np.searchsorted(q, np.arange(1, len(dirs[c0:c0+chunk])))
+			found  += np.split(i, bounds)
+			copies += np.split(s, bounds)
+		if return_copy:  return found, copies
+		return found
+
+
+def nearest_many_full_k_projangles(reference_normals, angles, howmany = 1, sym_class=None, index = None):
+	#  index - optional projdir_index of reference_normals, to be reused between calls
+	import numpy as np
+	from utilities import getfvec
+	if( index is None ):  index = projdir_index(reference_normals)
+	if( len(angles) == 0 ):  return []
 	if( sym_class.sym[:2] == "c1"):
-		for i,q in enumerate(angles):
-			ref = getfvec(q[0],q[1])
-			assignments[i] = Util.nearest_fang_select(reference_normals, ref[0],ref[1],ref[2], howmany)
+		ancordir = [getfvec(q[0],q[1]) for q in angles]
 	else:
-		for i,q in enumerate(angles):
-			ancordir = angles_to_normals(sym_class.symmetry_neighbors([q[:3]]))
-			assignments[i] = Util.nearest_fang_sym(ancordir, reference_normals, len(ancordir), howmany)
+		ancordir = sym_class.symmetry_neighbors([q[:3] for q in angles])
+		ancordir = np.array(Util.angles_to_normals(ancordir), dtype="f4").reshape(len(angles), -1, 3)
 
-	return assignments
+	return index.nearestk(ancordir, howmany).tolist()
 
 
-def nearestk_projangles(projangles, whichone = 0, howmany = 1, sym="c1"):
+def nearestk_projangles(projangles, whichone = 0, howmany = 1, sym="c1", index = None):
 	# In both cases mirrored should be treated the same way as straight as they carry the same structural information
+	#  index - optional projdir_index([getvec(q[0], q[1]) for q in projangles]) for c1, to be reused between calls
 	from utilities import getfvec, getvec
-	lookup = list(range(len(projangles)))
 	if( sym == "c1"):
-		from utilities import getvec
-		refnormal = [None]*(len(projangles)*3)
-		for i in range(len(projangles)):
-			ref = getvec(projangles[i][0], projangles[i][1])
-			for k in range(3):
-				refnormal[3*i+k] = ref[k]
-		# remove the reference projection from the list
-		ref = [0.0,0.0,0.0]
-		for k in range(3):
-			ref[k] = refnormal[3*whichone+k]
-		for k in range(3): del refnormal[3*whichone+2-k]
-		del lookup[whichone]
-		assignments = [-1]*howmany
-		for i in range(howmany):
-			k = Util.nearest_ang(refnormal, ref[0],ref[1],ref[2])
-			assignments[i] = lookup[k]
-			for l in range(3): del refnormal[3*k+2-l]
-			del lookup[k]
+		if( index is None ):  index = projdir_index([getvec(q[0], q[1]) for q in projangles])
+		# the reference projection itself is removed from the list
+		assignments = index.nearestk(index.normals[whichone], min(howmany+1, len(projangles)), absolute = True)[0].tolist()
+		if whichone in assignments:  assignments.remove(whichone)
+		assignments = assignments[:howmany]
 
 	elif( sym[:1] == "d" ):
 		from utilities import get_symt, getvec
@@ -3639,29 +4038,7 @@ def nearestk_projangles(projangles, whichone = 0, howmany = 1, sym="c1"):
 		refvec = getfvec(q["phi"], q["theta"])
 		#print  "refvec   ",q["phi"], q["theta"]
 
-		tempan = projangles[:]
-		del tempan[whichone], lookup[whichone]
-		assignments = [-1]*howmany
-
-		for i in range(howmany):
-			best = -1
-			for j in range(len(tempan)):
-				nearest = -1.
-				a = Transform({"type":"spider","phi":tempan[j][0], "theta":tempan[j][1]})
-				for l in range(len(t)):
-					q = a*t[l]
-					q = q.get_params("spider")
-					vecs = getfvec(q["phi"], q["theta"])
-					s = abs(vecs[0]*refvec[0] + vecs[1]*refvec[1] + vecs[2]*refvec[2])
-					if( s > nearest ):
-						nearest = s
-						#ttt = (q["phi"], q["theta"])
-				if( nearest > best ):
-					best = nearest
-					best_j = j
-					#print  j,tempan[j][0], tempan[j][1],best,lookup[j],ttt
-			assignments[i] = lookup[best_j]
-			del tempan[best_j], lookup[best_j]
+		assignments = nearestk_sym_vectors(projangles, whichone, howmany, t, refvec)
 
 	elif( sym[:1] == "c" ):
 		from utilities import get_symt, getvec
@@ -3669,30 +4046,8 @@ def nearestk_projangles(projangles, whichone = 0, howmany = 1, sym="c1"):
 		t = get_symt(sym)
 		#phir = 360.0/int(sym[1:])
 
-		tempan =  projangles[:]
-		del tempan[whichone], lookup[whichone]
-		assignments = [-1]*howmany
 		refvec = getvec(projangles[whichone][0], projangles[whichone][1])
-
-		for i in range(howmany):
-			best = -1
-			for j in range(len(tempan)):
-				nearest = -1.
-				a = Transform({"type":"spider","phi":tempan[j][0], "theta":tempan[j][1]})
-				for l in range(len(t)):
-					q = a*t[l]
-					q = q.get_params("spider")
-					vecs = getfvec(q["phi"], q["theta"])
-					s = abs(vecs[0]*refvec[0] + vecs[1]*refvec[1] + vecs[2]*refvec[2])
-					if( s > nearest ):
-						nearest = s
-						#ttt = (q["phi"], q["theta"])
-				if( nearest > best ):
-					best = nearest
-					best_j = j
-					#print  j,tempan[j][0], tempan[j][1],best,lookup[j],ttt
-			assignments[i] = lookup[best_j]
-			del tempan[best_j], lookup[best_j]
+		assignments = nearestk_sym_vectors(projangles, whichone, howmany, t, refvec)
 
 	else:
 		print("  ERROR:  symmetry not supported  ",sym)
@@ -3701,29 +4056,44 @@ def nearestk_projangles(projangles, whichone = 0, howmany = 1, sym="c1"):
 
 	return assignments
 
+def nearestk_sym_vectors(projangles, whichone, howmany, t, refvec):
+	#  The howmany projangles (other than whichone) nearest to refvec, each represented by its copies
+	#  related by the symmetry transforms t.  Used by nearestk_projangles.
+	import numpy as np
+	from utilities import getfvec
+	from EMAN2 import Transform
+	lookup = [j for j in range(len(projangles)) if j != whichone]
+	vecs = np.zeros((len(lookup), len(t), 3))
+	for n,j in enumerate(lookup):
+		a = Transform({"type":"spider","phi":projangles[j][0], "theta":projangles[j][1]})
+		for l in range(len(t)):
+			q = a*t[l]
+			q = q.get_params("spider")
+			vecs[n,l] = getfvec(q["phi"], q["theta"])
+	s = np.abs(vecs[:,:,0]*refvec[0] + vecs[:,:,1]*refvec[1] + vecs[:,:,2]*refvec[2]).max(axis=1)
+	#  the best first, the lower index for equal scores
+	order = np.lexsort((lookup, -s))
+	return [lookup[k] for k in order[:howmany]]
 
-def nearest_full_k_projangles(reference_ang, angles, howmany = 1, sym_class=None):
+def nearest_full_k_projangles(reference_ang, angles, howmany = 1, sym_class=None, index = None):
 	# We assume angles can be on the list of normals
-	from utilities import getfvec, angles_to_normals
-	reference_normals = angles_to_normals(reference_ang)
+	#  index - optional projdir_index(angles_to_normals_f(reference_ang)), to be reused between calls
+	import numpy as np
+	from utilities import getfvec
+	if( index is None ):  index = projdir_index(angles_to_normals_f(reference_ang))
 
 	if( sym_class == None or sym_class.sym[:2] == "c1"):
-		ref = getfvec(angles[0],angles[1])
-		assignments = Util.nearest_fang_select(reference_normals, ref[0],ref[1],ref[2], howmany)
+		ancordir = getfvec(angles[0],angles[1])
 	else:
-		ancordir = angles_to_normals(sym_class.symmetry_neighbors([angles[:3]]))
-		assignments = Util.nearest_fang_sym(ancordir, reference_normals, len(ancordir), howmany)
+		ancordir = np.array(Util.angles_to_normals(sym_class.symmetry_neighbors([angles[:3]])), dtype="f4").reshape(1,-1,3)
 
-	return assignments
+	return index.nearestk(ancordir, howmany)[0].tolist()
 
-def nearestk_to_refdir(refnormal, refdir, howmany = 1):
-	lookup = list(range(len(refnormal)))
-	assignments = [-1]*howmany
-	for i in range(howmany):
-		k = Util.nearest_ang(refnormal, refdir[0],refdir[1],refdir[2])
-		assignments[i] = lookup[k]
-		del refnormal[3*k+2], refnormal[3*k+1], refnormal[3*k+0], lookup[k]
-	return assignments
+def nearestk_to_refdir(refnormal, refdir, howmany = 1, index = None):
+	#  refnormal is a flat list of reference normals, mirrored directions are considered the same
+	#  index - optional projdir_index(refnormal), to be reused between calls
+	if( index is None ):  index = projdir_index(refnormal)
+	return index.nearestk(refdir[:3], howmany, absolute = True)[0].tolist()
 
 
 def nearestk_to_refdirs(refnormal, refdir, howmany = 1):
@@ -3775,20 +4145,13 @@ def assign_projangles(projangles, refangles, return_asg = False):
 	return assignments
 """
 
-def assign_projangles(projangles, refangles, return_asg = False):
-
+def assign_projangles(projangles, refangles, return_asg = False, index = None):
+	#  Nearest refangles direction of each projangles, mirrored directions are considered the same
+	#  index - optional projdir_index(angles_to_normals_f(refangles, fold = True)), to be reused between calls
 	nproj = len(projangles)
 	nref = len(refangles)
-	proj_ang = [0.0]*(nproj*2)
-	ref_ang = [0.0]*(nref*2)
-	for i in range(nproj):
-		proj_ang[i*2] = projangles[i][0]
-		proj_ang[i*2+1] = projangles[i][1]
-	for i in range(nref):
-		ref_ang[i*2] = refangles[i][0]
-		ref_ang[i*2+1] = refangles[i][1]
-
-	asg = Util.assign_projangles(proj_ang, ref_ang)
+	if( index is None ):  index = projdir_index(angles_to_normals_f(refangles, fold = True))
+	asg = index.nearest(angles_to_normals_f(projangles, fold = True), absolute = True).tolist()
 	if return_asg: return asg
 	assignments = [[] for i in range(nref)]
 	for i in range(nproj):
@@ -3796,9 +4159,10 @@ def assign_projangles(projangles, refangles, return_asg = False):
 
 	return assignments
 
-def assign_projangles_f(projangles, refangles, return_asg = False):
-
-	asg = Util.assign_projangles_f(projangles, refangles)
+def assign_projangles_f(projangles, refangles, return_asg = False, index = None):
+	#  index - optional projdir_index(angles_to_normals_f(refangles)), to be reused between calls
+	if( index is None ):  index = projdir_index(angles_to_normals_f(refangles))
+	asg = index.nearest(angles_to_normals_f(projangles)).tolist()
 	if return_asg: return asg
 	assignments = [[] for i in range(len(refangles))]
 	for i in range(len(projangles)):
@@ -3807,10 +4171,11 @@ def assign_projangles_f(projangles, refangles, return_asg = False):
 	return assignments
 
 
-def assign_projdirs_f(projdirs, refdirs, neighbors):
+def assign_projdirs_f(projdirs, refdirs, neighbors, index = None):
 	#  projdirs - data
 	#  refdirs  - templates, each template has neighbors related copies 
 	#  output - list of lists, ofr each of refdirs/neighbors there is a list of projdirs indexes that are closest to it
+	#  index - optional projdir_index(refdirs), to be reused between calls
 	"""
 	qsti = [-1]*len(projdirs)
 	for i,q in enumerate(projdirs):
@@ -3825,8 +4190,9 @@ def assign_projdirs_f(projdirs, refdirs, neighbors):
 		qsti[i] = this
 	"""
 	#  Create a list that for each projdirs contains an index of the closest refdirs/neighbors
-	qsti = Util.assign_projdirs_f(projdirs, refdirs, neighbors)
-	assignments = [[] for i in range(len(refdirs)/neighbors)]
+	if( index is None ):  index = projdir_index(refdirs)
+	qsti = (index.nearest(projdirs)//neighbors).tolist()
+	assignments = [[] for i in range(len(refdirs)//neighbors)]
 	for i in range(len(projdirs)):
 		assignments[qsti[i]].append(i)
 
@@ -3834,33 +4200,35 @@ def assign_projdirs_f(projdirs, refdirs, neighbors):
 
 
 
-def cone_ang( projangles, phi, tht, ant, symmetry = 'c1'):
+def cone_ang_index( projangles, fold = False ):
+	"""
+	  projdir_index of projangles as used by cone_ang, cone_ang_f and cone_ang_with_index, for the loops that search
+	  cones around many directions in the same projangles.  fold has to be set for cone_ang with symmetry c1.
+	"""
+	from utilities import getvec, getfvec
+	if fold:  return projdir_index([getvec( q[0], q[1] ) for q in projangles], dtype = "f8")
+	else:     return projdir_index([getfvec( q[0], q[1] ) for q in projangles], dtype = "f8")
+
+def cone_ang( projangles, phi, tht, ant, symmetry = 'c1', index = None):
+	#  index - optional cone_ang_index(projangles, symmetry == 'c1'), to be reused between calls
 	from utilities import getvec, getfvec
 	from math import cos, pi, degrees, radians
 
 	cone = cos(radians(ant))
 	la = []
+	if( index is None ):  index = cone_ang_index(projangles, symmetry == 'c1')
 	if( symmetry == 'c1' ):
 		vec = getfvec( phi, tht )
-		for i in range( len(projangles) ):
-			vecs = getvec( projangles[i][0], projangles[i][1] )
-			s = vecs[0]*vec[0] + vecs[1]*vec[1] + vecs[2]*vec[2]
-			if s >= cone:
-				la.append(projangles[i])
+		for i in index.within_cone(vec, cone, inclusive = True)[0]:
+			la.append(projangles[i])
 	elif( symmetry[:1] == "c" ):
 		nsym = int(symmetry[1:])
 		qt = 360.0/nsym
 		dvec = 	[0.0]*nsym
 		for nsm in range(nsym):
 			dvec[nsm] = getvec(phi+nsm*qt, tht)
-		for i in range( len(projangles) ):
-			vecs = getfvec( projangles[i][0], projangles[i][1] )
-			qt = -2.0
-			for nsm in range(nsym):
-				vc = dvec[nsm][0]*vecs[0] + dvec[nsm][1]*vecs[1] + dvec[nsm][2]*vecs[2]
-				if(vc > qt):  qt = vc
-			if(qt >= cone):
-				la.append(projangles[i])
+		for i in index.within_cone([dvec], cone, inclusive = True)[0]:
+			la.append(projangles[i])
 	elif( symmetry[:1] == "d" ):
 		nsym = int(symmetry[1:])
 		qt = 360.0/nsym
@@ -3868,50 +4236,30 @@ def cone_ang( projangles, phi, tht, ant, symmetry = 'c1'):
 		for nsm in range(nsym):
 			dvec[2*nsm] = getvec(phi+nsm*qt, tht)
 			dvec[2*nsm+1] = getvec(-(phi+nsm*qt), 180.0-tht)
-		for i in range( len(projangles) ):
-			vecs = getfvec( projangles[i][0], projangles[i][1] )
-			qt = -2.0
-			qk = -1
-			for nsm in range(2*nsym):
-				vc = dvec[nsm][0]*vecs[0] + dvec[nsm][1]*vecs[1] + dvec[nsm][2]*vecs[2]
-				if(vc > qt):
-					qt = vc
-					qk = nsm
-			if(qt >= cone):
-				if(qk<nsym):  la.append(projangles[i])
-				else:         la.append([projangles[i][0],projangles[i][1],(projangles[i][2]+180.0)%360.0])
+		found, copies = index.within_cone([dvec], cone, inclusive = True, return_copy = True)
+		for i,qk in zip(found[0], copies[0]):
+			if(qk<nsym):  la.append(projangles[i])
+			else:         la.append([projangles[i][0],projangles[i][1],(projangles[i][2]+180.0)%360.0])
 	
 	else:  print("Symmetry not supported ",symmetry)
 	return la
 
 #  Push to C.  PAP  11/25/2016
-def cone_ang_f( projangles, phi, tht, ant, symmetry = 'c1'):
+def cone_ang_f( projangles, phi, tht, ant, symmetry = 'c1', index = None):
+	#  index - optional cone_ang_index(projangles), to be reused between calls
 	from utilities import getfvec
 	from math import cos, pi, degrees, radians
 
 	cone = cos(radians(ant))
 	la = []
 	if( symmetry == 'c1' ):
-		vec = getfvec( phi, tht )
-		for i in range( len(projangles) ):
-			vecs = getfvec( projangles[i][0], projangles[i][1] )
-			s = vecs[0]*vec[0] + vecs[1]*vec[1] + vecs[2]*vec[2]
-			if s >= cone:
-				la.append(projangles[i])
+		dvec = [getfvec( phi, tht )]
 	elif( symmetry[:1] == "c" ):
 		nsym = int(symmetry[1:])
 		qt = 360.0/nsym
 		dvec = 	[0.0]*nsym
 		for nsm in range(nsym):
 			dvec[nsm] = getfvec(phi+nsm*qt, tht)
-		for i in range( len(projangles) ):
-			vecs = getfvec( projangles[i][0], projangles[i][1] )
-			qt = -2.0
-			for nsm in range(nsym):
-				vc = dvec[nsm][0]*vecs[0] + dvec[nsm][1]*vecs[1] + dvec[nsm][2]*vecs[2]
-				if(vc > qt):  qt = vc
-			if(qt >= cone):
-				la.append(projangles[i])
 	elif( symmetry[:1] == "d" ):
 		nsym = int(symmetry[1:])
 		qt = 360.0/nsym
@@ -3919,20 +4267,15 @@ def cone_ang_f( projangles, phi, tht, ant, symmetry = 'c1'):
 		for nsm in range(nsym):
 			dvec[2*nsm] = getfvec(phi+nsm*qt, tht)
 			dvec[2*nsm+1] = getfvec(-(phi+nsm*qt), 180.0-tht)
-		for i in range( len(projangles) ):
-			vecs = getfvec( projangles[i][0], projangles[i][1] )
-			qt = -2.0
-			qk = -1
-			for nsm in range(2*nsym):
-				vc = dvec[nsm][0]*vecs[0] + dvec[nsm][1]*vecs[1] + dvec[nsm][2]*vecs[2]
-				if(vc > qt):
-					qt = vc
-					qk = nsm
-			if(qt >= cone):
-				if(qk<nsym):  la.append(projangles[i])
-				else:         la.append([projangles[i][0],projangles[i][1],(projangles[i][2]+180.0)%360.0])
-	
-	else:  print("Symmetry not supported ",symmetry)
+	else:
+		print("Symmetry not supported ",symmetry)
+		return la
+
+	if( index is None ):  index = cone_ang_index(projangles)
+	found, copies = index.within_cone([dvec], cone, inclusive = True, return_copy = True)
+	for i,qk in zip(found[0], copies[0]):
+		if( symmetry[:1] != "d" or qk<nsym ):  la.append(projangles[i])
+		else:         la.append([projangles[i][0],projangles[i][1],(projangles[i][2]+180.0)%360.0])
 
 	return la
 
@@ -3977,7 +4320,8 @@ def cone_ang_f_with_index( projangles, phi, tht, ant ):
 	return la, index
 """
 
-def cone_ang_with_index( projangles, phi, tht, ant ):
+def cone_ang_with_index( projangles, phi, tht, ant, index = None ):
+	#  index - optional cone_ang_index(projangles), to be reused between calls
 	from utilities import getvec
 	from math import cos, pi, degrees, radians
 	# vec = getvec( phi, tht )
@@ -3985,17 +4329,12 @@ def cone_ang_with_index( projangles, phi, tht, ant ):
 
 	cone = cos(radians(ant))
 	la = []
-	index = []
-	for i in range( len(projangles) ):
-		# vecs = getvec( projangles[i][0], projangles[i][1] )
-		vecs = getfvec( projangles[i][0], projangles[i][1] )
-		s = vecs[0]*vec[0] + vecs[1]*vec[1] + vecs[2]*vec[2]
-		# if s >= cone:
-		if abs(s) >= cone:
-			la.append(projangles[i] + [i])
-			index.append(i)
+	if( index is None ):  index = cone_ang_index(projangles)
+	found = index.within_cone(vec, cone, inclusive = True, absolute = True)[0].tolist()
+	for i in found:
+		la.append(projangles[i] + [i])
 
-	return la, index
+	return la, found
 '''
 def cone_vectors( normvectors, phi, tht, ant ):
 	from utilities import getvec
@@ -4982,22 +5321,65 @@ from pickle import dumps,loads
 from zlib import compress,decompress
 from struct import pack,unpack
 
-def pack_message(data):
-	"""Convert data for transmission efficiently"""
+# mpi_send/mpi_bcast take an int count, so larger messages are sent in pieces of this many bytes
+MPI_MESSAGE_CHUNK = 1<<30
 
-	if isinstance(data,str):
-		if len(data)>256 : return "C"+compress(data,1)
+def pack_message(data):
+	"""Convert data for transmission efficiently.
+	NumPy arrays ("A") and EMData ("E") are sent as a small pickled header (dtype and shape, or the attribute
+	dictionary) followed by the raw contiguous data, padded so the data is aligned in the receive buffer.
+	Arrays of Python objects have no raw data to send, so they are pickled like any other object.
+	Strings and other objects are sent as is or pickled, and compressed if larger than
+	global_def.MPI_COMPRESS_THRESHOLD (which is off by default)."""
+	import global_def
+	from numpy import ndarray, ascontiguousarray
+
+	threshold = global_def.MPI_COMPRESS_THRESHOLD
+
+	if isinstance(data, ndarray) and not data.dtype.hasobject:
+		data = ascontiguousarray(data)
+		hdr = dumps((data.dtype.str, data.shape), -1)
+		return typed_message("A", hdr, data)
+	elif isinstance(data, EMData):
+		from EMAN2 import EMNumPy
+		attrs = data.get_attr_dict()
+		for q in ["nx", "ny", "nz"]:  attrs.pop(q, None)
+		hdr = dumps((data.get_xsize(), data.get_ysize(), data.get_zsize(), attrs), -1)
+		return typed_message("E", hdr, EMNumPy.em2numpy(data))
+	elif isinstance(data,str):
+		if threshold>=0 and len(data)>threshold : return "C"+compress(data,1)
 		else : return "S"+data
 	else :
 		d2x=dumps(data,-1)
-		if len(d2x)>256 : return "Z"+compress(d2x,1)
+		if threshold>=0 and len(d2x)>threshold : return "Z"+compress(d2x,1)
 		else : return "O"+d2x
 
+def typed_message(code, hdr, array):
+	"""code + header length + header + padding + raw array data, with the data starting on a 16 byte boundary"""
+	pad = -(5+len(hdr))%16
+	return code + pack("I", len(hdr)+pad) + hdr + b"\0"*pad + array.tobytes()
 
 def unpack_message(msg):
 	"""Unpack a data payload prepared by pack_message"""
 
-	if msg[0]=="C" : return decompress((msg[1:]).tostring())
+	if msg[0]=="A" or msg[0]=="E":
+		from numpy import frombuffer, dtype
+		# Data is not copied out of the receive buffer for arrays, and only once (into the image) for EMData
+		n = unpack("I", (msg[1:5]).tobytes())[0]
+		hdr = loads((msg[5:5+n]).tobytes())
+		if msg[0]=="A":
+			dt = dtype(hdr[0])
+			count = 1
+			for i in hdr[1]:  count *= i
+			return frombuffer(msg, dtype = dt, count = count, offset = 5+n).reshape(hdr[1])
+		from EMAN2 import EMNumPy
+		nx, ny, nz, attrs = hdr
+		img = EMData(nx, ny, nz)
+		EMNumPy.em2numpy(img).reshape(-1)[:] = frombuffer(msg, dtype = "f4", count = nx*ny*nz, offset = 5+n)
+		img.set_attr_dict(attrs)
+		img.update()
+		return img
+	elif msg[0]=="C" : return decompress((msg[1:]).tostring())
 	elif msg[0]=="S" : return (msg[1:]).tostring()
 	elif msg[0]=="Z" : return loads(decompress((msg[1:]).tostring()))
 	elif msg[0]=="O" : return loads((msg[1:]).tostring())
@@ -5029,7 +5411,14 @@ def wrap_mpi_send(data, destination, communicator = None):
 	tag = update_tag(communicator, destination)
 	#from mpi import mpi_comm_rank
 	#print communicator, mpi_comm_rank(communicator), "send to", destination, tag
-	mpi_send(msg, len(msg), MPI_CHAR, destination, tag, communicator) # int MPI_Send( void *buf, int count, MPI_Datatype datatype, int dest, int tag, MPI_Comm comm )
+	if len(msg) > MPI_MESSAGE_CHUNK:
+		#  Too large for one message, announce the length and send it in pieces
+		mpi_send("K"+pack("Q",len(msg)), 9, MPI_CHAR, destination, tag, communicator)
+		for i in range(0, len(msg), MPI_MESSAGE_CHUNK):
+			piece = msg[i:i+MPI_MESSAGE_CHUNK]
+			mpi_send(piece, len(piece), MPI_CHAR, destination, tag, communicator)
+	else:
+		mpi_send(msg, len(msg), MPI_CHAR, destination, tag, communicator) # int MPI_Send( void *buf, int count, MPI_Datatype datatype, int dest, int tag, MPI_Comm comm )
 
 
 def wrap_mpi_recv(source, communicator = None):
@@ -5044,6 +5433,10 @@ def wrap_mpi_recv(source, communicator = None):
 	mpi_probe(source, tag, communicator)
 	n = mpi_get_count(MPI_CHAR)
 	msg = mpi_recv(n, MPI_CHAR, source, tag, communicator)
+	if msg[0]=="K":
+		from numpy import concatenate
+		n = unpack("Q", (msg[1:9]).tobytes())[0]
+		msg = concatenate([mpi_recv(min(MPI_MESSAGE_CHUNK, n-i), MPI_CHAR, source, tag, communicator) for i in range(0, n, MPI_MESSAGE_CHUNK)])
 	return unpack_message(msg)
 
 
@@ -5057,20 +5450,31 @@ def wrap_mpi_bcast(data, root, communicator = None):
 
 	if rank == root:
 		msg = pack_message(data)
-		n = pack("I",len(msg))
+		n = pack("Q",len(msg))
 	else:
 		msg = None
 		n = None
 
-	n = mpi_bcast(n, 4, MPI_CHAR, root, communicator)  # int MPI_Bcast ( void *buffer, int count, MPI_Datatype datatype, int root, MPI_Comm comm )
-	n=unpack("I",n)[0]
-	msg = mpi_bcast(msg, n, MPI_CHAR, root, communicator)  # int MPI_Bcast ( void *buffer, int count, MPI_Datatype datatype, int root, MPI_Comm comm )
+	n = mpi_bcast(n, 8, MPI_CHAR, root, communicator)  # int MPI_Bcast ( void *buffer, int count, MPI_Datatype datatype, int root, MPI_Comm comm )
+	n=unpack("Q",n)[0]
+	if n > MPI_MESSAGE_CHUNK:
+		from numpy import concatenate
+		pieces = []
+		for i in range(0, n, MPI_MESSAGE_CHUNK):
+			m = min(MPI_MESSAGE_CHUNK, n-i)
+			if rank == root:  piece = msg[i:i+m]
+			else:             piece = None
+			pieces.append(mpi_bcast(piece, m, MPI_CHAR, root, communicator))
+		msg = concatenate(pieces)
+	else:
+		msg = mpi_bcast(msg, n, MPI_CHAR, root, communicator)  # int MPI_Bcast ( void *buffer, int count, MPI_Datatype datatype, int root, MPI_Comm comm )
 	return unpack_message(msg)
 
 
-# data must be a python list (numpy array also should be implemented)
+# data must be a python list or a numpy array (concatenated along the first axis)
 def wrap_mpi_gatherv(data, root, communicator = None):
 	from mpi import mpi_comm_rank, mpi_comm_size, MPI_COMM_WORLD
+	from numpy import ndarray, concatenate, atleast_1d
 
 	if communicator == None:
 		communicator = MPI_COMM_WORLD
@@ -5088,6 +5492,9 @@ def wrap_mpi_gatherv(data, root, communicator = None):
 				else:
 					recv_data = wrap_mpi_recv(p, communicator)
 					out_array.extend(recv_data)
+		elif isinstance(data, ndarray):
+			#  a 0-d array is gathered as one element
+			out_array = concatenate([atleast_1d(data if p == rank else wrap_mpi_recv(p, communicator)) for p in range(procs)])
 		else:
 			raise Exception("wrap_mpi_gatherv: type of data not supported")
 	else:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+from __future__ import print_function
+#
+# Copyright (c) 2000-2006 The University of Texas - Houston Medical School
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 USA
+#
+#
+
+# mpi_message_speedtest.py
+# Measures the bandwidth of wrap_mpi_bcast and wrap_mpi_gatherv against payload size, for NumPy arrays (raw typed
+# messages), the same data as a python list (pickled), and the list with compression turned on.
+#
+# mpirun -np 16 python mpi_message_speedtest.py [max payload in MB, default 256] [repeats, default 5]
+
+from builtins import range
+from EMAN2 import *
+from sparx import *
+from mpi import mpi_init, mpi_comm_rank, mpi_comm_size, mpi_barrier, mpi_finalize, MPI_COMM_WORLD
+import global_def
+import numpy as np
+import sys
+import time
+
+def timeit(fn, repeats):
+	mpi_barrier(MPI_COMM_WORLD)
+	t0 = time.time()
+	for i in range(repeats):  fn()
+	mpi_barrier(MPI_COMM_WORLD)
+	return (time.time()-t0)/repeats
+
+def main():
+	mpi_init(0, [])
+	myid  = mpi_comm_rank(MPI_COMM_WORLD)
+	nproc = mpi_comm_size(MPI_COMM_WORLD)
+	maxmb   = float(sys.argv[1]) if len(sys.argv) > 1 else 256.0
+	repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+	if myid == 0:
+		print("%d processes, times are per call, bandwidth is payload size/time"%nproc)
+		print("%10s %10s %-12s %10s %10s"%("op", "size (MB)", "payload", "time (s)", "MB/s"))
+
+	size = 1024
+	while size <= maxmb*1.0e6:
+		array = np.random.rand(size//4).astype("f4")
+		# the pickled list is several times larger and slow to build, so it is only tested up to 64 MB
+		if size <= 64.0e6:  payloads = ("numpy", "list", "list+zlib")
+		else:               payloads = ("numpy",)
+		for payload in payloads:
+			if payload == "numpy":  data = array
+			else:                   data = array.tolist()
+			if payload == "list+zlib":  global_def.MPI_COMPRESS_THRESHOLD = 256
+			else:                       global_def.MPI_COMPRESS_THRESHOLD = -1
+
+			# each process contributes size/nproc to the gather, so both operations move the same total
+			part = data[myid*len(data)//nproc:(myid+1)*len(data)//nproc]
+			tb = timeit(lambda:wrap_mpi_bcast(data, 0, MPI_COMM_WORLD), repeats)
+			tg = timeit(lambda:wrap_mpi_gatherv(part, 0, MPI_COMM_WORLD), repeats)
+			if myid == 0:
+				print("%10s %10.3f %-12s %10.4f %10.1f"%("bcast", size/1.0e6, payload, tb, size/1.0e6/tb))
+				print("%10s %10.3f %-12s %10.4f %10.1f"%("gatherv", size/1.0e6, payload, tg, size/1.0e6/tg))
+				sys.stdout.flush()
+		size *= 4
+
+	mpi_finalize()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+from __future__ import print_function
+#
+# Copyright (c) 2000-2006 The University of Texas - Houston Medical School
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 USA
+#
+#
+
+# symclass_speedtest.py
+# Compares the per-angle symclass methods with their batch (NumPy) versions for c1, d7 and icos symmetry, on a set
+# of random orientations, and checks that both give the same answer.
+#
+# python symclass_speedtest.py [number of orientations, default 20000] [symmetries, default c1,d7,icos]
+
+from builtins import range
+from EMAN2 import *
+from sparx import *
+from fundamentals import symclass
+import numpy as np
+import sys
+import time
+
+def timeit(fn):
+	t0 = time.time()
+	ret = fn()
+	return time.time()-t0, ret
+
+def maxdiff(a, b):
+	d = np.abs(np.array(a, dtype=np.float64).reshape(b.shape) - b)
+	return np.minimum(d, 360.0-d).max()
+
+def main():
+	n    = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	syms = sys.argv[2].split(",") if len(sys.argv) > 2 else ["c1","d7","icos"]
+	angles = np.random.RandomState(0).uniform(0.0, 1.0, (n,3))*[360.0, 180.0, 360.0]
+	alist  = angles.tolist()
+
+	print("%6s %20s %12s %12s %10s %12s"%("sym","method","scalar (s)","batch (s)","speedup","max diff"))
+	for sym in syms:
+		sc = symclass(sym)
+		tests = [
+			("is_in_subunit",     lambda: [sc.is_in_subunit(q[0], q[1], 1) for q in alist],  lambda: sc.is_in_subunit_batch(angles, 1)),
+			("symmetry_related",  lambda: [sc.symmetry_related(q) for q in alist],           lambda: sc.symmetry_related_batch(angles)),
+			("symmetry_neighbors",lambda: sc.symmetry_neighbors(alist),                      lambda: sc.symmetry_neighbors_batch(angles)),
+			("reduce_anglesets",  lambda: sc.reduce_anglesets(alist, 1),                     lambda: sc.reduce_anglesets_batch(angles, 1)),
+			("reduce_anglesets 0",lambda: sc.reduce_anglesets(alist, 0),                     lambda: sc.reduce_anglesets_batch(angles, 0)),
+			("even_angles 1.0",   lambda: sc.even_angles(1.0),                               lambda: sc.even_angles_batch(1.0)) ]
+		for name, scalar, batch in tests:
+			ts, rs = timeit(scalar)
+			tb, rb = timeit(batch)
+			if rb.dtype == bool:  err = np.count_nonzero(np.array(rs) != rb)
+			else:                 err = maxdiff(rs, rb)
+			print("%6s %20s %12.4f %12.4f %10.1f %12.3g"%(sym, name, ts, tb, ts/max(tb,1.0e-9), err))
+			sys.stdout.flush()
+
+if __name__ == "__main__":
+	main()
@@ -319,6 +319,112 @@ class TestCorrelationFunctions(unittest.TestCase):
 									, cnv(A,B,True ), cnvn(A,B,True ), cnvp(A,B,True ), cnvnp(A,B,True ), cnvpl(A,B,True ), cnvnpl(A,B,True ) )
 '''
 
+# ====================================================================================================================
+class TestSymclassBatch(unittest.TestCase):
+	"""this is unit test for the batch methods of symclass(...) from fundamentals.py"""
+
+	symmetries = ["c1", "c2", "c5", "d1", "d2", "d4", "d7", "oct", "tet", "icos"]
+
+	def internal_random_angles(self, n):
+		import numpy as np
+		rng = np.random.RandomState(12345)
+		return rng.uniform(0.0, 1.0, (n,3))*[360.0, 180.0, 360.0]
+
+	def internal_grid_angles(self):
+		#  grid including the poles, many of its directions are on the borders of the subunits
+		import numpy as np
+		return np.array([[phi, theta, psi] for phi in np.arange(0.0, 360.0, 7.5) for theta in np.arange(0.0, 180.1, 7.5) for psi in [0.0, 90.0]])
+
+	def internal_edge_angles(self, sc):
+		#  grid, and directions on the borders of the subunit and of its symmetry related copies
+		import numpy as np
+		border = []
+		for inc_mirror in [0,1]:
+			br = sc.brackets[inc_mirror]
+			for t in np.linspace(0.0, 1.0, 9):
+				border += [[0.0, t*br[1], 30.0], [br[0], t*br[1], 30.0], [t*br[0], br[-1], 30.0]]
+				if( sc.sym[0] in ["o","t","i"] ):
+					border.append([t*br[0], sc._baldwin_bounds_batch(np.array([t*br[0]]), inc_mirror)[0][0], 30.0])
+		border = np.array(border, dtype=np.float64)
+		return np.vstack([self.internal_grid_angles(), border, sc.symmetry_related_batch(border).reshape(-1,3)])
+
+	def internal_check_symmetry_related(self, sc, angles, reduced, tolerance = 1.0e-6):
+		#  compare rotation matrices, as angles are ambiguous at the poles
+		import numpy as np
+		from fundamentals import rotmatrix_batch
+		related = sc.symmetry_related_batch(angles)
+		if( sc.sym[0] == "t" ):
+			#  reduce_anglesets falls back to the mirror direction when no symmetry matrix maps it into the tet subunit
+			mirror = np.column_stack([(180.0+angles[:,0])%360.0, 180.0-angles[:,1], (180.0-angles[:,2])%360.0])
+			related = np.concatenate([related, sc.symmetry_related_batch(mirror)], axis=1)
+		related = rotmatrix_batch(related.reshape(-1,3)).reshape(len(angles),-1,3,3)
+		diff = np.abs(related - rotmatrix_batch(reduced)[:,None]).max(axis=(2,3)).min(axis=1)
+		self.assertTrue( diff.max() < tolerance, "max difference %g"%diff.max() )
+
+	def internal_check_angles(self, scalar, batch, tolerance = 1.0e-6):
+		import numpy as np
+		scalar = np.array(scalar, dtype=np.float64).reshape(batch.shape)
+		diff = np.abs(scalar - batch)
+		diff = np.minimum(diff, 360.0 - diff)  # 0 and 360 are the same angle
+		self.assertTrue( diff.max() < tolerance, "max difference %g"%diff.max() )
+
+	def test_is_in_subunit(self):
+		import numpy as np
+		from fundamentals import symclass
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			angles = np.vstack([self.internal_random_angles(2000), self.internal_grid_angles()])
+			for inc_mirror in [0,1]:
+				batch = sc.is_in_subunit_batch(angles, inc_mirror)
+				for i in range(len(angles)):
+					self.assertEqual( sc.is_in_subunit(angles[i][0], angles[i][1], inc_mirror), batch[i] )
+
+	def test_reduce_anglesets_edges(self):
+		from fundamentals import symclass
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			angles = self.internal_edge_angles(sc)
+			for inc_mirror in [0,1]:
+				batch = sc.reduce_anglesets_batch(angles, inc_mirror)
+				#  the same representative as reduce_anglesets, also on the borders of the subunit
+				self.internal_check_angles(sc.reduce_anglesets(angles.tolist(), inc_mirror), batch)
+				if( inc_mirror == 1 ):  self.internal_check_symmetry_related(sc, angles, batch)
+
+	def test_symmetry_related(self):
+		from fundamentals import symclass
+		angles = self.internal_random_angles(200)
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			batch = sc.symmetry_related_batch(angles)
+			self.internal_check_angles([sc.symmetry_related(q) for q in angles.tolist()], batch)
+
+	def test_symmetry_neighbors(self):
+		from fundamentals import symclass
+		angles = self.internal_random_angles(200)
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			batch = sc.symmetry_neighbors_batch(angles)
+			self.internal_check_angles(sc.symmetry_neighbors(angles.tolist()), batch)
+
+	def test_reduce_anglesets(self):
+		from fundamentals import symclass
+		angles = self.internal_random_angles(2000)
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			for inc_mirror in [0,1]:
+				batch = sc.reduce_anglesets_batch(angles, inc_mirror)
+				self.internal_check_angles(sc.reduce_anglesets(angles.tolist(), inc_mirror), batch)
+				if( inc_mirror == 1 ):  self.internal_check_symmetry_related(sc, angles, batch)
+
+	def test_even_angles(self):
+		from fundamentals import symclass
+		for sym in self.symmetries:
+			sc = symclass(sym)
+			for inc_mirror in [0,1]:
+				for args in [{"delta":3.0}, {"delta":5.0, "method":"P"}, {"delta":4.0, "theta2":180.0, "phiEqpsi":"Minus"}]:
+					batch = sc.even_angles_batch(inc_mirror = inc_mirror, **args)
+					self.internal_check_angles(sc.even_angles(inc_mirror = inc_mirror, **args), batch)
+
 def test_main():
 	from EMAN2 import Log
 	p = OptionParser()
@@ -328,7 +434,9 @@ def test_main():
 	if opt.t:
 		IS_TEST_EXCEPTION = True
 	Log.logger().set_level(-1)  #perfect solution for quenching the Log error information, thank Liwei
-	suite = unittest.TestLoader().loadTestsFromTestCase(TestCorrelationFunctions)
+	suite = unittest.TestSuite()
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCorrelationFunctions))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSymclassBatch))
 	unittest.TextTestRunner(verbosity=2).run(suite)
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+#
+# Copyright (c) 2000-2006 The University of Texas - Houston Medical School
+#
+# This software is issued under a joint BSD/GNU license. You may use the
+# source code in this file under either license. However, note that the
+# complete EMAN2 and SPARX software packages have some GPL dependencies,
+# so you are responsible for compliance with the licenses of these packages
+# if you opt to use BSD licensing. The warranty disclaimer below holds
+# in either instance.
+#
+# This complete copyright notice must be included in any revised version of the
+# source code. Additional authorship citations may be added, but existing
+# author citations must be preserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  2111-1307 USA
+#
+#
+
+from builtins import range
+import unittest
+from optparse import OptionParser
+
+IS_TEST_EXCEPTION = False
+
+# ====================================================================================================================
+class TestProjdirIndex(unittest.TestCase):
+	"""this is unit test for projdir_index(...) and the projection direction searches from utilities.py"""
+
+	def internal_random_angles(self, n, seed, theta = 180.0):
+		import numpy as np
+		rng = np.random.RandomState(seed)
+		return (rng.uniform(0.0, 1.0, (n,3))*[360.0, theta, 360.0]).tolist()
+
+	def internal_brute_nearestk(self, refs, dirs, howmany, absolute):
+		#  dirs is (M,S,3), the score of a reference is the largest dot product with any of the S copies
+		import numpy as np
+		result = []
+		for q in dirs:
+			s = q[None,:,0]*refs[:,None,0] + q[None,:,1]*refs[:,None,1] + q[None,:,2]*refs[:,None,2]
+			if absolute:  s = np.abs(s)
+			s = s.max(axis=1)
+			result.append(np.lexsort((np.arange(len(refs)), -s))[:howmany].tolist())
+		return result
+
+	def test_nearestk(self):
+		from utilities import projdir_index, angles_to_normals_f
+		for nref in [10, 500, 5000]:
+			refs = angles_to_normals_f(self.internal_random_angles(nref, nref))
+			dirs = angles_to_normals_f(self.internal_random_angles(600, 1, 360.0)).reshape(200,3,3)
+			index = projdir_index(refs)
+			for howmany in [1, 6]:
+				for absolute in [False, True]:
+					self.assertEqual( index.nearestk(dirs, howmany, absolute).tolist(), self.internal_brute_nearestk(refs, dirs, howmany, absolute) )
+
+	def test_assign_projangles(self):
+		from EMAN2 import Util
+		from utilities import assign_projangles, assign_projangles_f
+		refangles  = self.internal_random_angles(3000, 2)
+		projangles = self.internal_random_angles(5000, 3, 360.0)
+		proj_ang = [q[i] for q in projangles for i in range(2)]
+		ref_ang  = [q[i] for q in refangles for i in range(2)]
+		self.assertEqual( assign_projangles(projangles, refangles, True), list(Util.assign_projangles(proj_ang, ref_ang)) )
+		self.assertEqual( assign_projangles_f(projangles, refangles, True), list(Util.assign_projangles_f(projangles, refangles)) )
+
+	def test_cone_ang(self):
+		from math import cos, radians
+		from utilities import cone_ang, cone_ang_with_index, cone_ang_index, getvec, getfvec
+		projangles = self.internal_random_angles(3000, 4)
+		index = cone_ang_index(projangles)
+		for phi, tht in [[0.0, 0.0], [30.0, 45.0], [200.0, 95.0]]:
+			for ant in [2.0, 20.0, 90.0]:
+				cone = cos(radians(ant))
+				vec = getfvec(phi, tht)
+				expected = [q for q in projangles if sum([a*b for a,b in zip(getvec(q[0], q[1]), vec)]) >= cone]
+				self.assertEqual( cone_ang(projangles, phi, tht, ant), expected )
+				expected = [i for i in range(len(projangles)) if abs(sum([a*b for a,b in zip(getfvec(projangles[i][0], projangles[i][1]), vec)])) >= cone]
+				self.assertEqual( cone_ang_with_index(projangles, phi, tht, ant)[1], expected )
+				self.assertEqual( cone_ang_with_index(projangles, phi, tht, ant, index = index)[1], expected )
+
+def test_main():
+	from EMAN2 import Log
+	p = OptionParser()
+	p.add_option('--t', action='store_true', help='test exception', default=False )
+	global IS_TEST_EXCEPTION
+	opt, args = p.parse_args()
+	if opt.t:
+		IS_TEST_EXCEPTION = True
+	Log.logger().set_level(-1)  #perfect solution for quenching the Log error information, thank Liwei
+	suite = unittest.TestSuite()
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestProjdirIndex))
+	unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == '__main__':
+	test_main()